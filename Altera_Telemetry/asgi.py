@@ -2,6 +2,8 @@
 ASGI config for Altera_Telemetry project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The read APIs are served by async views here (ASYNC_READ_VIEWS), run it with
+e.g. ``uvicorn Altera_Telemetry.asgi:application --workers 4``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +14,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Altera_Telemetry.settings')
+os.environ.setdefault('ASYNC_READ_VIEWS', 'true')
 
 application = get_asgi_application()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from os  import getenv
+from tempfile import gettempdir
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -51,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -64,6 +66,7 @@ MIDDLEWARE = [
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
 ]
+CORS_EXPOSE_HEADERS = ["X-Partial-Results", "Server-Timing"]
 
 LOGIN_URL = '/oidc/login/'
 LOGIN_REDIRECT_URL = "overall/"
@@ -113,6 +116,83 @@ DATABASES = {
 }
 
 
+# Serve the read APIs from async views; asgi.py turns this on
+ASYNC_READ_VIEWS = getenv("ASYNC_READ_VIEWS", "false").lower() == "true"
+
+# Request metrics (core.middleware.RequestMetricsMiddleware)
+# Requests slower than this are logged with their top SQL statements
+REQUEST_SLOW_MS = int(getenv("REQUEST_SLOW_MS", "1000"))
+# ... and so are requests running one statement this many times (N+1)
+REQUEST_REPEATED_QUERY_LIMIT = 20
+REQUEST_TOP_QUERIES = 5
+
+# Coverage hit counts
+# "rollup" reads the pre-aggregated EventHitRollup table, "scan" groups the tool tables directly
+COVERAGE_HIT_SOURCE = getenv("COVERAGE_HIT_SOURCE", "rollup")
+# Fold new telemetry rows into the rollup before reading it
+COVERAGE_ROLLUP_REFRESH_ON_READ = True
+
+# Tool tables
+# Pick up tool-shaped tables from the database catalog without a code change
+TELEMETRY_DISCOVER_TOOL_TABLES = getenv("TELEMETRY_DISCOVER_TOOL_TABLES", "true").lower() == "true"
+# Seconds before the tool registry re-reads the catalog (0 = only on reload())
+TELEMETRY_TOOL_REGISTRY_TTL = int(getenv("TELEMETRY_TOOL_REGISTRY_TTL", "300"))
+# Seconds tool row ids missing under a derived table's watermark are looked
+# for again at least (project.watermarks); their writer may not show as open yet
+TELEMETRY_WATERMARK_GRACE_S = int(getenv("TELEMETRY_WATERMARK_GRACE_S", "60"))
+# Per-tool queries run concurrently, each worker thread holds one database connection
+TOOL_FANOUT_MAX_WORKERS = int(getenv("TOOL_FANOUT_MAX_WORKERS", "4"))
+# Seconds one tool may take before its results are left out and the response is flagged partial
+TOOL_FANOUT_TIMEOUT = float(getenv("TOOL_FANOUT_TIMEOUT", "10"))
+# Fold new telemetry rows into the project catalog (project.catalog) before reading it
+PROJECT_CATALOG_REFRESH_ON_READ = True
+
+# Bulk uploads (coverage.jobs)
+# Uploads are spooled here and processed by a background job; with several
+# hosts this has to be a directory they share
+UPLOAD_SPOOL_DIR = getenv("UPLOAD_SPOOL_DIR", str(Path(gettempdir()) / "altera_telemetry_uploads"))
+# "thread": a pool in the web process runs them, "queue": run_upload_jobs
+# workers do, "inline": the upload request itself does (and answers when done)
+UPLOAD_JOB_RUNNER = getenv("UPLOAD_JOB_RUNNER", "thread")
+UPLOAD_JOB_WORKERS = int(getenv("UPLOAD_JOB_WORKERS", "2"))
+# Seconds without progress after which a running job's worker is taken for dead
+UPLOAD_JOB_STALE_AFTER = int(getenv("UPLOAD_JOB_STALE_AFTER", "600"))
+# Set on databases holding only synthetic data: generate_synthetic_data (and
+# benchmark_endpoints --generate) then replace their tables without asking
+TELEMETRY_BENCH_DATABASE = getenv("TELEMETRY_BENCH_DATABASE", "false").lower() == "true"
+# Worker processes parsing the sheets of a multi-sheet mapping workbook (1 = in the job's thread)
+MAPPING_IMPORT_PROCESSES = int(getenv("MAPPING_IMPORT_PROCESSES", "4"))
+
+# Response cache (core.versioning.data_etag)
+# Entries are keyed by the data version, writes never delete anything: stale
+# entries are just no longer asked for and age out (LRU / TTL).
+# RESPONSE_CACHE_URL=redis://... shares it between processes (run Redis with
+# maxmemory-policy allkeys-lru), otherwise every process has its own in memory.
+RESPONSE_CACHE_ENABLED = getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_ALIAS = "responses"
+RESPONSE_CACHE_URL = getenv("RESPONSE_CACHE_URL")
+RESPONSE_CACHE_TTL = int(getenv("RESPONSE_CACHE_TTL", "600"))
+# Larger responses (e.g. a whole project's coverage) are not cached
+RESPONSE_CACHE_MAX_BYTES = int(getenv("RESPONSE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    RESPONSE_CACHE_ALIAS: {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": RESPONSE_CACHE_URL,
+        "TIMEOUT": RESPONSE_CACHE_TTL,
+        "KEY_PREFIX": "altera",
+    } if RESPONSE_CACHE_URL else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "responses",
+        "TIMEOUT": RESPONSE_CACHE_TTL,
+        "OPTIONS": {"MAX_ENTRIES": int(getenv("RESPONSE_CACHE_MAX_ENTRIES", "500"))},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -17,9 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path ,include
 
+from core.views import MetricsView
+
 urlpatterns = [
     path('project/',include("project.urls")),
     path('admin/', admin.site.urls),
     path("overall/", include("core.urls")),
-    path("coverage/" ,include("coverage.urls"))
+    path("coverage/" ,include("coverage.urls")),
+    path("metrics", MetricsView.as_view(), name="metrics"),
 ]
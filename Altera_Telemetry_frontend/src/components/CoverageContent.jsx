@@ -1,5 +1,6 @@
 import React, { useEffect, useState } from "react";
 import axios from "axios";
+import { describeProgress, waitForJob } from "./uploadJob";
 
 export default function CoverageContent({ setActiveContent }) {
   const [coverages, setCoverages] = useState([]);
@@ -15,6 +16,7 @@ export default function CoverageContent({ setActiveContent }) {
   const [error, setError] = useState("");
   const [csvFile, setCsvFile] = useState(null);
   const [uploading, setUploading] = useState(false);
+  const [uploadJob, setUploadJob] = useState(null);
 
   const [filters, setFilters] = useState({
     event_id: [],
@@ -186,7 +188,16 @@ export default function CoverageContent({ setActiveContent }) {
         uploadData,
         { headers: { "Content-Type": "multipart/form-data" } }
       );
-      alert(response.data?.message || "CSV uploaded successfully!");
+      // The file is processed in the background, follow its job
+      const job = await waitForJob(response.data, setUploadJob);
+      if (job.status === "failed") {
+        alert(`Upload failed: ${job.error}`);
+        return;
+      }
+      const { inserted_ids, skipped_rows, error_rows } = job.result;
+      alert(
+        `CSV uploaded: ${inserted_ids.length} added, ${skipped_rows} skipped, ${error_rows} with errors.`
+      );
       setCsvFile(null);
       e.target.reset();
       fetchCoverages();
@@ -195,6 +206,7 @@ export default function CoverageContent({ setActiveContent }) {
       alert("Upload failed. Please check your CSV.");
     } finally {
       setUploading(false);
+      setUploadJob(null);
     }
   };
 
@@ -305,7 +317,7 @@ export default function CoverageContent({ setActiveContent }) {
               uploading ? "bg-gray-400" : "bg-purple-600"
             }`}
           >
-            {uploading ? "Uploading..." : "Upload CSV"}
+            {uploading ? describeProgress(uploadJob) : "Upload CSV"}
           </button>
         </form>
       </div>
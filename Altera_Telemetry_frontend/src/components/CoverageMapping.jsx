@@ -1,5 +1,6 @@
 import React, { useEffect, useState } from "react";
 import axios from "axios";
+import { waitForJob } from "./uploadJob";
 
 export default function CoverageMapping() {
   const [mappings, setMappings] = useState([]);
@@ -77,7 +78,13 @@ export default function CoverageMapping() {
       const res = await axios.post(UPLOAD_API, formData, {
         headers: { "Content-Type": "multipart/form-data" },
       });
-      alert(res.data?.message || "File uploaded successfully!");
+      const job = await waitForJob(res.data);
+      if (job.status === "failed") {
+        alert(`Upload failed: ${job.error}`);
+        return;
+      }
+      const { created, updated, unchanged } = job.result;
+      alert(`File uploaded: ${created} created, ${updated} updated, ${unchanged} unchanged.`);
       setFile(null);
       setSheetName("");
       // Refresh mapping table after upload
@@ -14,12 +14,21 @@ export default function Indicators() {
 
   const API_BASE = "http://127.0.0.1:8000";
 
+  // One request for the IP list, the indicators of the given IPs and the
+  // pie data of the given events; an empty list asks for none of them
+  const fetchDashboard = async ({ ips = [], events = [] } = {}) => {
+    const res = await axios.get(`${API_BASE}/coverage/dashboard/`, {
+      params: { ips: ips.join(","), events: events.join(",") },
+    });
+    return res.data;
+  };
+
   // Fetch unique IPs for dropdown
   useEffect(() => {
     const fetchIps = async () => {
       try {
-        const res = await axios.get(`${API_BASE}/coverage/unique-ip/`);
-        setIps(res.data.ip);
+        const dashboard = await fetchDashboard();
+        setIps(dashboard.ip);
       } catch (err) {
         console.error("Failed to fetch IPs:", err);
       }
@@ -32,8 +41,9 @@ export default function Indicators() {
     if (!ip) return;
     setLoadingDropdown(true);
     try {
-      const res = await axios.get(`${API_BASE}/coverage/indicator/`, { params: { ip } });
-      setCoverageData(res.data);
+      const dashboard = await fetchDashboard({ ips: [ip] });
+      setIps(dashboard.ip);
+      setCoverageData(dashboard.indicators[ip] || []);
     } catch (err) {
       console.error("Failed to fetch coverage data:", err);
     } finally {
@@ -57,9 +67,9 @@ export default function Indicators() {
 
   setLoadingSearch(true);
   try {
-    const res = await axios.get(`${API_BASE}/coverage/coverage-event/`);
-    const eventData = res.data.find(
-      (e) => e.event_id.toLowerCase() === searchEvent.toLowerCase()
+    const dashboard = await fetchDashboard({ events: [searchEvent.trim()] });
+    const eventData = dashboard.events.find(
+      (e) => e.event_id.toLowerCase() === searchEvent.trim().toLowerCase()
     );
 
     if (eventData) {
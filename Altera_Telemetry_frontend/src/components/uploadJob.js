@@ -0,0 +1,48 @@
+import axios from "axios";
+
+const POLL_INTERVAL_MS = 1000;
+// Stop waiting for a job whose status and progress stay the same this long
+// (the server requeues a job whose worker died after UPLOAD_JOB_STALE_AFTER)
+const STALL_TIMEOUT_MS = 15 * 60 * 1000;
+
+function snapshot(job) {
+  const { processed, rows } = job.progress || {};
+  return `${job.status}:${processed}:${rows}`;
+}
+
+// Bulk uploads answer 202 with a job; polls its status_url until the job
+// has succeeded or failed. onProgress gets every status along the way.
+// A job that stops moving for STALL_TIMEOUT_MS comes back as failed.
+export async function waitForJob(job, onProgress = () => {}) {
+  let current = job;
+  let last = snapshot(current);
+  let changedAt = Date.now();
+  onProgress(current);
+  while (current.status === "queued" || current.status === "running") {
+    if (Date.now() - changedAt > STALL_TIMEOUT_MS) {
+      return {
+        ...current,
+        status: "failed",
+        error: `The upload stopped making progress, its status is still at ${current.status_url}`,
+      };
+    }
+    await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+    const res = await axios.get(current.status_url);
+    current = res.data;
+    onProgress(current);
+    if (snapshot(current) !== last) {
+      last = snapshot(current);
+      changedAt = Date.now();
+    }
+  }
+  return current;
+}
+
+export function describeProgress(job) {
+  if (!job || job.status === "queued") return "Queued...";
+  const { percent, rows, rows_per_sec } = job.progress;
+  const parts = [percent != null ? `${Math.floor(percent)}%` : `${rows} rows`];
+  if (rows_per_sec) parts.push(`${rows_per_sec} rows/s`);
+  if (job.error_rows) parts.push(`${job.error_rows} bad rows`);
+  return `Uploading... ${parts.join(", ")}`;
+}
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    from .middleware import record_query
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Every connection, including the fan-out workers', reports to RequestMetricsMiddleware
+        connection_created.connect(install_query_recorder, dispatch_uid="install_query_recorder")
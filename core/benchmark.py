@@ -0,0 +1,219 @@
+import json
+import platform
+import resource
+import statistics
+import sys
+import time
+from datetime import timedelta
+from itertools import islice
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from .synthetic import START_TIME, STEPS_PER_TESTCASE, TESTCASE_INTERVAL_S, telemetry_rows
+
+BASELINE_DIR = Path(__file__).resolve().parent / "benchmarks"
+
+# A run fails when an endpoint gets slower / bigger than its baseline by more
+# than the tolerance AND the floor, so noise on fast endpoints doesn't count.
+# The tail is noisier than the median and gets more room. Query counts have no tolerance.
+P50_TOLERANCE, P50_FLOOR_MS = 0.30, 10
+P95_TOLERANCE, P95_FLOOR_MS = 0.60, 25
+RSS_TOLERANCE = 0.30
+RSS_FLOOR_MIB = 16
+
+MIB = 1024 * 1024
+
+
+def endpoints(scale, tool="nanoscope"):
+    """
+    name -> (url name, query params) of the read endpoints to measure,
+    filled with names the generator is known to produce.
+    """
+    project, stepping, ip = scale.project(0), scale.stepping(0), scale.ip(0)
+    coverage = {"tool": tool, "project": project, "stepping": stepping}
+    # The second quarter of the time the telemetry spans
+    span = timedelta(seconds=scale.rows // STEPS_PER_TESTCASE * TESTCASE_INTERVAL_S)
+    window = [(START_TIME + span * quarter / 4).isoformat() for quarter in (1, 2)]
+    return {
+        "tools": ("tools-list", {}),
+        "projects": ("projects-list", {"tool": tool}),
+        "steppings": ("steppings-list", {"tool": tool, "project": project}),
+        "summary": ("project-summary", {"tool": tool}),
+        "project-coverage": ("coverage-data", coverage),
+        "project-coverage-page": ("coverage-data", {**coverage, "page_size": 100}),
+        "unique-ip": ("unique-ip", {}),
+        "indicator": ("coverage-indicator", {"ip": ip}),
+        "indicator-filtered": ("coverage-indicator", {"ip": ip, "project": project, "stepping": stepping}),
+        "indicator-window": ("coverage-indicator", {"ip": ip, "since": window[0], "until": window[1]}),
+        "coverage-event": ("event-coverage", {}),
+        "coverage-list": ("coverage-list", {}),
+        "dashboard": ("coverage-dashboard", {"ips": ip, "events": scale.event_id(0)}),
+        "trends": ("coverage-trends", {"events": scale.event_id(0), "since": window[0], "until": window[1]}),
+    }
+
+
+def _status_kib(key):
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """
+    Lowers the peak RSS to the current RSS (Linux). Returns the current RSS in bytes.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+    current = _status_kib("VmRSS")
+    return current * 1024 if current is not None else peak_rss()
+
+
+def peak_rss():
+    peak = _status_kib("VmHWM")
+    if peak is not None:
+        return peak * 1024
+    # Without /proc the peak can't be reset, this is the peak of the whole process
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def measure(client, url, params, iterations, warmup=1):
+    """
+    Latency percentiles, SQL statements per request (fan-out workers included)
+    and peak RSS growth over iterations requests.
+    """
+    for _ in range(warmup):
+        client.get(url, params)
+
+    baseline_rss = reset_peak_rss()
+    latencies = []
+    queries = []
+    size = 0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = client.get(url, params)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} answered {response.status_code}: {body[:200]!r}")
+        queries.append(response.wsgi_request.request_stats.queries)
+        size = len(body)
+        del body, response
+
+    return {
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+        "queries": max(queries),
+        "peak_rss_growth_mib": round(max(0, peak_rss() - baseline_rss) / MIB, 2),
+        "response_bytes": size,
+    }
+
+
+def run(scale, names=None, iterations=20, tool="nanoscope", progress=None, cached=False):
+    """
+    Without cached the response cache is off, every request does the work.
+    """
+    client = Client()
+    results = {}
+    with override_settings(RESPONSE_CACHE_ENABLED=cached):
+        for name, (url_name, params) in endpoints(scale, tool).items():
+            if names and name not in names:
+                continue
+            results[name] = measure(client, reverse(url_name), params, iterations)
+            if progress:
+                progress(name, results[name])
+    return results
+
+
+def ingest(model, scale, rows, batch_size=None):
+    """
+    Throughput of the telemetry ingest (project.ingest: COPY, plus the parsed
+    timestamp trigger where it is installed) for the first rows rows of the
+    scale. They are written in a transaction that is rolled back, the table
+    is left as it was.
+    """
+    from project.ingest import TELEMETRY_BATCH_SIZE, ingest_records
+
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal)",
+            [connection.ops.quote_name(table)],
+        )
+        trigger = cursor.fetchone()[0]
+    records = enumerate(islice(telemetry_rows(scale), rows), start=1)
+    with transaction.atomic():
+        start = time.perf_counter()
+        accepted = sum(ack["accepted"] for ack in ingest_records(model, records, batch_size or TELEMETRY_BATCH_SIZE))
+        elapsed = time.perf_counter() - start
+        transaction.set_rollback(True)
+    return {
+        "rows": accepted,
+        "trigger": trigger,
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_sec": round(accepted / elapsed) if elapsed else accepted,
+    }
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "database": connection.vendor,
+    }
+
+
+def baseline_path(scale_name):
+    return BASELINE_DIR / f"{scale_name}.json"
+
+
+def load_baseline(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(path, scale, results):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"scale": scale.__dict__, "environment": environment(), "endpoints": results}, f, indent=2)
+        f.write("\n")
+
+
+def regressions(baseline, results):
+    """
+    Human readable regressions of results against baseline["endpoints"].
+    """
+    found = []
+    for name, result in results.items():
+        expected = baseline.get("endpoints", {}).get(name)
+        if expected is None:
+            continue
+        if result["queries"] > expected["queries"]:
+            found.append(f"{name}: {result['queries']} queries, baseline {expected['queries']}")
+        for key, tolerance, floor in (("p50_ms", P50_TOLERANCE, P50_FLOOR_MS), ("p95_ms", P95_TOLERANCE, P95_FLOOR_MS)):
+            value, base = result[key], expected[key]
+            if value > base * (1 + tolerance) and value - base > floor:
+                found.append(f"{name}: {key[:3]} {value:.1f} ms, baseline {base:.1f} ms")
+        rss, base_rss = result["peak_rss_growth_mib"], expected["peak_rss_growth_mib"]
+        if rss > base_rss * (1 + RSS_TOLERANCE) and rss - base_rss > RSS_FLOOR_MIB:
+            found.append(f"{name}: peak RSS +{rss:.1f} MiB, baseline +{base_rss:.1f} MiB")
+    return found
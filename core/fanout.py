@@ -0,0 +1,125 @@
+import contextvars
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections, transaction
+
+# PostgreSQL SQLSTATE for a statement cancelled by statement_timeout
+QUERY_CANCELED = "57014"
+
+_executor = None
+_executor_size = None
+_executor_lock = threading.Lock()
+
+
+def max_workers():
+    return max(1, int(getattr(settings, "TOOL_FANOUT_MAX_WORKERS", 4)))
+
+
+def tool_timeout():
+    timeout = getattr(settings, "TOOL_FANOUT_TIMEOUT", None)
+    return float(timeout) if timeout else None
+
+
+def runs_concurrently():
+    """
+    False with a single worker, or inside a transaction, where other
+    connections can't see its uncommitted rows.
+    """
+    return max_workers() > 1 and not connection.in_atomic_block
+
+
+def _get_executor():
+    global _executor, _executor_size
+    with _executor_lock:
+        if _executor_size != max_workers():
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor_size = max_workers()
+            _executor = ThreadPoolExecutor(max_workers=_executor_size, thread_name_prefix="tool-fanout")
+        return _executor
+
+
+def shutdown():
+    """
+    Closes the connection of every worker thread and stops the pool.
+    """
+    global _executor, _executor_size
+    with _executor_lock:
+        if _executor is not None:
+            # The barrier holds each task until all are running, so every thread closes its own
+            barrier = threading.Barrier(_executor_size)
+
+            def close():
+                barrier.wait(timeout=10)
+                connections.close_all()
+
+            for _ in range(_executor_size):
+                _executor.submit(close)
+            _executor.shutdown(wait=True)
+        _executor = _executor_size = None
+
+
+def _timed_out(exc):
+    cause = getattr(exc, "__cause__", None)
+    return getattr(cause, "pgcode", None) == QUERY_CANCELED
+
+
+def _run(fn, timeout):
+    """
+    Runs fn on a pool thread. Django connections are per thread, so every
+    worker keeps its own connection open between tasks and the pool doubles
+    as a connection pool bounded by TOOL_FANOUT_MAX_WORKERS.
+    """
+    try:
+        with transaction.atomic():
+            if timeout and connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    # Cancels the query in the database too, not just the wait for it
+                    cursor.execute("SET LOCAL statement_timeout = %s", [int(timeout * 1000)])
+            return fn()
+    except DatabaseError:
+        connection.close()
+        raise
+
+
+def fan_out(calls, timeout=None):
+    """
+    Runs {name: fn} concurrently, each on its own database connection.
+    Returns (results, timed_out): results has the return value of every call
+    that finished, timed_out the names of the calls that ran past the timeout.
+    Other exceptions are raised as usual.
+
+    Without runs_concurrently() the calls run one after another on the
+    caller's connection.
+    """
+    if not runs_concurrently():
+        return {name: fn() for name, fn in calls.items()}, []
+
+    executor = _get_executor()
+    # Each call runs in a copy of the caller's context (request metrics and the like)
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, _run, fn, timeout)
+        for name, fn in calls.items()
+    }
+
+    # Safety net for backends without statement_timeout: every call gets
+    # timeout seconds once it is off the queue
+    deadline = timeout * math.ceil(len(futures) / max_workers()) + 1 if timeout else None
+    wait(futures.values(), timeout=deadline)
+
+    results, timed_out = {}, []
+    for name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            timed_out.append(name)
+            continue
+        try:
+            results[name] = future.result()
+        except DatabaseError as exc:
+            if not _timed_out(exc):
+                raise
+            timed_out.append(name)
+    return results, timed_out
@@ -0,0 +1,97 @@
+import logging
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment
+
+from core import benchmark
+from core.synthetic import SCALES, Scale, generate
+from project.models import dynamic_models
+from .generate_synthetic_data import add_replace_arguments, confirm_replace
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure latency percentiles, SQL statements and peak RSS of the read endpoints on "
+        "synthetic data and compare them with the stored baseline. Exits non-zero on regression."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=SCALES, default="small",
+                            help="Data scale, also picks the baseline file (core/benchmarks/<scale>.json).")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--generate", action="store_true",
+                            help="(Re)generate the synthetic data first. Replaces the tables' rows.")
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--endpoint", action="append", dest="endpoints",
+                            help="Only this endpoint. Can be repeated.")
+        parser.add_argument("--baseline", help="Baseline file, instead of the one of the scale.")
+        parser.add_argument("--save-baseline", action="store_true",
+                            help="Write the results as the new baseline instead of comparing.")
+        parser.add_argument("--tool", required=True)
+        parser.add_argument("--cached", action="store_true",
+                            help="Leave the response cache on (repeated reads are hits). Baselines are uncached.")
+        parser.add_argument("--ingest", type=int, metavar="ROWS",
+                            help="Also time ingesting this many telemetry rows (rolled back afterwards).")
+        add_replace_arguments(parser)
+
+    def handle(self, *args, **options):
+        tool = options["tool"]
+        if options["cached"] and options["save_baseline"]:
+            raise CommandError("Baselines are measured without the response cache, drop --cached.")
+        if tool not in dynamic_models:
+            raise CommandError(f"Unknown tool {tool!r}")
+        scale = Scale.named(options["scale"], seed=options["seed"])
+        known = benchmark.endpoints(scale, tool)
+        unknown = [name for name in options["endpoints"] or [] if name not in known]
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(unknown)}. Known: {', '.join(known)}")
+
+        model = dynamic_models[tool]
+        if options["generate"]:
+            confirm_replace(model, options)
+            self.stdout.write(f"Generating {options['scale']} data...")
+            generate(model, scale)
+        elif model.objects.count() != scale.rows:
+            raise CommandError(
+                f"{tool} does not hold the {options['scale']} data set, run with --generate "
+                f"(or manage.py generate_synthetic_data --tool {tool} --scale {options['scale']})."
+            )
+
+        # The test client needs testserver in ALLOWED_HOSTS
+        setup_test_environment()
+        # Slow / repeated query logs would drown the table, the numbers are in it
+        logging.getLogger("core.requests").setLevel(logging.ERROR)
+
+        self.stdout.write(
+            f"{'endpoint':24} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'RSS MiB':>8} {'bytes':>11}"
+        )
+
+        def progress(name, result):
+            self.stdout.write(
+                f"{name:24} {result['p50_ms']:9.1f} {result['p95_ms']:9.1f} {result['p99_ms']:9.1f} "
+                f"{result['queries']:8} {result['peak_rss_growth_mib']:8.1f} {result['response_bytes']:11,}"
+            )
+
+        results = benchmark.run(scale, options["endpoints"], options["iterations"], tool, progress, options["cached"])
+        if options["ingest"]:
+            ingest = benchmark.ingest(model, scale, options["ingest"])
+            self.stdout.write(
+                f"ingest: {ingest['rows']:,} rows in {ingest['elapsed_s']:.2f}s, {ingest['rows_per_sec']:,} rows/s "
+                f"({'with' if ingest['trigger'] else 'without'} the parsed timestamp trigger)"
+            )
+
+        path = Path(options["baseline"]) if options["baseline"] else benchmark.baseline_path(options["scale"])
+        if options["save_baseline"]:
+            benchmark.save_baseline(path, scale, results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {path}"))
+            return
+
+        try:
+            baseline = benchmark.load_baseline(path)
+        except FileNotFoundError:
+            raise CommandError(f"No baseline at {path}, create one with --save-baseline.")
+        found = benchmark.regressions(baseline, results)
+        if found:
+            raise CommandError("Regressions against " + str(path) + ":\n  " + "\n  ".join(found))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {path}"))
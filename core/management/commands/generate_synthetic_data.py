@@ -0,0 +1,76 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.synthetic import SCALES, Scale, generate, populated_tables
+from project.models import dynamic_models
+
+
+def add_replace_arguments(parser):
+    parser.add_argument("--noinput", "--no-input", action="store_false", dest="interactive",
+                        help="Do not ask before replacing the tables' rows.")
+    parser.add_argument("--force", action="store_true",
+                        help="Replace tables that hold rows already.")
+
+
+def confirm_replace(model, options):
+    """
+    Raises CommandError unless replacing the tool table of model, Coverage,
+    CoverageMapping and the tables derived from them was asked for: --force
+    for tables that hold rows, and --noinput, TELEMETRY_BENCH_DATABASE or a
+    typed "yes" for the database.
+    """
+    populated = populated_tables(model)
+    if populated and not options["force"]:
+        raise CommandError(f"{', '.join(populated)} already hold rows, pass --force to replace them.")
+    if options["interactive"] and not getattr(settings, "TELEMETRY_BENCH_DATABASE", False):
+        confirm = input(
+            f"This will TRUNCATE {model._meta.db_table}, Coverage, CoverageMapping and the tables derived "
+            f"from them in the database {connection.settings_dict['NAME']!r}.\n"
+            "Are you sure you want to do this?\n\n"
+            "    Type 'yes' to continue, or 'no' to cancel: "
+        )
+        if confirm != "yes":
+            raise CommandError("Cancelled, nothing was changed.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Replace the telemetry of a tool table, Coverage and CoverageMapping with deterministic "
+        "synthetic data (1e3 to 1e7 telemetry rows). Meant for benchmark databases."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=SCALES, default="small")
+        parser.add_argument("--rows", type=int, help="Telemetry rows, overrides the scale.")
+        parser.add_argument("--events", type=int, help="Distinct events, overrides the scale.")
+        parser.add_argument("--ips", type=int, help="Distinct IPs, overrides the scale.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--tool", required=True)
+        add_replace_arguments(parser)
+
+    def handle(self, *args, **options):
+        if options["tool"] not in dynamic_models:
+            raise CommandError(f"Unknown tool {options['tool']!r}")
+        model = dynamic_models[options["tool"]]
+        confirm_replace(model, options)
+
+        scale = Scale.named(options["scale"], seed=options["seed"])
+        overrides = {key: options[key] for key in ("rows", "events", "ips") if options[key]}
+        scale = Scale(**{**scale.__dict__, **overrides})
+
+        start = time.perf_counter()
+
+        def progress(written):
+            rate = written / (time.perf_counter() - start)
+            self.stdout.write(f"\r{written:,}/{scale.rows:,} rows ({rate:,.0f}/s)", ending="")
+            self.stdout.flush()
+
+        summary = generate(model, scale, progress=progress)
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['rows']:,} telemetry rows, {summary['coverage']:,} coverage rows, "
+            f"{summary['mappings']:,} mappings in {time.perf_counter() - start:.1f}s"
+        ))
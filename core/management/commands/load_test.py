@@ -0,0 +1,116 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def dashboard_paths(tool=None, project=None, stepping=None, ip=None):
+    """
+    The read requests the dashboard fires in parallel, with filter values
+    taken from the database when not given.
+    """
+    from coverage.models import CoverageMapping
+    from project.models import dynamic_models
+
+    tool = tool or next(iter(dynamic_models), "")
+    if tool in dynamic_models and not (project and stepping):
+        sample = dynamic_models[tool].objects.order_by("-id").values("project_name", "stepping").first() or {}
+        project = project or sample.get("project_name", "")
+        stepping = stepping or sample.get("stepping", "")
+    ip = ip or CoverageMapping.objects.values_list("ip", flat=True).first() or ""
+
+    return [
+        "/project/tools/",
+        "/project/projects/?" + urlencode({"tool": tool}),
+        "/project/steppings/?" + urlencode({"tool": tool, "project": project}),
+        "/project/coverage/?" + urlencode({"tool": tool, "project": project, "stepping": stepping, "page_size": 100}),
+        "/coverage/unique-ip/",
+        "/coverage/indicator/?" + urlencode({"ip": ip, "project": project, "stepping": stepping}),
+        "/coverage/coverage-event/?" + urlencode({"project": project, "stepping": stepping}),
+        "/coverage/dashboard/?" + urlencode({"ips": ip, "project": project, "stepping": stepping}),
+    ]
+
+
+def fetch(url, timeout):
+    start = time.perf_counter()
+    try:
+        with urlopen(url, timeout=timeout) as response:
+            response.read()
+            ok = response.status < 400
+    except (HTTPError, URLError, TimeoutError, ConnectionError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire the dashboard's read requests concurrently at one or more running servers "
+        "(e.g. gunicorn on the WSGI app and uvicorn on the ASGI app) and compare throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("servers", nargs="+", help="Base URLs, e.g. http://127.0.0.1:8000")
+        parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight at once.")
+        parser.add_argument("--requests", type=int, default=500, help="Requests per server.")
+        parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests first.")
+        parser.add_argument("--timeout", type=float, default=60)
+        parser.add_argument("--path", action="append", dest="paths",
+                            help="Request this path instead of the dashboard mix. Can be repeated.")
+        parser.add_argument("--tool")
+        parser.add_argument("--project")
+        parser.add_argument("--stepping")
+        parser.add_argument("--ip")
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["requests"] < 1:
+            raise CommandError("--concurrency and --requests must be positive.")
+        paths = options["paths"] or dashboard_paths(
+            options["tool"], options["project"], options["stepping"], options["ip"]
+        )
+
+        results = [self.run(server.rstrip("/"), paths, options) for server in options["servers"]]
+
+        self.stdout.write(
+            f"{'server':40} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'vs first':>9}"
+        )
+        for server, (rate, latencies, errors) in zip(options["servers"], results):
+            ratio = rate / results[0][0] if results[0][0] else 0
+            self.stdout.write(
+                f"{server:40} {rate:8.1f} {percentile(latencies, 50) * 1000:8.1f} "
+                f"{percentile(latencies, 95) * 1000:8.1f} {percentile(latencies, 99) * 1000:8.1f} "
+                f"{errors:7} {ratio:8.2f}x"
+            )
+
+    def run(self, server, paths, options):
+        """
+        Returns (requests per second, sorted latencies, error count) for one server.
+        """
+        timeout = options["timeout"]
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            warmup = islice(cycle(paths), options["warmup"])
+            list(pool.map(lambda path: fetch(server + path, timeout), warmup))
+
+            urls = [server + path for path in islice(cycle(paths), options["requests"])]
+            start = time.perf_counter()
+            timings = list(pool.map(lambda url: fetch(url, timeout), urls))
+            elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for latency, _ in timings)
+        errors = sum(1 for _, ok in timings if not ok)
+        self.stderr.write(
+            f"{server}: {len(timings)} requests in {elapsed:.2f}s, "
+            f"mean {statistics.fmean(latencies) * 1000:.1f} ms"
+        )
+        return len(timings) / elapsed, latencies, errors
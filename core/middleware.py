@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import REQUEST_DB_TIME, REQUEST_LATENCY, REQUEST_QUERIES, REQUESTS, RESPONSE_SIZE
+
+logger = logging.getLogger("core.requests")
+
+# Stats of the request being handled. sync_to_async and core.fanout carry the
+# context over to other threads, so their queries are counted too.
+current_request = ContextVar("current_request", default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_started = None
+        self.render_time = None
+        # sql -> [executions, seconds]; parameters are not part of the sql,
+        # so an N+1 shows up as one statement with many executions
+        self.statements = {}
+        self._lock = threading.Lock()
+
+    def add_query(self, sql, duration):
+        with self._lock:
+            self.queries += 1
+            self.db_time += duration
+            entry = self.statements.setdefault(sql, [0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+
+    def top_queries(self, limit):
+        """
+        [(sql, executions, seconds)] of the statements that took the most time.
+        """
+        with self._lock:
+            ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return [(sql, count, seconds) for sql, (count, seconds) in ranked[:limit]]
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Connection execute wrapper (installed in CoreConfig.ready) that adds every
+    statement to the current request's stats.
+    """
+    stats = current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - start)
+
+
+class RequestMetricsMiddleware:
+    """
+    Per request: SQL statement count, DB time, serialization (render) time and
+    response size. Sent back as a Server-Timing header, folded into the
+    per-endpoint histograms served at /metrics, and logged with the top
+    statements when the request is slower than REQUEST_SLOW_MS or repeats a
+    statement REQUEST_REPEATED_QUERY_LIMIT times.
+
+    Put it first in MIDDLEWARE so the timing covers the whole stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = request.request_stats = RequestStats()
+        token = current_request.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.finish(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = request.request_stats = RequestStats()
+        token = current_request.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.finish(request, response, stats)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that part
+        stats = getattr(request, "request_stats", None)
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+
+            def rendered(response):
+                stats.render_time = time.perf_counter() - stats.render_started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, stats):
+        total = time.perf_counter() - stats.started
+        match = getattr(request, "resolver_match", None)
+        endpoint = "/" + match.route if match is not None and match.route else "<unmatched>"
+        labels = (request.method, endpoint)
+        size = None if response.streaming else len(response.content)
+
+        timings = [f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"']
+        if stats.render_time is not None:
+            timings.append(f"serialize;dur={stats.render_time * 1000:.1f}")
+        timings.append(f"total;dur={total * 1000:.1f}")
+        response["Server-Timing"] = ", ".join(timings)
+
+        REQUESTS.inc(labels + (str(response.status_code),))
+        REQUEST_LATENCY.observe(total, labels)
+        REQUEST_DB_TIME.observe(stats.db_time, labels)
+        REQUEST_QUERIES.observe(stats.queries, labels)
+        if size is not None:
+            RESPONSE_SIZE.observe(size, labels)
+
+        top = stats.top_queries(getattr(settings, "REQUEST_TOP_QUERIES", 5))
+        slow = total * 1000 >= getattr(settings, "REQUEST_SLOW_MS", 1000)
+        repeated = top and max(count for _, count, _ in top) >= getattr(settings, "REQUEST_REPEATED_QUERY_LIMIT", 20)
+        if slow or repeated:
+            logger.warning(
+                "%s %s %s %s: %.0f ms total, %d queries in %.0f ms, serialize %s, %s bytes\n%s",
+                "Slow request" if slow else "Repeated queries in", request.method, request.get_full_path(),
+                response.status_code, total * 1000, stats.queries, stats.db_time * 1000,
+                f"{stats.render_time * 1000:.0f} ms" if stats.render_time is not None else "-",
+                size if size is not None else "streamed",
+                "\n".join(f"  {count}x {seconds * 1000:.1f} ms  {sql}" for sql, count, seconds in top),
+            )
@@ -2,3 +2,14 @@ from django.db import models
 
 # Create your models here.
 
+
+class ChangeCounter(models.Model):
+    """
+    Moves on with every write to the data of a scope (see core.versioning.bump),
+    so readers can tell whether anything changed without looking at the data.
+    """
+    scope = models.CharField(max_length=100, unique=True)
+    counter = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.scope}: {self.counter}"
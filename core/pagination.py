@@ -0,0 +1,47 @@
+import base64
+import binascii
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class OptInCursorPagination(CursorPagination):
+    """
+    Keyset pagination on id that only kicks in when the client asks for it
+    with ?page_size= or ?cursor=; otherwise the full list is returned as before.
+    """
+    ordering = "id"
+    page_size = 1000
+    page_size_query_param = "page_size"
+    max_page_size = 10000
+
+    def get_page_size(self, request):
+        if self.page_size_query_param not in request.query_params and self.cursor_query_param not in request.query_params:
+            return None
+        return super().get_page_size(request)
+
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(str(value).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    Opaque cursor -> last key of the previous page. Raises NotFound like DRF does.
+    """
+    try:
+        return base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    except (binascii.Error, UnicodeError, ValueError):
+        raise NotFound("Invalid cursor")
+
+
+def keyset_page_size(request, default=OptInCursorPagination.page_size, maximum=OptInCursorPagination.max_page_size):
+    """
+    Page size requested with ?page_size= / ?cursor=, or None when not paginating.
+    """
+    if "page_size" not in request.GET and "cursor" not in request.GET:
+        return None
+    try:
+        return max(1, min(int(request.GET.get("page_size", default)), maximum))
+    except ValueError:
+        return default
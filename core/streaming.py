@@ -0,0 +1,91 @@
+import json
+from collections.abc import Iterator
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+
+# bytes collected before a chunk is handed to the server
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _dumps(value):
+    # Same compact output as DRF's JSONRenderer
+    return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(",", ":"))
+
+
+def json_response(value, **kwargs):
+    """
+    JsonResponse with the same output as DRF, for the async views that don't go through DRF.
+    """
+    return JsonResponse(
+        value, safe=False, encoder=DjangoJSONEncoder,
+        json_dumps_params={"ensure_ascii": False, "separators": (",", ":")}, **kwargs
+    )
+
+
+def wants_stream(request):
+    return request.GET.get("stream", "").lower() in ("1", "true", "yes")
+
+
+def iter_json(value):
+    """
+    Yields the JSON text of value piece by piece.
+    Dicts are walked key by key and iterators (generators, querysets'
+    .iterator()) become arrays whose items are encoded one at a time,
+    so only one item is ever held in memory.
+    """
+    if isinstance(value, dict):
+        yield "{"
+        for i, (key, item) in enumerate(value.items()):
+            if i:
+                yield ","
+            yield _dumps(str(key)) + ":"
+            yield from iter_json(item)
+        yield "}"
+    elif isinstance(value, Iterator):
+        yield "["
+        for i, item in enumerate(value):
+            if i:
+                yield ","
+            yield _dumps(item)
+        yield "]"
+    else:
+        yield _dumps(value)
+
+
+def _chunked(pieces, size=STREAM_CHUNK_SIZE):
+    buffer = []
+    length = 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield "".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+async def aiterate(iterator):
+    """
+    Async iterator over a sync one. Each item is produced on the request's
+    database thread, so server-side cursors inside iterator keep working.
+    Under ASGI Django would otherwise read a sync iterator into a list first.
+    """
+    step = sync_to_async(next, thread_sensitive=True)
+    sentinel = object()
+    while (item := await step(iterator, sentinel)) is not sentinel:
+        yield item
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    """
+    JSON response written incrementally from iter_json(value).
+    Async views pass asynchronous=True.
+    """
+
+    def __init__(self, value, asynchronous=False, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        chunks = _chunked(iter_json(value))
+        super().__init__(aiterate(chunks) if asynchronous else chunks, **kwargs)
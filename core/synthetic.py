@@ -0,0 +1,232 @@
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.db import connection, transaction
+
+# (telemetry rows, events, ips, projects, steppings) per named scale
+SCALES = {
+    "tiny": (1_000, 100, 10, 2, 2),
+    "small": (10_000, 1_000, 50, 3, 3),
+    "medium": (100_000, 2_000, 200, 4, 3),
+    "large": (1_000_000, 5_000, 1_000, 5, 4),
+    "xlarge": (10_000_000, 10_000, 2_000, 8, 4),
+}
+
+GENERATE_BATCH_SIZE = 20_000
+STEPS_PER_TESTCASE = 5
+EVENTS_PER_MAPPING = 5
+START_TIME = datetime(2025, 1, 1)
+TESTCASE_INTERVAL_S = 30
+
+
+@dataclass(frozen=True)
+class Scale:
+    rows: int
+    events: int
+    ips: int
+    projects: int
+    steppings: int
+    seed: int = 1
+
+    @classmethod
+    def named(cls, name, seed=1):
+        return cls(*SCALES[name], seed=seed)
+
+    # Names are derived from the index so benchmarks can build requests without a lookup
+    @staticmethod
+    def event_id(i):
+        return f"EV-{i:05d}"
+
+    @staticmethod
+    def ip(i):
+        return f"IP-{i:04d}"
+
+    @staticmethod
+    def project(i):
+        return f"PROJ-{i:02d}"
+
+    @staticmethod
+    def stepping(i):
+        return f"{'ABCDEFGH'[i % 8]}{i // 8}"
+
+    def event_ip(self, event):
+        # Every event belongs to one ip, a tenth of them to a second one as well
+        return event % self.ips
+
+
+def reference_rows(scale):
+    """
+    (Coverage rows, CoverageMapping rows) for the scale.
+    """
+    rng = random.Random(scale.seed)
+    coverage = []
+    for event in range(scale.events):
+        ips = [scale.event_ip(event)]
+        if event % 10 == 0 and scale.ips > 1:
+            ips.append((ips[0] + 1) % scale.ips)
+        for ip in ips:
+            coverage.append({
+                "event_id": scale.event_id(event),
+                "event_name": f"event {event}",
+                "event_type": rng.choice(["functional", "power", "timing", "security"]),
+                "ip": scale.ip(ip),
+                "threshold": rng.randint(1, 20),
+            })
+
+    mappings = []
+    for ip in range(scale.ips):
+        events = [scale.event_id(e) for e in range(ip, scale.events, scale.ips)]
+        for n, start in enumerate(range(0, len(events), EVENTS_PER_MAPPING)):
+            chunk = events[start:start + EVENTS_PER_MAPPING]
+            # Some mappings point at events that have no Coverage row
+            if n % 7 == 3:
+                chunk.append(f"EV-MISSING-{ip}-{n}")
+            mappings.append({
+                "ip": scale.ip(ip),
+                "coverage_id": f"VPD-{ip:04d}-{n:03d}",
+                "coverage_mapping": ", ".join(chunk),
+            })
+    return coverage, mappings
+
+
+def telemetry_rows(scale):
+    """
+    Yields nanoscope-shaped records, STEPS_PER_TESTCASE rows per testcase.
+    The same scale and seed always give the same rows.
+    """
+    rng = random.Random(scale.seed)
+    for row in range(scale.rows):
+        testcase, step = divmod(row, STEPS_PER_TESTCASE)
+        if step == 0:
+            tc_rng = random.Random(scale.seed * 1_000_003 + testcase)
+            project = scale.project(tc_rng.randrange(scale.projects))
+            stepping = scale.stepping(tc_rng.randrange(scale.steppings))
+            platform = tc_rng.choice(["emulation", "fpga", "silicon"])
+            test_result = "fail" if tc_rng.random() < 0.1 else "pass"
+            timestamp = START_TIME + timedelta(seconds=testcase * TESTCASE_INTERVAL_S)
+        event = rng.randrange(scale.events)
+        covered = [scale.event_id(event)] + [scale.event_id(rng.randrange(scale.events)) for _ in range(rng.randint(0, 2))]
+        yield {
+            "idsid": "bench",
+            "trace_id": f"trace-{testcase}",
+            "span_id": f"span-{row}",
+            "instance_id": "bench-0",
+            "run_id": f"run-{testcase // 100}",
+            "stat_us": "done",
+            "body": "",
+            "platform": platform,
+            "download_url": "",
+            "function_name": "run_test",
+            "time_stmp": (timestamp + timedelta(seconds=step)).isoformat(),
+            "versions": "",
+            "project_name": project,
+            "stepping": stepping,
+            "tool_name": "nanoscope",
+            "testid": f"T{testcase:08d}",
+            "testname": f"test_{testcase % 500}",
+            "mapping": "",
+            "events_covered": ", ".join(covered),
+            "test_purpose": f"checks event {event}",
+            "test_config_cmd": "",
+            "test_result": test_result,
+            "eventid": scale.event_id(event),
+            "event_description": "",
+            "step_id": str(step),
+            "step_description": f"step {step}",
+            "step_result": "FAIL" if test_result == "fail" and step == STEPS_PER_TESTCASE - 1 else "PASS",
+            "ip": scale.ip(scale.event_ip(event)),
+        }
+
+
+def populated_tables(model):
+    """
+    The tables generate() would replace that hold rows already: the tool
+    table of model, Coverage and CoverageMapping.
+    """
+    from coverage.models import Coverage, CoverageMapping
+
+    existing = connection.introspection.table_names()
+    return [m._meta.db_table for m in (model, Coverage, CoverageMapping)
+            if m._meta.db_table in existing and m.objects.exists()]
+
+
+def generate(model, scale, batch_size=GENERATE_BATCH_SIZE, progress=None):
+    """
+    Replaces the rows of the tool table of model, Coverage and CoverageMapping
+    (with its events) with the data of the scale and rebuilds the hit rollup,
+    the project catalog and the testcase event index.
+    Telemetry goes in with COPY on PostgreSQL, batch by batch, with the parsed
+    timestamp column filled by its trigger; progress(rows written) is called
+    after each batch.
+    """
+    from coverage.models import Coverage, CoverageMapping, CoverageMappingEvent, EventHitRollup
+    from coverage.rollup import rebuild_event_rollup
+    from project.catalog import rebuild_catalog, rebuild_testcase_events
+    from project.ingest import ToolColumns, copy_rows
+    from project.models import CatalogTestcase, ProjectCatalog, TestcaseEvent, dynamic_models
+    from project.timestamps import create_index, install
+    from .versioning import bump
+
+    table = model._meta.db_table
+    if table not in connection.introspection.table_names():
+        with connection.schema_editor() as schema_editor:
+            schema_editor.create_model(model)
+    if connection.vendor == "postgresql":
+        dynamic_models.reload()
+        tool = next(info for info in dynamic_models.tools() if info.table == table)
+        install(tool)
+
+    coverage, mappings = reference_rows(scale)
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            # Restarting the ids keeps them the same from run to run; no per-row
+            # delete signals either (see CoverageConfig.ready)
+            tables = [model, Coverage, CoverageMapping, CoverageMappingEvent, EventHitRollup,
+                      ProjectCatalog, CatalogTestcase, TestcaseEvent]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"TRUNCATE {', '.join(connection.ops.quote_name(m._meta.db_table) for m in tables)} RESTART IDENTITY"
+                )
+        else:
+            model.objects.all().delete()
+            CoverageMapping.objects.all().delete()
+            Coverage.objects.all().delete()
+            EventHitRollup.objects.all().delete()
+            ProjectCatalog.objects.all().delete()
+            CatalogTestcase.objects.all().delete()
+            TestcaseEvent.objects.all().delete()
+        Coverage.objects.bulk_create([Coverage(**row) for row in coverage], batch_size=batch_size)
+        created = CoverageMapping.objects.bulk_create(
+            [CoverageMapping(**row) for row in mappings], batch_size=batch_size
+        )
+        CoverageMappingEvent.sync(created)
+        bump("coverage", "mapping")
+
+    columns = ToolColumns(model)
+    batch = []
+    written = 0
+    for record in telemetry_rows(scale):
+        batch.append(tuple(record.get(name) for name in columns.names))
+        if len(batch) >= batch_size:
+            with transaction.atomic():
+                copy_rows(model, columns, batch)
+            written += len(batch)
+            batch = []
+            if progress:
+                progress(written)
+    if batch:
+        with transaction.atomic():
+            copy_rows(model, columns, batch)
+        written += len(batch)
+        if progress:
+            progress(written)
+
+    if connection.vendor == "postgresql":
+        create_index(tool)
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(table)}")
+    rebuild_event_rollup()
+    rebuild_catalog()
+    rebuild_testcase_events()
+    return {"rows": written, "coverage": len(coverage), "mappings": len(mappings)}
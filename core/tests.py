@@ -1,3 +1,291 @@
-from django.test import TestCase
+import io
+import re
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from coverage.models import Coverage, CoverageMapping
+from project.models import dynamic_models
+from project.catalog import refresh_catalog
+from project.ingest import ingest_records
+from project.timestamps import install
+from project.tests import LateCommitTestCase, ToolTableTestCase
+from . import benchmark
+from .fanout import fan_out, shutdown
+from .metrics import render_metrics
+from .middleware import RequestMetricsMiddleware
+from .synthetic import Scale, generate, reference_rows, telemetry_rows
+from .versioning import CATALOG, REQUESTED_TOOL, data_version, response_cache
+
+
+def sleep(seconds):
+    def run():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_sleep(%s)", [seconds])
+        return seconds
+    return run
+
+
+@override_settings(TOOL_FANOUT_MAX_WORKERS=3)
+class FanOutTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutdown()
+        super().tearDownClass()
+
+    def test_runs_concurrently(self):
+        start = time.monotonic()
+        results, timed_out = fan_out({name: sleep(0.5) for name in "abc"})
+        self.assertLess(time.monotonic() - start, 1.2)
+        self.assertEqual(results, {"a": 0.5, "b": 0.5, "c": 0.5})
+        self.assertEqual(timed_out, [])
+
+    def test_timeout_returns_partial_results(self):
+        results, timed_out = fan_out({"fast": sleep(0), "slow": sleep(5)}, timeout=0.3)
+        self.assertEqual(results, {"fast": 0})
+        self.assertEqual(timed_out, ["slow"])
+
+    def test_inline_inside_transaction(self):
+        with transaction.atomic():
+            results, timed_out = fan_out({"a": connection.in_atomic_block.__bool__})
+        self.assertEqual(results, {"a": True})
+
+    def test_errors_are_raised(self):
+        def broken():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            fan_out({"a": sleep(0), "b": broken})
+
+
+class RequestMetricsTests(ToolTableTestCase):
+    def setUp(self):
+        for i in range(25):
+            Coverage.objects.create(event_id=f"EV{i}", event_name=f"ev{i}", event_type="t", ip="ip0")
+
+    def test_server_timing(self):
+        self.client.get(reverse("coverage-mapping-list"))  # loads the reference snapshots
+        response = self.client.get(reverse("coverage-mapping-list"))
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'^db;dur=[0-9.]+;desc="1 queries", serialize;dur=[0-9.]+, total;dur=[0-9.]+$')
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse("unique-ip"))
+        body = self.client.get(reverse("metrics")).content.decode()
+        labels = 'method="GET",endpoint="/coverage/unique-ip/"'
+        self.assertRegex(body, re.escape(f"http_request_queries_bucket{{{labels},le=\"2\"}}") + r" [1-9]")
+        self.assertRegex(body, re.escape(f"http_request_duration_seconds_count{{{labels}}}") + r" [1-9]")
+        self.assertIn(f'http_requests_total{{{labels},status="200"}}', body)
+
+    @override_settings(REQUEST_SLOW_MS=0)
+    def test_slow_request_logs_top_queries(self):
+        with self.assertLogs("core.requests", "WARNING") as logs:
+            self.client.get(reverse("unique-ip"))
+        self.assertIn("Slow request GET /coverage/unique-ip/ 200", logs.output[0])
+        self.assertIn('1x', logs.output[0])
+        self.assertIn('FROM "core_changecounter"', logs.output[0])
+
+    def test_repeated_statement_is_logged(self):
+        # One Coverage query per event
+        def view(request):
+            for pk in Coverage.objects.values_list("pk", flat=True):
+                Coverage.objects.filter(pk=pk).exists()
+            return HttpResponse()
+
+        with self.assertLogs("core.requests", "WARNING") as logs:
+            RequestMetricsMiddleware(view)(RequestFactory().get("/coverage/coverage-event/"))
+        self.assertIn("Repeated queries in GET /coverage/coverage-event/", logs.output[0])
+        self.assertRegex(logs.output[0], r"  25x [0-9.]+ ms  SELECT")
+
+
+class DataVersionTests(ToolTableTestCase):
+    def setUp(self):
+        Coverage.objects.create(event_id="EV1", event_name="ev1", event_type="t", ip="ip0", threshold=2)
+        CoverageMapping.objects.create(ip="ip0", coverage_id="VPD-1", coverage_mapping="EV1")
+        self.telemetry = dynamic_models["nanoscope"]
+        self.add_telemetry()
+        self.get("coverage-indicator", ip="ip0")  # folds the hits
+        self.get("projects-list", tool="nanoscope")  # and the project catalog
+
+    def add_telemetry(self):
+        self.telemetry.objects.create(project_name="P", stepping="A0", testid="T1", eventid="EV1", ip="ip0")
+
+    def get(self, name, etag=None, **params):
+        headers = {"If-None-Match": etag} if etag else {}
+        return self.client.get(reverse(name), params, headers=headers)
+
+    def test_not_modified_without_running_the_view(self):
+        # the tool list only depends on the registry, nothing to query
+        for name, params, queries in [("unique-ip", {}, 1), ("coverage-indicator", {"ip": "ip0"}, 1),
+                                      ("projects-list", {"tool": "nanoscope"}, 1), ("tools-list", {}, 0)]:
+            with self.subTest(name=name):
+                etag = self.get(name, **params)["ETag"]
+                with self.assertNumQueries(queries):
+                    response = self.get(name, etag, **params)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+                self.assertEqual(self.get(name, f'W/{etag}, "other"', **params).status_code, 304)
+
+    def test_versions_follow_their_data(self):
+        urls = {"unique-ip": {}, "coverage-indicator": {"ip": "ip0"}, "projects-list": {"tool": "nanoscope"}}
+        etags = {name: self.get(name, **params)["ETag"] for name, params in urls.items()}
+
+        def changed():
+            # the first read after new telemetry folds it and is not tagged
+            fresh = {name: (self.get(name, **params), self.get(name, **params))[1]["ETag"]
+                     for name, params in urls.items()}
+            names = {name for name in urls if fresh[name] != etags[name]}
+            etags.update(fresh)
+            return names
+
+        # Coverage rows don't touch the IP list or the projects
+        Coverage.objects.create(event_id="EV2", event_name="ev2", event_type="t", ip="ip0")
+        self.assertEqual(changed(), {"coverage-indicator"})
+        CoverageMapping.objects.create(ip="ip1", coverage_id="VPD-2", coverage_mapping="EV2")
+        self.assertEqual(changed(), {"unique-ip", "coverage-indicator"})
+        self.add_telemetry()
+        self.assertEqual(changed(), {"coverage-indicator", "projects-list"})
+        self.assertEqual(changed(), set())
+
+    def test_unfolded_telemetry_is_never_not_modified(self):
+        etag = self.get("coverage-indicator", ip="ip0")["ETag"]
+        self.add_telemetry()
+        response = self.get("coverage-indicator", etag, ip="ip0")
+        self.assertEqual(response.status_code, 200)
+        # the hits were folded by that read, the version is settled again
+        self.assertEqual(response.json()[0]["events"][0]["hit"], 2)
+        self.assertNotIn("ETag", response)
+        etag = self.get("coverage-indicator", ip="ip0")["ETag"]
+        self.assertEqual(self.get("coverage-indicator", etag, ip="ip0").status_code, 304)
+
+
+
+class LateCommitVersionTests(LateCommitTestCase):
+    def test_rows_committed_under_the_highest_id_move_the_version(self):
+        model = dynamic_models["nanoscope"]
+        row = {"project_name": "P", "stepping": "A0"}
+        with self.late_row(model, testid="T1", **row):
+            list(ingest_records(model, [(1, {"testid": "T2", **row})]))
+            version, _ = data_version(tools=REQUESTED_TOOL, tool="nanoscope")
+            refresh_catalog()
+            # The catalog can't be settled while the lower id may still commit
+            self.assertFalse(data_version(tools=CATALOG, tool="nanoscope")[1])
+        self.assertNotEqual(data_version(tools=REQUESTED_TOOL, tool="nanoscope")[0], version)
+        refresh_catalog()
+        self.assertTrue(data_version(tools=CATALOG, tool="nanoscope")[1])
+
+class ResponseCacheTests(ToolTableTestCase):
+    def setUp(self):
+        response_cache().clear()
+        Coverage.objects.create(event_id="EV1", event_name="ev1", event_type="t", ip="ip0", threshold=2)
+        CoverageMapping.objects.create(ip="ip0", coverage_id="VPD-1", coverage_mapping="EV1")
+        dynamic_models["nanoscope"].objects.create(
+            project_name="P", stepping="A0", testid="T1", eventid="EV1", ip="ip0", time_stmp="t0"
+        )
+        self.coverage = {"tool": "nanoscope", "project": "P", "stepping": "A0"}
+        self.client.get(reverse("coverage-indicator"), {"ip": "ip0"})  # folds the hits
+        self.client.get(reverse("coverage-data"), {**self.coverage, "page_size": 1})  # and the testcase events
+
+    def cached(self, name, params):
+        """
+        Whether the request was answered from the cache (the version query only).
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries) == 1
+
+    def test_hits_until_the_data_changes(self):
+        first = self.client.get(reverse("coverage-indicator"), {"ip": "ip0"})
+        self.assertTrue(self.cached("coverage-indicator", {"ip": "ip0"}))
+        again = self.client.get(reverse("coverage-indicator"), {"ip": "ip0"})
+        self.assertEqual((again.json(), again["ETag"]), (first.json(), first["ETag"]))
+
+        self.assertFalse(self.cached("coverage-data", self.coverage))
+        # parameter order doesn't matter
+        self.assertTrue(self.cached("coverage-data", dict(reversed(self.coverage.items()))))
+
+        # a mapping upload invalidates the indicators, not the project coverage
+        CoverageMapping.objects.create(ip="ip0", coverage_id="VPD-2", coverage_mapping="EV1")
+        self.assertFalse(self.cached("coverage-indicator", {"ip": "ip0"}))
+        self.assertTrue(self.cached("coverage-data", self.coverage))
+        # its event thresholds come from Coverage
+        Coverage.objects.create(event_id="EV2", event_name="ev2", event_type="t", ip="ip0")
+        self.assertFalse(self.cached("coverage-data", self.coverage))
+
+        body = render_metrics()
+        self.assertRegex(body, r'http_response_cache_total\{endpoint="/coverage/indicator/",result="hit"\} [1-9]')
+        self.assertRegex(body, r'http_response_cache_total\{endpoint="/project/coverage/",result="miss"\} [1-9]')
+
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_disabled(self):
+        self.client.get(reverse("coverage-indicator"), {"ip": "ip0"})
+        self.assertFalse(self.cached("coverage-indicator", {"ip": "ip0"}))
+
+    @override_settings(RESPONSE_CACHE_MAX_BYTES=10)
+    def test_large_responses_are_not_kept(self):
+        self.client.get(reverse("coverage-data"), self.coverage)
+        self.assertFalse(self.cached("coverage-data", self.coverage))
+
+
+class SyntheticDataTests(ToolTableTestCase):
+    SCALE = Scale(rows=60, events=20, ips=4, projects=2, steppings=2)
+
+    def test_deterministic(self):
+        self.assertEqual(list(telemetry_rows(self.SCALE)), list(telemetry_rows(self.SCALE)))
+        self.assertEqual(reference_rows(self.SCALE), reference_rows(self.SCALE))
+        other = Scale(**{**self.SCALE.__dict__, "seed": 2})
+        self.assertNotEqual(list(telemetry_rows(self.SCALE)), list(telemetry_rows(other)))
+
+    def test_generate_and_benchmark(self):
+        summary = generate(dynamic_models["nanoscope"], self.SCALE, batch_size=25)
+        self.assertEqual(summary, {"rows": 60, "coverage": 22, "mappings": 4})
+        self.assertEqual(dynamic_models["nanoscope"].objects.count(), 60)
+        self.assertEqual(CoverageMapping.objects.count(), 4)
+
+        results = benchmark.run(self.SCALE, ["indicator", "project-coverage"], iterations=2)
+        self.assertEqual(set(results), {"indicator", "project-coverage"})
+        indicator = self.client.get(reverse("coverage-indicator"), {"ip": self.SCALE.ip(0)}).json()
+        self.assertTrue(any(event["hit"] for mapping in indicator for event in mapping["events"]))
+
+    def test_ingest_benchmark_leaves_the_table_alone(self):
+        model = dynamic_models["nanoscope"]
+        install(dynamic_models.info("nanoscope"))
+        result = benchmark.ingest(model, self.SCALE, 40, batch_size=25)
+        self.assertEqual((result["rows"], result["trigger"]), (40, True))
+        self.assertFalse(model.objects.exists())
+
+    def test_generate_command_asks_first(self):
+        generate_data = ["generate_synthetic_data", "--tool", "nanoscope", "--rows", "60", "--events", "20",
+                         "--ips", "4"]
+        with mock.patch("builtins.input", return_value="no"):
+            with self.assertRaisesMessage(CommandError, "Cancelled"):
+                call_command(*generate_data, stdout=io.StringIO())
+        self.assertFalse(dynamic_models["nanoscope"].objects.exists())
+
+        # Tables with rows are only replaced with --force, whatever the answer
+        dynamic_models["nanoscope"].objects.create(project_name="P", stepping="A0", testid="T1")
+        with self.assertRaisesMessage(CommandError, "pass --force"):
+            call_command(*generate_data, "--noinput", stdout=io.StringIO())
+        with override_settings(TELEMETRY_BENCH_DATABASE=True):
+            call_command(*generate_data, "--force", stdout=io.StringIO())
+        self.assertEqual(dynamic_models["nanoscope"].objects.count(), 60)
+
+    def test_regressions(self):
+        base = {"p50_ms": 10, "p95_ms": 20, "p99_ms": 30, "queries": 3, "peak_rss_growth_mib": 1}
+        baseline = {"endpoints": {"indicator": base}}
+        self.assertEqual(benchmark.regressions(baseline, {"indicator": {**base, "p50_ms": 19, "p95_ms": 44}}), [])
+        self.assertEqual(benchmark.regressions(baseline, {"indicator": {**base, "queries": 4}}),
+                         ["indicator: 4 queries, baseline 3"])
+        self.assertEqual(benchmark.regressions(baseline, {"indicator": {**base, "p50_ms": 25}}),
+                         ["indicator: p50 25.0 ms, baseline 10.0 ms"])
+        self.assertEqual(len(benchmark.regressions(baseline, {"indicator": {**base, "peak_rss_growth_mib": 40}})), 1)
+        # endpoints without a baseline are not compared
+        self.assertEqual(benchmark.regressions(baseline, {"tools": {**base, "queries": 9}}), [])
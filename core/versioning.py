@@ -0,0 +1,333 @@
+import contextvars
+import hashlib
+import logging
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.response import Response
+
+from .metrics import RESPONSE_CACHE
+from .models import ChangeCounter
+
+logger = logging.getLogger(__name__)
+
+# What telemetry a response depends on, besides the change counter scopes:
+# the tool named in ?tool=, every tool through the coverage hit counts,
+# every tool through hits counted straight from the tool tables, the
+# project catalog of the tool in ?tool= (of every tool without), or the
+# tool in ?tool= together with its testcase events
+REQUESTED_TOOL = "requested"
+HIT_COUNTS = "hits"
+SCANNED_HITS = "scanned-hits"
+CATALOG = "catalog"
+TESTCASE_EVENTS = "testcase-events"
+
+# Counters data_version read for the request data_etag is handling, so the
+# view can check its own caches (coverage.reference) without another query
+_request_counters = contextvars.ContextVar("request_counters", default=None)
+
+
+def rows_scope(table):
+    """
+    Change counter scope of the rows of a tool table, moved on after every
+    write through project.ingest.copy_rows commits. MAX(id) alone misses rows
+    that commit after rows with higher ids.
+    """
+    return f"rows:{table}"
+
+
+def bump(*scopes):
+    """
+    Moves the change counters of the scopes on. Call it in the transaction
+    that writes, so the new counter commits (or rolls back) with the data.
+    """
+    table = connection.ops.quote_name(ChangeCounter._meta.db_table)
+    with connection.cursor() as cursor:
+        for scope in scopes:
+            cursor.execute(
+                f"INSERT INTO {table} (scope, counter) VALUES (%s, 1) "
+                f"ON CONFLICT (scope) DO UPDATE SET counter = {table}.counter + 1",
+                [scope],
+            )
+
+
+def counters(*scopes):
+    """
+    {scope: (counter, row id)} of the change counters. Those the current
+    data_etag request has read already are taken from there, the others
+    come from one query.
+    """
+    seen = _request_counters.get() or {}
+    found = {scope: seen[scope] for scope in scopes if scope in seen}
+    missing = [scope for scope in scopes if scope not in found]
+    if missing:
+        rows = {
+            scope: (counter, pk)
+            for scope, counter, pk in ChangeCounter.objects.filter(scope__in=missing).values_list("scope", "counter", "id")
+        }
+        found.update({scope: rows.get(scope, (0, 0)) for scope in missing})
+    return found
+
+
+def data_version(scopes=(), tools=None, tool=None):
+    """
+    (version, settled) of the data a response depends on, read in one query:
+    the counters of the scopes, the registered tool tables and the highest
+    id of the telemetry in use with its rows counter (see rows_scope). Tool
+    tables only grow, so a new id, or a new batch under a lower one, is new
+    data.
+
+    Hit counts read from the rollup, the project catalog and testcase events
+    depend on what has been folded in (the watermark). When reads fold (the *_REFRESH_ON_READ
+    settings) and rows are waiting, the response about to be built is newer
+    than the version: settled is False and the response can't be matched
+    against anything.
+    """
+    from coverage.rollup import ROLLUP_CONSUMER
+    from project.catalog import CATALOG_CONSUMER, TESTCASE_EVENTS_CONSUMER, has_events
+    from project.models import TelemetryWatermark, dynamic_models
+
+    registry = tuple((info.name, info.table) for info in dynamic_models.tools())
+
+    # consumer: the derived table the response reads instead of the tool table
+    # (or, with reads_rows, next to it)
+    consumer, refresh_on_read, reads_rows = None, True, False
+    if tools == HIT_COUNTS:
+        # Tables without an ip column never count hits
+        infos = [info for info in dynamic_models.tools() if info.ip_field]
+        if getattr(settings, "COVERAGE_HIT_SOURCE", "rollup") != "scan":
+            consumer = ROLLUP_CONSUMER
+            refresh_on_read = getattr(settings, "COVERAGE_ROLLUP_REFRESH_ON_READ", True)
+    elif tools == SCANNED_HITS:
+        infos = [info for info in dynamic_models.tools() if info.ip_field]
+    elif tools == CATALOG and not tool:
+        infos = dynamic_models.tools()
+    elif tools in (REQUESTED_TOOL, CATALOG, TESTCASE_EVENTS):
+        infos = [dynamic_models.info(tool)] if tool in dynamic_models else []
+    else:
+        infos = []
+    if tools == CATALOG:
+        consumer = CATALOG_CONSUMER
+        refresh_on_read = getattr(settings, "PROJECT_CATALOG_REFRESH_ON_READ", True)
+    elif tools == TESTCASE_EVENTS and all(has_events(info) for info in infos):
+        consumer, reads_rows = TESTCASE_EVENTS_CONSUMER, True
+        refresh_on_read = getattr(settings, "PROJECT_CATALOG_REFRESH_ON_READ", True)
+
+    qn = connection.ops.quote_name
+    selects, params = [], []
+    if scopes:
+        selects.append(
+            f"SELECT 'scope', scope, counter, id FROM {qn(ChangeCounter._meta.db_table)} "
+            f"WHERE scope IN ({', '.join(['%s'] * len(scopes))})"
+        )
+        params.extend(scopes)
+    if infos and consumer:
+        # The pending ranges are folded under the watermark, their number moves
+        # too. Ranges an open transaction may still fill (xmax set) unsettle
+        if connection.vendor == "postgresql":
+            pending = "jsonb_array_length(pending)"
+            waiting = "(SELECT COUNT(*) FROM jsonb_array_elements(pending) AS e WHERE e->2 <> 'null')"
+        else:
+            pending = "json_array_length(pending)"
+            waiting = "(SELECT COUNT(*) FROM json_each(pending) WHERE json_extract(value, '$[2]') IS NOT NULL)"
+        tools_in = ", ".join(["%s"] * len(infos))
+        for kind, column in (("folded", pending), ("waiting", waiting)):
+            selects.append(
+                f"SELECT '{kind}', tool, last_id, {column} FROM {qn(TelemetryWatermark._meta.db_table)} "
+                f"WHERE consumer = %s AND tool IN ({tools_in})"
+            )
+            params.extend([consumer] + [info.name for info in infos])
+    if not consumer or refresh_on_read or reads_rows:
+        for info in infos:
+            table = info.model._meta.db_table
+            selects.append(
+                f"SELECT 'rows', %s, MAX(id), COALESCE((SELECT counter FROM {qn(ChangeCounter._meta.db_table)} "
+                f"WHERE scope = %s), 0) FROM {qn(table)}"
+            )
+            params.extend([info.name, rows_scope(table)])
+
+    values = {}
+    if selects:
+        with connection.cursor() as cursor:
+            cursor.execute(" UNION ALL ".join(selects), params)
+            # A counter row recreated after a restore starts over, its id tells the two apart
+            values = {(kind, name): (value or 0, row) for kind, name, value, row in cursor.fetchall()}
+    seen = _request_counters.get()
+    if seen is not None:
+        seen.update({scope: values.get(("scope", scope), (0, 0)) for scope in scopes})
+
+    settled = True
+    if consumer:
+        if refresh_on_read:
+            # Folded up to the highest id, with no ranges waiting on open transactions
+            settled = all(
+                values.get(("rows", info.name), (0, 0))[0] <= values.get(("folded", info.name), (0, 0))[0]
+                and not values.get(("waiting", info.name), (0, 0))[1]
+                for info in infos
+            )
+        if not reads_rows:
+            # The response holds what was folded, not what is in the table
+            values = {key: value for key, value in values.items() if key[0] != "rows"}
+
+    version = (
+        registry,
+        tuple((scope, values.get(("scope", scope), (0, 0))) for scope in scopes),
+        tuple(sorted((key[1], key[0], value) for key, value in values.items() if key[0] != "scope")),
+    )
+    return version, settled
+
+
+def request_digest(request, scopes, tools):
+    """
+    (digest, settled) of the response to request at the current data version,
+    the same however the query parameters are ordered.
+    """
+    from project.timestamps import TIMESTAMP_SCOPE
+
+    if request.GET.get("since") or request.GET.get("until"):
+        # Time ranges read the parsed timestamps, which a backfill fills in
+        # under existing ids; hits in a range are counted from the tool tables
+        scopes = (*scopes, TIMESTAMP_SCOPE)
+        if tools == HIT_COUNTS:
+            tools = SCANNED_HITS
+    version, settled = data_version(scopes, tools, request.GET.get("tool"))
+    params = sorted(request.GET.lists())
+    # The same URL renders differently per Accept (DRF's browsable API)
+    key = repr((request.path, params, request.META.get("HTTP_ACCEPT", ""), version))
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest(), settled
+
+
+def not_modified(request, etag):
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    # If-None-Match compares weakly
+    tags = [tag.removeprefix("W/") for tag in parse_etags(header)]
+    return "*" in tags or etag in tags
+
+
+def reusable(response):
+    # Errors and partial results (see coverage.views.flag_partial) are not
+    return response.status_code == 200 and not response.has_header("X-Partial-Results")
+
+
+def tag_response(response, etag):
+    if reusable(response):
+        response["ETag"] = etag
+        # Browsers keep the body and revalidate it with If-None-Match every time
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def response_cache():
+    return caches[getattr(settings, "RESPONSE_CACHE_ALIAS", "default")]
+
+
+def _endpoint(request):
+    match = getattr(request, "resolver_match", None)
+    return "/" + match.route if match is not None and match.route else request.path
+
+
+def lookup(request, scopes, tools, cache):
+    """
+    (etag, cache key, response): the response is a 304 or a cached copy
+    when the view doesn't have to run. etag is None when the version isn't
+    settled, the key is None when the response is not to be cached.
+    """
+    digest, settled = request_digest(request, scopes, tools)
+    if not settled:
+        return None, None, None
+    etag = quote_etag(digest)
+    if not_modified(request, etag):
+        return etag, None, HttpResponseNotModified(headers={"ETag": etag})
+    if not (cache and getattr(settings, "RESPONSE_CACHE_ENABLED", False)):
+        return etag, None, None
+
+    key = f"response:{digest}"
+    try:
+        entry = response_cache().get(key)
+    except Exception:
+        # A cache that is down only costs the lookup
+        logger.warning("Response cache lookup failed", exc_info=True)
+        return etag, None, None
+    RESPONSE_CACHE.inc((_endpoint(request), "miss" if entry is None else "hit"))
+    if entry is None:
+        return etag, key, None
+    content_type, content = entry
+    return etag, None, tag_response(HttpResponse(content, content_type=content_type), etag)
+
+
+def store(view, request, response, etag, key):
+    """
+    Tags response and puts a copy into the cache under key.
+    """
+    if key is not None and reusable(response) and not response.streaming:
+        if isinstance(response, Response) and not response.is_rendered:
+            # DRF renders after the view returns, the cache needs the content now
+            response = view.finalize_response(request, response)
+            response.render()
+        content_type = response.get("Content-Type", "")
+        # JSON only: the browsable API's HTML isn't worth keeping
+        if content_type.startswith("application/json") and \
+                len(response.content) <= getattr(settings, "RESPONSE_CACHE_MAX_BYTES", 0):
+            try:
+                response_cache().set(key, (content_type, response.content))
+            except Exception:
+                logger.warning("Response cache store failed", exc_info=True)
+    return tag_response(response, etag)
+
+
+def data_etag(*scopes, tools=None, cache=False):
+    """
+    Decorates the get() of a view (DRF or plain, sync or async) with
+    conditional GET on the data version: a request whose If-None-Match holds
+    the current ETag gets a 304 and the view doesn't run. With cache, JSON
+    responses are also kept in the response cache (RESPONSE_CACHE_ALIAS)
+    under the version and served from it until the data changes.
+
+    scopes are the change counters the response depends on, tools one of
+    REQUESTED_TOOL / HIT_COUNTS / SCANNED_HITS / CATALOG / TESTCASE_EVENTS
+    when it depends on telemetry. Versions only
+    move with what a view depends on, so a coverage upload doesn't touch the
+    cached project responses.
+    """
+    def decorator(method):
+        if iscoroutinefunction(method):
+            @wraps(method)
+            async def wrapper(view, request, *args, **kwargs):
+                # A dict both sides of sync_to_async share, for counters()
+                token = _request_counters.set({})
+                try:
+                    etag, key, response = await sync_to_async(lookup)(request, scopes, tools, cache)
+                    if response is not None:
+                        return response
+                    response = await method(view, request, *args, **kwargs)
+                finally:
+                    _request_counters.reset(token)
+                if etag is None:
+                    return response
+                if key is None:
+                    return tag_response(response, etag)
+                return await sync_to_async(store)(view, request, response, etag, key)
+        else:
+            @wraps(method)
+            def wrapper(view, request, *args, **kwargs):
+                token = _request_counters.set({})
+                try:
+                    etag, key, response = lookup(request, scopes, tools, cache)
+                    if response is not None:
+                        return response
+                    response = method(view, request, *args, **kwargs)
+                finally:
+                    _request_counters.reset(token)
+                if etag is None:
+                    return response
+                return store(view, request, response, etag, key)
+        return wrapper
+    return decorator
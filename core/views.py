@@ -3,11 +3,15 @@ from django.views import View
 
 from django.http import HttpResponse
 
+from .metrics import render_metrics
+
 # Create your views here.
 class OverallView(View):
     def get(self,request):
         return render(request, "core/overall.html")
-    
-
 
 
+# Prometheus scrape target
+class MetricsView(View):
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
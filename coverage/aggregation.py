@@ -0,0 +1,187 @@
+from datetime import timezone
+
+from django.conf import settings
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Trunc
+
+from core.fanout import fan_out, runs_concurrently, tool_timeout
+from project.models import TIMESTAMP_COLUMN, dynamic_models
+from project.timestamps import in_time_range
+from .models import EventHitRollup
+from .rollup import refresh_tools
+
+
+class HitCounts(dict):
+    """
+    {(event_id, ip): hits}. partial_tools names the tools that ran past
+    TOOL_FANOUT_TIMEOUT, their rows are missing from (or stale in) the counts.
+    """
+    partial_tools = ()
+
+
+class HitTrends(dict):
+    """
+    {event_id: {bucket start: hits}}, partial_tools as for HitCounts.
+    """
+    partial_tools = ()
+
+
+# Widths of a trend bucket, as date_trunc units
+TREND_BUCKETS = ("hour", "day", "week", "month")
+
+
+def tool_rows(tool, ip=None, project=None, stepping=None, since=None, until=None):
+    """
+    The rows of a single tool table (a registry ToolInfo) that hit an event
+    on an IP, narrowed down. None when the tool cannot be attributed to an
+    IP, or has no parsed timestamp and a time range is asked for.
+    """
+    eid_field, ip_field = tool.eid_field, tool.ip_field
+    if not ip_field:
+        return None
+
+    if (since or until) and not tool.has_column(TIMESTAMP_COLUMN):
+        return None
+
+    qs = (
+        tool.model.objects
+        .exclude(**{f"{eid_field}__isnull": True})
+        .exclude(**{eid_field: ""})
+        .exclude(**{f"{ip_field}__isnull": True})
+        .exclude(**{ip_field: ""})
+    )
+    if ip:
+        qs = qs.filter(**{ip_field: ip})
+    if project:
+        qs = qs.filter(project_name=project)
+    if stepping:
+        qs = qs.filter(stepping=stepping)
+    return in_time_range(qs, since, until)
+
+
+def tool_hit_queryset(tool, ip=None, project=None, stepping=None, since=None, until=None):
+    """
+    GROUP BY (event id, ip) over a single tool table (a registry ToolInfo).
+    Returns None when the tool has no rows to count (see tool_rows).
+    """
+    qs = tool_rows(tool, ip=ip, project=project, stepping=stepping, since=since, until=until)
+    if qs is None:
+        return None
+    return (
+        qs.values(hit_event=F(tool.eid_field), hit_ip=F(tool.ip_field))
+        .annotate(hits=Count("*"))
+        .order_by()
+    )
+
+
+def _fan_out_rows(queries):
+    """
+    Rows of every tool queryset in queries ({tool: queryset}) and the tools
+    that timed out: concurrently, one connection each, or with UNION ALL in
+    one round trip when that isn't possible.
+    """
+    if runs_concurrently():
+        results, partial_tools = fan_out(
+            {name: (lambda qs=qs: list(qs)) for name, qs in queries.items()},
+            timeout=tool_timeout(),
+        )
+        return (row for rows in results.values() for row in rows), partial_tools
+    querysets = list(queries.values())
+    return (querysets[0].union(*querysets[1:], all=True) if len(querysets) > 1 else querysets[0]), ()
+
+
+def scan_event_hit_counts(ip=None, project=None, stepping=None, since=None, until=None):
+    """
+    Hit counts per (event_id, ip) straight from the tool tables.
+
+    Counting happens in the database: every tool contributes one grouped
+    sub-query, so only one row per distinct (tool, event, ip) comes back
+    over the wire. The sub-queries run concurrently, one connection each,
+    so the wait is that of the slowest tool rather than the sum; without
+    concurrency they are combined with UNION ALL into one round trip.
+    """
+    queries = {}
+    for tool in dynamic_models.tools():
+        qs = tool_hit_queryset(tool, ip=ip, project=project, stepping=stepping, since=since, until=until)
+        if qs is not None:
+            queries[tool.name] = qs
+
+    event_counts = HitCounts()
+    if not queries:
+        return event_counts
+
+    rows, event_counts.partial_tools = _fan_out_rows(queries)
+
+    # The same (event, ip) can show up once per tool, merge those here
+    for row in rows:
+        key = (row["hit_event"], row["hit_ip"])
+        event_counts[key] = event_counts.get(key, 0) + row["hits"]
+    return event_counts
+
+
+def rollup_event_hit_counts(ip=None, project=None, stepping=None):
+    """
+    Hit counts per (event_id, ip) read from EventHitRollup.
+    Cost grows with the number of distinct events, not telemetry rows.
+    """
+    partial_tools = ()
+    if getattr(settings, "COVERAGE_ROLLUP_REFRESH_ON_READ", True):
+        _, partial_tools = refresh_tools(wait=False, timeout=tool_timeout())
+
+    qs = EventHitRollup.objects.all()
+    if ip:
+        qs = qs.filter(ip=ip)
+    if project:
+        qs = qs.filter(project_name=project)
+    if stepping:
+        qs = qs.filter(stepping=stepping)
+
+    rows = qs.values_list("event_id", "ip").annotate(total=Sum("hits")).order_by()
+    event_counts = HitCounts(((event_id, row_ip), total) for event_id, row_ip, total in rows)
+    event_counts.partial_tools = partial_tools
+    return event_counts
+
+
+def event_hit_counts(ip=None, project=None, stepping=None, since=None, until=None):
+    """
+    Hit counts per (event_id, ip) across all tool tables, optionally
+    narrowed to one ip / project / stepping and a [since, until) time range.
+    The rollup has no time in it, time ranges are counted from the tool
+    tables through their (BRIN indexed) parsed timestamp.
+    """
+    if since or until or getattr(settings, "COVERAGE_HIT_SOURCE", "rollup") == "scan":
+        return scan_event_hit_counts(ip=ip, project=project, stepping=stepping, since=since, until=until)
+    return rollup_event_hit_counts(ip=ip, project=project, stepping=stepping)
+
+
+def hit_trends(bucket="day", events=None, ip=None, project=None, stepping=None, since=None, until=None):
+    """
+    {event_id: {bucket start: hits}} across all tool tables, bucketed by
+    the parsed timestamp (UTC); rows without one are left out. events
+    narrows it down to those event ids.
+    """
+    queries = {}
+    for tool in dynamic_models.tools():
+        if not tool.has_column(TIMESTAMP_COLUMN):
+            continue
+        qs = tool_rows(tool, ip=ip, project=project, stepping=stepping, since=since, until=until)
+        if qs is None:
+            continue
+        if events is not None:
+            qs = qs.filter(**{f"{tool.eid_field}__in": events})
+        queries[tool.name] = (
+            qs.exclude(**{f"{TIMESTAMP_COLUMN}__isnull": True})
+            .values(hit_event=F(tool.eid_field), start=Trunc(TIMESTAMP_COLUMN, bucket, tzinfo=timezone.utc))
+            .annotate(hits=Count("*"))
+            .order_by()
+        )
+
+    trends = HitTrends()
+    if not queries:
+        return trends
+
+    rows, trends.partial_tools = _fan_out_rows(queries)
+    for row in rows:
+        buckets = trends.setdefault(row["hit_event"], {})
+        buckets[row["start"]] = buckets.get(row["start"], 0) + row["hits"]
+    return trends
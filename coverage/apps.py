@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
+
+
+def coverage_changed(sender, **kwargs):
+    from core.versioning import bump
+    bump("coverage")
+
+
+def mapping_changed(sender, **kwargs):
+    from core.versioning import bump
+    bump("mapping")
 
 
 class CoverageConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'coverage'
+
+    def ready(self):
+        # Single-row writes (admin, the API); the bulk paths in ingest bump themselves
+        for model, receiver in ((self.get_model("Coverage"), coverage_changed),
+                                (self.get_model("CoverageMapping"), mapping_changed)):
+            post_save.connect(receiver, sender=model, dispatch_uid=f"{model.__name__}_saved")
+            post_delete.connect(receiver, sender=model, dispatch_uid=f"{model.__name__}_deleted")
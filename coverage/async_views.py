@@ -0,0 +1,123 @@
+from asgiref.sync import sync_to_async
+from django.views import View
+
+from core.streaming import json_response
+from core.versioning import HIT_COUNTS, SCANNED_HITS, data_etag
+from project.timestamps import TIMESTAMP_SCOPE, time_range
+from .aggregation import event_hit_counts, hit_trends
+from .reference import mapping_index
+from .views import (
+    EventPieData, IndicatorData, event_pie_rows, flag_partial, indicator_rows, requested_values, trend_data,
+    trend_params,
+)
+
+# Async counterparts of the read views in views.py, see project/async_views.py.
+# Hit counting (rollup refresh, per-tool fan-out) stays synchronous code and
+# is awaited through sync_to_async, and so is reading the reference
+# snapshots, which may have to be (re)loaded first.
+
+
+class UniqueIPView(View):
+    @data_etag("mapping")
+    async def get(self, request):
+        mappings = await sync_to_async(mapping_index)()
+        return json_response({"ip": list(mappings.ips)})
+
+
+class CoverageIndicatorView(View):
+    @data_etag("mapping", "coverage", tools=HIT_COUNTS, cache=True)
+    async def get(self, request):
+        selected_ip = request.GET.get("ip")
+        if not selected_ip:
+            return json_response({"error": "Missing IP parameter"}, status=400)
+        try:
+            since, until = time_range(request.GET)
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=400)
+
+        event_counts = await sync_to_async(event_hit_counts)(
+            ip=selected_ip,
+            project=request.GET.get("project"),
+            stepping=request.GET.get("stepping"),
+            since=since,
+            until=until,
+        )
+
+        indicator = IndicatorData(event_counts)
+        for row in await sync_to_async(list)(indicator_rows([selected_ip])):
+            indicator.add(row)
+
+        return flag_partial(json_response(indicator.data(selected_ip)), event_counts)
+
+
+class EventCoverageView(View):
+    """
+    Pie chart data per event_id, from the Coverage snapshot in event order.
+    """
+
+    @data_etag("coverage", tools=HIT_COUNTS, cache=True)
+    async def get(self, request):
+        try:
+            since, until = time_range(request.GET)
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=400)
+
+        event_counts = await sync_to_async(event_hit_counts)(
+            project=request.GET.get("project"),
+            stepping=request.GET.get("stepping"),
+            since=since,
+            until=until,
+        )
+
+        pie = EventPieData(event_counts)
+        for row in await sync_to_async(list)(event_pie_rows()):
+            pie.add(row)
+
+        return flag_partial(json_response(pie.data), event_counts)
+
+
+class CoverageDashboardView(View):
+    @data_etag("mapping", "coverage", tools=HIT_COUNTS, cache=True)
+    async def get(self, request):
+        ips = requested_values(request.GET, "ips")
+        events = requested_values(request.GET, "events")
+        try:
+            since, until = time_range(request.GET)
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=400)
+
+        event_counts = await sync_to_async(event_hit_counts)(
+            project=request.GET.get("project"),
+            stepping=request.GET.get("stepping"),
+            since=since,
+            until=until,
+        )
+
+        all_ips = list((await sync_to_async(mapping_index)()).ips)
+
+        indicator = IndicatorData(event_counts)
+        if ips != []:
+            for row in await sync_to_async(list)(indicator_rows(ips)):
+                indicator.add(row)
+
+        pie = EventPieData(event_counts)
+        if events != []:
+            for row in await sync_to_async(list)(event_pie_rows(events)):
+                pie.add(row)
+
+        return flag_partial(json_response({
+            "ip": all_ips,
+            "indicators": {ip: indicator.data(ip) for ip in (all_ips if ips is None else ips)},
+            "events": pie.data,
+        }), event_counts)
+
+
+class CoverageTrendView(View):
+    @data_etag(TIMESTAMP_SCOPE, tools=SCANNED_HITS, cache=True)
+    async def get(self, request):
+        try:
+            params = trend_params(request.GET)
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=400)
+        trends = await sync_to_async(hit_trends)(**params)
+        return flag_partial(json_response(trend_data(trends)), trends)
@@ -0,0 +1,402 @@
+import codecs
+import csv
+
+import chardet
+from django.db import connection, transaction
+from core.versioning import bump
+from .models import Coverage, CoverageMapping, CoverageMappingEvent
+from .workbook import MissingColumns, read_mapping_sheet, read_mapping_sheets, sheet_names
+
+# chardet only needs a prefix to make a good guess
+ENCODING_SAMPLE_SIZE = 64 * 1024
+# rows per multi-row INSERT (5 params each, well below the driver limits)
+BATCH_SIZE = 2000
+# row errors returned in the response, the total is always reported
+MAX_REPORTED_ERRORS = 100
+
+COVERAGE_COLUMNS = ["event_id", "event_name", "event_type", "ip", "threshold"]
+
+# mappings per SELECT + INSERT ... ON CONFLICT DO UPDATE round
+MAPPING_CHUNK_SIZE = 1000
+# summary counts added up over the sheets of a workbook import
+MAPPING_COUNTS = ["created", "updated", "unchanged", "total_rows", "invalid_rows", "duplicate_rows"]
+
+
+def detect_encoding(file):
+    """
+    Guesses the encoding from the first ENCODING_SAMPLE_SIZE bytes and rewinds the file.
+    """
+    sample = file.read(ENCODING_SAMPLE_SIZE)
+    file.seek(0)
+    encoding = chardet.detect(sample).get("encoding") or "utf-8"
+    # An ASCII prefix says nothing about the rest of the file, utf-8 is a superset
+    if encoding.lower() == "ascii":
+        encoding = "utf-8"
+    return encoding
+
+
+def iter_csv_rows(file, encoding):
+    """
+    Yields (line number, row dict) while decoding the file incrementally.
+    """
+    reader = csv.DictReader(codecs.getreader(encoding)(file, errors="replace"))
+    for row in reader:
+        yield reader.line_num, row
+
+
+def clean_coverage_row(row):
+    """
+    Returns the Coverage values of a CSV row as a tuple in COVERAGE_COLUMNS order.
+    Returns None for rows without event_id or ip; raises ValueError for invalid rows.
+    """
+    values = {name: (row.get(name) or "").strip() for name in COVERAGE_COLUMNS}
+    if not values["event_id"] or not values["ip"]:
+        return None
+
+    for name in ["event_id", "event_name", "event_type", "ip"]:
+        max_length = Coverage._meta.get_field(name).max_length
+        if len(values[name]) > max_length:
+            raise ValueError(f"{name} is longer than {max_length} characters")
+
+    try:
+        threshold = int(values["threshold"]) if values["threshold"] else 0
+    except ValueError:
+        raise ValueError(f"threshold {values['threshold']!r} is not an integer")
+
+    return (values["event_id"], values["event_name"], values["event_type"], values["ip"], threshold)
+
+
+def insert_coverage_batch(rows):
+    """
+    Multi-row INSERT of cleaned rows that skips existing (event_id, ip) pairs.
+    Returns the ids of the rows actually inserted.
+    """
+    if not rows:
+        return []
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(c) for c in COVERAGE_COLUMNS)
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+    sql = (
+        f"INSERT INTO {qn(Coverage._meta.db_table)} ({columns}) VALUES {placeholders} "
+        f"ON CONFLICT (event_id, ip) DO NOTHING RETURNING id"
+    )
+    params = [value for row in rows for value in row]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        inserted = [r[0] for r in cursor.fetchall()]
+        if inserted:
+            bump("coverage")
+        return inserted
+
+
+class CoverageCSV:
+    """
+    The valid rows of a coverage CSV, cleaned one at a time while the file
+    is decoded, with counts of the rows skipped or rejected on the way.
+    progress(rows, processed=bytes read, ...) is called every progress_every
+    rows and once at the end.
+    """
+
+    def __init__(self, file, progress=None, progress_every=BATCH_SIZE):
+        self.file = file
+        self.encoding = detect_encoding(file)
+        self.progress = progress
+        self.progress_every = progress_every
+        self.total = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors = []
+        # (event_id, ip) of the rejected rows that had both
+        self.rejected_keys = set()
+
+    def __iter__(self):
+        for line_num, row in iter_csv_rows(self.file, self.encoding):
+            self.total += 1
+            if self.progress and self.total % self.progress_every == 0:
+                self.report_progress()
+            try:
+                values = clean_coverage_row(row)
+            except ValueError as e:
+                self.error_count += 1
+                if len(self.errors) < MAX_REPORTED_ERRORS:
+                    self.errors.append({"row": line_num, "error": str(e)})
+                self.rejected_keys.add(((row.get("event_id") or "").strip(), (row.get("ip") or "").strip()))
+                continue
+            if values is None:
+                self.skipped += 1
+                continue
+            yield values
+        if self.progress:
+            self.report_progress()
+
+    def report_progress(self):
+        self.progress(self.total, processed=self.file.tell(), error_rows=self.error_count, errors=self.errors)
+
+    def summary(self):
+        return {
+            "skipped_rows": self.skipped,
+            "encoding_used": self.encoding,
+            "total_rows": self.total,
+            "error_rows": self.error_count,
+            "errors": self.errors,
+        }
+
+
+def ingest_coverage_csv(file, batch_size=BATCH_SIZE, progress=None):
+    """
+    Streams a coverage CSV into Coverage, one INSERT per batch of valid rows.
+    Existing (event_id, ip) pairs are left untouched.
+    """
+    rows = CoverageCSV(file, progress=progress, progress_every=batch_size)
+    inserted = []
+    batch = []
+    for values in rows:
+        batch.append(values)
+        if len(batch) >= batch_size:
+            inserted.extend(insert_coverage_batch(batch))
+            batch = []
+    inserted.extend(insert_coverage_batch(batch))
+    return {"inserted_ids": inserted, **rows.summary()}
+
+
+def update_coverage_batch(rows):
+    """
+    Sets event_name, event_type and threshold of Coverage rows by id from
+    (id, event_name, event_type, threshold) tuples, in one UPDATE.
+    """
+    if not rows:
+        return
+    if connection.vendor != "postgresql":
+        Coverage.objects.bulk_update(
+            [Coverage(id=pk, event_name=name, event_type=kind, threshold=threshold) for pk, name, kind, threshold in rows],
+            ["event_name", "event_type", "threshold"],
+        )
+        return
+    table = connection.ops.quote_name(Coverage._meta.db_table)
+    ids, names, kinds, thresholds = (list(column) for column in zip(*rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} AS c SET event_name = v.event_name, event_type = v.event_type, threshold = v.threshold "
+            f"FROM unnest(%s::bigint[], %s::text[], %s::text[], %s::integer[]) AS v(id, event_name, event_type, threshold) "
+            f"WHERE c.id = v.id",
+            [ids, names, kinds, thresholds],
+        )
+
+
+def delete_coverage_batch(ids):
+    # Plain DELETE: a queryset delete would send a post_delete signal (and bump) per row
+    if not ids:
+        return
+    table = connection.ops.quote_name(Coverage._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+
+
+def coverage_values(key, values):
+    """
+    (event_id, ip) and (event_name, event_type, threshold) as a tuple in COVERAGE_COLUMNS order.
+    """
+    (event_id, ip), (event_name, event_type, threshold) = key, values
+    return (event_id, event_name, event_type, ip, threshold)
+
+
+def coverage_row(key, values):
+    return dict(zip(COVERAGE_COLUMNS, coverage_values(key, values)))
+
+
+def sync_coverage_csv(file, delete=False, dry_run=False, batch_size=BATCH_SIZE, progress=None):
+    """
+    Makes Coverage match a coverage CSV, writing only what differs: the
+    current (event_id, ip) -> (event_name, event_type, threshold) snapshot is
+    read in one query and diffed against the file into inserts, updates and,
+    with delete, deletes of the pairs the file doesn't have (rows rejected
+    for errors don't count as missing). Later rows win over earlier ones for
+    the same pair. dry_run only reports the diff, with a preview of each part.
+    """
+    rows = CoverageCSV(file, progress=progress, progress_every=batch_size)
+    wanted = {}
+    duplicates = 0
+    for event_id, event_name, event_type, ip, threshold in rows:
+        key = (event_id, ip)
+        duplicates += key in wanted
+        wanted[key] = (event_name, event_type, threshold)
+
+    with transaction.atomic():
+        current = {
+            (event_id, ip): (pk, (event_name, event_type, threshold))
+            for pk, event_id, ip, event_name, event_type, threshold in Coverage.objects.values_list(
+                "id", "event_id", "ip", "event_name", "event_type", "threshold"
+            )
+        }
+        inserts = [key for key in wanted if key not in current]
+        updates = [key for key, values in wanted.items() if key in current and current[key][1] != values]
+        deletes = [key for key in current if key not in wanted and key not in rows.rejected_keys] if delete else []
+
+        summary = {
+            "mode": "sync",
+            "dry_run": dry_run,
+            "inserted": len(inserts),
+            "updated": len(updates),
+            "deleted": len(deletes),
+            "unchanged": len(wanted) - len(inserts) - len(updates),
+            "duplicate_rows": duplicates,
+            **rows.summary(),
+        }
+        if dry_run:
+            summary["preview"] = {
+                "inserts": [coverage_row(key, wanted[key]) for key in inserts[:MAX_REPORTED_ERRORS]],
+                "updates": [
+                    {"from": coverage_row(key, current[key][1]), "to": coverage_row(key, wanted[key])}
+                    for key in updates[:MAX_REPORTED_ERRORS]
+                ],
+                "deletes": [coverage_row(key, current[key][1]) for key in deletes[:MAX_REPORTED_ERRORS]],
+            }
+            return summary
+
+        for start in range(0, len(inserts), batch_size):
+            insert_coverage_batch([coverage_values(key, wanted[key]) for key in inserts[start:start + batch_size]])
+        for start in range(0, len(updates), batch_size):
+            update_coverage_batch([(current[key][0], *wanted[key]) for key in updates[start:start + batch_size]])
+        for start in range(0, len(deletes), batch_size):
+            delete_coverage_batch([current[key][0] for key in deletes[start:start + batch_size]])
+        if updates or deletes:
+            bump("coverage")
+
+    return summary
+
+
+def clean_mapping_frame(df):
+    """
+    Normalises cell values and drops unusable rows.
+    Returns (cleaned frame, number of invalid rows, number of duplicate rows).
+    """
+    df = df.copy()
+    df["coverage_id"] = df["coverage_id"].fillna("").astype(str).str.strip()
+    df["coverage_mapping"] = df["coverage_mapping"].fillna("").astype(str).str.strip()
+
+    max_length = CoverageMapping._meta.get_field("coverage_id").max_length
+    valid = (df["coverage_id"] != "") & (df["coverage_id"].str.len() <= max_length)
+    invalid = int((~valid).sum())
+    df = df[valid]
+
+    # Later rows win, like sequential update_or_create did
+    before = len(df)
+    df = df.drop_duplicates("coverage_id", keep="last")
+    return df, invalid, before - len(df)
+
+
+def upsert_mappings(df, ip, return_ids=False, chunk_size=MAPPING_CHUNK_SIZE):
+    """
+    Writes cleaned mappings for one IP, one chunk at a time: a SELECT of the
+    current values, then one INSERT ... ON CONFLICT (coverage_id, ip) DO UPDATE
+    for the rows that are new or changed. Unchanged rows are not written.
+    """
+    summary = {"created": 0, "updated": 0, "unchanged": 0}
+    created_ids = []
+    updated_ids = []
+
+    pairs = list(zip(df["coverage_id"], df["coverage_mapping"]))
+    for start in range(0, len(pairs), chunk_size):
+        chunk = pairs[start:start + chunk_size]
+        existing = dict(
+            CoverageMapping.objects.filter(ip=ip, coverage_id__in=[cid for cid, _ in chunk])
+            .values_list("coverage_id", "coverage_mapping")
+        )
+        changed = [(cid, text) for cid, text in chunk if existing.get(cid) != text]
+        summary["unchanged"] += len(chunk) - len(changed)
+        if not changed:
+            continue
+
+        objs = CoverageMapping.objects.bulk_create(
+            [CoverageMapping(ip=ip, coverage_id=cid, coverage_mapping=text) for cid, text in changed],
+            update_conflicts=True,
+            unique_fields=["coverage_id", "ip"],
+            update_fields=["coverage_mapping"],
+        )
+        CoverageMappingEvent.sync(objs)
+        bump("mapping")
+
+        for obj in objs:
+            if obj.coverage_id in existing:
+                summary["updated"] += 1
+                updated_ids.append(obj.pk)
+            else:
+                summary["created"] += 1
+                created_ids.append(obj.pk)
+
+    if return_ids:
+        summary["created_ids"] = created_ids
+        summary["updated_ids"] = updated_ids
+    return summary
+
+
+def import_mapping_sheet(file, sheet_name, ip, return_ids=False, progress=None):
+    """
+    Imports one worksheet of a VPD workbook as the coverage mappings of an IP.
+    progress is passed on to read_mapping_sheet and called once more before
+    the rows are written.
+    """
+    df = read_mapping_sheet(file, sheet_name, progress=progress)
+    total = len(df)
+    df, invalid, duplicates = clean_mapping_frame(df)
+    if progress:
+        progress(total, processed=total, total=total, error_rows=invalid)
+
+    with transaction.atomic():
+        summary = upsert_mappings(df, ip, return_ids=return_ids)
+
+    summary.update({"total_rows": total, "invalid_rows": invalid, "duplicate_rows": duplicates})
+    return summary
+
+
+def import_mapping_workbook(path, sheets=None, return_ids=False, processes=1, progress=None):
+    """
+    Imports several worksheets of the VPD workbook at path, each as the
+    mappings of an IP. sheets is {sheet name: ip}; without it every sheet
+    with the mapping columns is imported for the IP it is named after.
+    Sheets are parsed in up to processes worker processes, then all of them
+    are written in one transaction. progress(rows, processed=sheets parsed,
+    total=sheets) is called as sheets are parsed.
+    """
+    names = sheet_names(path)
+    explicit = sheets is not None
+    if explicit:
+        unknown = [name for name in sheets if name not in names]
+        if unknown:
+            raise ValueError(f"Worksheet(s) not found: {', '.join(unknown)}")
+        if len(set(sheets.values())) < len(sheets):
+            raise ValueError("Every sheet has to map to a different IP")
+    else:
+        sheets = {name: name.strip() for name in names}
+
+    parsed = {"sheets": 0, "rows": 0}
+
+    def done(name, frame):
+        parsed["sheets"] += 1
+        if not isinstance(frame, MissingColumns):
+            parsed["rows"] += len(frame)
+        if progress:
+            progress(parsed["rows"], processed=parsed["sheets"], total=len(sheets))
+
+    frames = read_mapping_sheets(path, list(sheets), processes=processes, done=done)
+    if all(isinstance(frame, MissingColumns) for frame in frames.values()):
+        raise ValueError("No worksheet has the VPD_ID and Coverage Event Mapping columns")
+
+    report = {"sheets": {}, "skipped_sheets": {}}
+    with transaction.atomic():
+        for name, ip in sheets.items():
+            frame = frames[name]
+            if isinstance(frame, MissingColumns):
+                # Named sheets have to be mapping sheets, others may be notes and the like
+                if explicit:
+                    raise ValueError(f"{name}: {frame}")
+                report["skipped_sheets"][name] = str(frame)
+                continue
+            total = len(frame)
+            frame, invalid, duplicates = clean_mapping_frame(frame)
+            summary = upsert_mappings(frame, ip, return_ids=return_ids)
+            summary.update({"ip": ip, "total_rows": total, "invalid_rows": invalid, "duplicate_rows": duplicates})
+            report["sheets"][name] = summary
+
+    report.update({key: sum(summary[key] for summary in report["sheets"].values()) for key in MAPPING_COUNTS})
+    return report
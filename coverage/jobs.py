@@ -0,0 +1,342 @@
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .ingest import import_mapping_sheet, import_mapping_workbook, ingest_coverage_csv, sync_coverage_csv
+from .models import UploadJob
+
+logger = logging.getLogger(__name__)
+
+# "thread" runs jobs on a pool in the web process, "queue" leaves them to
+# run_upload_jobs workers, "inline" runs them inside the upload request
+RUNNERS = ("thread", "queue", "inline")
+# Seconds between progress writes of a running job
+PROGRESS_INTERVAL_S = 0.5
+# Claims of a job before it is given up on (a worker died on it every time)
+MAX_ATTEMPTS = 3
+# Heartbeats per UPLOAD_JOB_STALE_AFTER sent while a job runs, progress or not
+HEARTBEATS_PER_STALE_PERIOD = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+# Drains submitted to the pool that haven't started yet
+_waiting_drains = 0
+
+
+def spool(upload, kind):
+    """
+    Puts an uploaded file into UPLOAD_SPOOL_DIR and returns its path. Uploads
+    Django already wrote to a temporary file are moved there, not copied.
+    """
+    directory = Path(settings.UPLOAD_SPOOL_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{kind}-{uuid.uuid4().hex}"
+    if hasattr(upload, "temporary_file_path"):
+        shutil.move(upload.temporary_file_path(), path)
+    else:
+        with open(path, "wb") as spooled:
+            for chunk in upload.chunks():
+                spooled.write(chunk)
+    return path
+
+
+def enqueue(kind, upload, **options):
+    """
+    Spools upload and queues a job for it. With the "inline" runner the
+    job has run by the time this returns.
+    """
+    runner = settings.UPLOAD_JOB_RUNNER
+    if runner not in RUNNERS:
+        raise ImproperlyConfigured(f"UPLOAD_JOB_RUNNER must be one of {RUNNERS}, not {runner!r}")
+    job = UploadJob.objects.create(
+        kind=kind, filename=(upload.name or "")[:255], path=str(spool(upload, kind)), options=options,
+    )
+    if runner == "inline":
+        claimed = claim(job.pk)
+        if claimed is not None:
+            run(claimed)
+        job.refresh_from_db()
+    elif runner == "thread":
+        # The pool's connections only see the job once it is committed
+        transaction.on_commit(kick)
+    return job
+
+
+def kick():
+    """
+    With the "thread" runner, has the pool requeue stale jobs and run the
+    queued ones, unless a drain is waiting to start already.
+    """
+    global _waiting_drains
+    if settings.UPLOAD_JOB_RUNNER != "thread":
+        return
+    executor = _get_executor()
+    with _executor_lock:
+        if _waiting_drains:
+            return
+        _waiting_drains += 1
+    executor.submit(_drain_in_thread)
+
+
+def claim(pk=None):
+    """
+    Marks the oldest queued job (or job pk, if still queued) as running and
+    returns it; None when there is nothing to claim. Rows being claimed
+    elsewhere are skipped, so any number of workers can share the table.
+    """
+    with transaction.atomic():
+        jobs = UploadJob.objects.select_for_update(skip_locked=True).filter(status=UploadJob.QUEUED)
+        if pk is not None:
+            jobs = jobs.filter(pk=pk)
+        job = jobs.order_by("id").first()
+        if job is None:
+            return None
+        job.attempts += 1
+        job.status = UploadJob.RUNNING
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.save(update_fields=["attempts", "status", "started_at", "heartbeat_at"])
+        return job
+
+
+def _stale_before():
+    return timezone.now() - timedelta(seconds=settings.UPLOAD_JOB_STALE_AFTER)
+
+
+def is_stale(job):
+    """
+    Whether job is running without a heartbeat for UPLOAD_JOB_STALE_AFTER.
+    """
+    return job.status == UploadJob.RUNNING and job.heartbeat_at is not None and job.heartbeat_at < _stale_before()
+
+
+def requeue_stale():
+    """
+    Puts running jobs whose worker stopped sending heartbeats back in the
+    queue, or fails them after MAX_ATTEMPTS. Returns the number requeued.
+    """
+    stale = UploadJob.objects.filter(status=UploadJob.RUNNING, heartbeat_at__lt=_stale_before())
+    given_up = list(stale.filter(attempts__gte=MAX_ATTEMPTS).values_list("pk", "path"))
+    UploadJob.objects.filter(pk__in=[pk for pk, _ in given_up], status=UploadJob.RUNNING).update(
+        status=UploadJob.FAILED, error="The job stopped responding too many times", finished_at=timezone.now(),
+    )
+    for _, path in given_up:
+        _remove_spooled(path)
+    return stale.update(status=UploadJob.QUEUED)
+
+
+def _owned(job):
+    """
+    The job's row while it is still running under this claim of it: a job
+    requeued (or given up on) meanwhile belongs to another attempt.
+    """
+    return UploadJob.objects.filter(pk=job.pk, attempts=job.attempts, status=UploadJob.RUNNING)
+
+
+def _remove_spooled(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class Heartbeat:
+    """
+    Touches the heartbeat of a running job from a thread of its own, so a
+    job stays live through the phases that report no progress (the diff and
+    write of a coverage sync, the write of a workbook).
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.beat, name=f"upload-job-{job.pk}-heartbeat", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def beat(self):
+        interval = max(1, settings.UPLOAD_JOB_STALE_AFTER / HEARTBEATS_PER_STALE_PERIOD)
+        try:
+            while not self.stopped.wait(interval):
+                _owned(self.job).update(heartbeat_at=timezone.now())
+        except Exception:
+            logger.exception("Heartbeat of upload job %s failed", self.job.pk)
+        finally:
+            connection.close()
+
+
+class JobProgress:
+    """
+    progress callback for the ingest functions: keeps the latest counters on
+    the job and writes them (with a heartbeat) every PROGRESS_INTERVAL_S.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.saved = time.monotonic()
+
+    def __call__(self, rows, processed=None, total=None, error_rows=0, errors=()):
+        job = self.job
+        job.rows = rows
+        job.error_rows = error_rows
+        job.errors = list(errors)
+        if processed is not None:
+            job.processed = processed
+        if total is not None:
+            job.total = total
+        if time.monotonic() - self.saved >= PROGRESS_INTERVAL_S:
+            self.save()
+
+    def save(self):
+        job = self.job
+        job.heartbeat_at = timezone.now()
+        _owned(job).update(rows=job.rows, error_rows=job.error_rows, errors=job.errors, processed=job.processed,
+                           total=job.total, heartbeat_at=job.heartbeat_at)
+        self.saved = time.monotonic()
+
+
+def run(job):
+    """
+    Processes a claimed job and records its summary, or its error, unless
+    the job was requeued meanwhile: then the attempt that claimed it next
+    owns both the row and the spooled file. Otherwise the spooled file is
+    removed either way.
+    """
+    progress = JobProgress(job)
+    options = job.options
+    try:
+        with Heartbeat(job):
+            if job.kind == UploadJob.MAPPING and "sheet_name" not in options:
+                # A workbook of sheets (options["sheets"] maps them to IPs, or they are named after them)
+                result = import_mapping_workbook(
+                    job.path, options.get("sheets"), return_ids=options.get("return_ids", False),
+                    processes=settings.MAPPING_IMPORT_PROCESSES, progress=progress,
+                )
+            else:
+                with open(job.path, "rb") as file:
+                    if job.kind == UploadJob.COVERAGE:
+                        job.total = os.fstat(file.fileno()).st_size
+                        progress.save()
+                        if options.get("mode") == "sync":
+                            result = sync_coverage_csv(file, delete=options.get("delete", False),
+                                                       dry_run=options.get("dry_run", False), progress=progress)
+                        else:
+                            result = ingest_coverage_csv(file, progress=progress)
+                    else:
+                        result = import_mapping_sheet(file, options["sheet_name"], options["ip"],
+                                                      return_ids=options.get("return_ids", False), progress=progress)
+    except Exception as e:
+        # Bad input (ValueError) is for the uploader to fix, anything else gets a traceback
+        if isinstance(e, ValueError):
+            logger.warning("Upload job %s rejected: %s", job.pk, e)
+        else:
+            logger.exception("Upload job %s failed", job.pk)
+        job.status, job.error = UploadJob.FAILED, str(e)
+    else:
+        job.status, job.result = UploadJob.SUCCEEDED, result
+
+    job.finished_at = job.heartbeat_at = timezone.now()
+    fields = ["status", "result", "error", "rows", "error_rows", "errors", "processed", "total",
+              "finished_at", "heartbeat_at"]
+    if _owned(job).update(**{field: getattr(job, field) for field in fields}):
+        _remove_spooled(job.path)
+    else:
+        logger.warning("Upload job %s was requeued while attempt %s ran, its outcome is dropped",
+                       job.pk, job.attempts)
+        job.refresh_from_db()
+    return job
+
+
+def drain():
+    """
+    Runs queued jobs one after another until there are none left.
+    Returns the number run.
+    """
+    count = 0
+    while (job := claim()) is not None:
+        run(job)
+        count += 1
+    return count
+
+
+def _drain_in_thread():
+    global _waiting_drains
+    with _executor_lock:
+        _waiting_drains -= 1
+    try:
+        # Jobs of a web process that restarted mid-job (or before its
+        # on_commit submit ran) are only picked up again from here
+        requeue_stale()
+        drain()
+    except Exception:
+        logger.exception("Draining upload jobs failed")
+    finally:
+        # Uploads are rare, the pool threads don't keep a connection open in between
+        connection.close()
+
+
+def _watch():
+    # Runs as long as the process, the pool is drained every half stale period
+    while True:
+        time.sleep(max(1, settings.UPLOAD_JOB_STALE_AFTER / 2))
+        kick()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.UPLOAD_JOB_WORKERS), thread_name_prefix="upload-job"
+            )
+            threading.Thread(target=_watch, name="upload-job-watch", daemon=True).start()
+        return _executor
+
+
+def job_status(job, request=None):
+    """
+    The status endpoint's view of a job: progress, throughput, row errors
+    and, once it is done, the summary (or the error).
+    """
+    end = job.finished_at or timezone.now()
+    elapsed = (end - job.started_at).total_seconds() if job.started_at else 0
+    url = reverse("upload-job", args=[job.pk])
+    return {
+        "id": job.pk,
+        "kind": job.kind,
+        "status": job.status,
+        "filename": job.filename,
+        "status_url": request.build_absolute_uri(url) if request else url,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "progress": {
+            "processed": job.processed,
+            "total": job.total,
+            "percent": round(100 * job.processed / job.total, 1) if job.total else None,
+            "rows": job.rows,
+            "rows_per_sec": round(job.rows / elapsed) if elapsed else None,
+            "elapsed_s": round(elapsed, 1),
+        },
+        "error_rows": job.error_rows,
+        "errors": job.errors,
+        "result": job.result,
+        "error": job.error or None,
+    }
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from project.models import dynamic_models
+from coverage.rollup import rebuild_event_rollup, refresh_event_rollup
+
+
+class Command(BaseCommand):
+    help = "Fold new telemetry rows into the coverage hit rollup (or rebuild it from scratch)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tool", action="append", dest="tools",
+                            help="Only refresh this tool table. Can be repeated.")
+        parser.add_argument("--rebuild", action="store_true",
+                            help="Drop the rollup rows and recount from id 0.")
+
+    def handle(self, *args, **options):
+        tools = options["tools"]
+        unknown = [t for t in tools or [] if t not in dynamic_models]
+        if unknown:
+            raise CommandError(f"Unknown tool(s): {', '.join(unknown)}")
+
+        if options["rebuild"]:
+            folded = rebuild_event_rollup(tools)
+        else:
+            folded = refresh_event_rollup(tools)
+
+        for tool, id_range in folded.items():
+            self.stdout.write(f"{tool}: watermark advanced by {id_range} ids")
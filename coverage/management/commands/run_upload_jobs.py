@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from coverage.jobs import claim, requeue_stale, run
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued bulk upload jobs (UPLOAD_JOB_RUNNER=queue). Run as many of these as "
+        "uploads should be processed at once; each claims its own jobs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true",
+                            help="Exit once the queue is empty instead of waiting for new jobs.")
+        parser.add_argument("--poll", type=float, default=2.0,
+                            help="Seconds to wait between looks at an empty queue.")
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = requeue_stale()
+            if requeued:
+                self.stderr.write(f"requeued {requeued} job(s) that stopped responding")
+
+            job = claim()
+            if job is not None:
+                job = run(job)
+                self.stdout.write(f"job {job.pk} ({job.kind}, {job.filename}): {job.status}")
+                continue
+            if options["once"]:
+                return
+            # Don't hold a connection open while idle
+            connection.close()
+            time.sleep(options["poll"])
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coverage', '0002_coveragemapping'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventHitRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tool', models.CharField(max_length=100)),
+                ('event_id', models.CharField(max_length=100)),
+                ('ip', models.CharField(max_length=200)),
+                ('project_name', models.CharField(max_length=100)),
+                ('stepping', models.CharField(max_length=100)),
+                ('hits', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ip', 'event_id'], name='rollup_ip_event_idx'), models.Index(fields=['project_name', 'stepping'], name='rollup_project_stepping_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tool', 'event_id', 'ip', 'project_name', 'stepping'), name='unique_event_hit_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def explode_mappings(apps, schema_editor):
+    CoverageMapping = apps.get_model('coverage', 'CoverageMapping')
+    CoverageMappingEvent = apps.get_model('coverage', 'CoverageMappingEvent')
+
+    batch = []
+    for mapping_id, coverage_mapping in CoverageMapping.objects.values_list('id', 'coverage_mapping').iterator():
+        events = [e.strip() for e in (coverage_mapping or "").split(",") if e.strip()]
+        batch.extend(
+            CoverageMappingEvent(mapping_id=mapping_id, event_id=event_id, position=position)
+            for position, event_id in enumerate(events)
+        )
+        if len(batch) >= 5000:
+            CoverageMappingEvent.objects.bulk_create(batch)
+            batch = []
+    CoverageMappingEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coverage', '0003_eventhitrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoverageMappingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=500)),
+                ('position', models.PositiveIntegerField()),
+                ('mapping', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='coverage.coveragemapping')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['event_id'], name='mapping_event_idx')],
+                'constraints': [models.UniqueConstraint(fields=('mapping', 'position'), name='unique_mapping_position')],
+            },
+        ),
+        migrations.RunPython(explode_mappings, migrations.RunPython.noop),
+    ]
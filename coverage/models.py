@@ -23,4 +23,114 @@ class CoverageMapping(models.Model):
         constraints = [
             models. UniqueConstraint(fields = ['coverage_id' , 'ip'] , name = "combined_primary")
         ]
-        
\ No newline at end of file
+
+    @staticmethod
+    def split_mapping(coverage_mapping):
+        # coverage_mapping is a comma-separated list of event_ids
+        return [e.strip() for e in (coverage_mapping or "").split(",") if e.strip()]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        CoverageMappingEvent.sync([self])
+
+
+class CoverageMappingEvent(models.Model):
+    """
+    One row per event of a CoverageMapping, in mapping order.
+    Written together with the mapping so reads never split coverage_mapping.
+    """
+    mapping = models.ForeignKey(CoverageMapping, on_delete=models.CASCADE, related_name="events")
+    event_id = models.CharField(max_length=500)
+    position = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['mapping', 'position'], name="unique_mapping_position")
+        ]
+        indexes = [
+            models.Index(fields=['event_id'], name="mapping_event_idx"),
+        ]
+
+    @classmethod
+    def sync(cls, mappings):
+        """
+        Re-explodes coverage_mapping of the given (saved) mappings into event rows.
+        """
+        mappings = [m for m in mappings if m.pk]
+        if not mappings:
+            return
+        cls.objects.filter(mapping__in=[m.pk for m in mappings]).delete()
+        cls.objects.bulk_create([
+            cls(mapping_id=m.pk, event_id=event_id, position=position)
+            for m in mappings
+            for position, event_id in enumerate(CoverageMapping.split_mapping(m.coverage_mapping))
+        ])
+
+
+class EventHitRollup(models.Model):
+    """
+    Telemetry hit counts pre-aggregated per tool, event, ip, project and stepping.
+    Kept up to date by coverage.rollup.refresh_event_rollup.
+    """
+    tool = models.CharField(max_length=100)
+    event_id = models.CharField(max_length=100)
+    ip = models.CharField(max_length=200)
+    project_name = models.CharField(max_length=100)
+    stepping = models.CharField(max_length=100)
+    hits = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tool', 'event_id', 'ip', 'project_name', 'stepping'],
+                name="unique_event_hit_rollup",
+            )
+        ]
+        indexes = [
+            models.Index(fields=['ip', 'event_id'], name="rollup_ip_event_idx"),
+            models.Index(fields=['project_name', 'stepping'], name="rollup_project_stepping_idx"),
+        ]
+
+
+class UploadJob(models.Model):
+    """
+    A bulk upload accepted by the API and processed in the background by
+    coverage.jobs. The file waits in the spool directory; progress, row
+    errors and the final summary are kept here for the status endpoint.
+    """
+    COVERAGE = "coverage"
+    MAPPING = "mapping"
+    KINDS = [(COVERAGE, "Coverage CSV"), (MAPPING, "Coverage mapping worksheet")]
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUSES = [(QUEUED, "Queued"), (RUNNING, "Running"), (SUCCEEDED, "Succeeded"), (FAILED, "Failed")]
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    status = models.CharField(max_length=20, choices=STATUSES, default=QUEUED)
+    filename = models.CharField(max_length=255, blank=True)
+    path = models.CharField(max_length=1000)
+    # mode / delete / dry_run of a coverage upload, sheet_name / ip (or sheets) / return_ids of a mapping upload
+    options = models.JSONField(default=dict, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    # processed out of total: bytes of a CSV, rows of a worksheet, sheets of a workbook
+    processed = models.BigIntegerField(default=0)
+    total = models.BigIntegerField(null=True, blank=True)
+    rows = models.BigIntegerField(default=0)
+    error_rows = models.BigIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name="upload_job_status_idx"),
+        ]
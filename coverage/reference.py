@@ -0,0 +1,132 @@
+"""
+Process-local snapshots of the reference data the read views look up on
+every request: Coverage (thresholds per event and IP) and CoverageMapping
+(with its events). Each is loaded in one query the first time it is needed
+and kept until its change counter (see core.versioning) moves. Inside a
+data_etag view that check costs nothing, the counters were read for the
+ETag already.
+
+Snapshots are never changed once built: a reload builds a new one and
+swaps it in, readers holding the old one carry on with it.
+"""
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+from core.versioning import counters
+from .models import Coverage, CoverageMapping
+
+# One mapping with its events (CoverageMappingEvent), in mapping order
+MappingEntry = namedtuple("MappingEntry", ["id", "ip", "coverage_id", "coverage_mapping", "event_ids"])
+
+
+class CoverageIndex:
+    """
+    Coverage as (event_id, ip) -> threshold, and the (ip, threshold) rows of
+    every event. Events are kept in database order, rows in id order.
+    """
+
+    def __init__(self, version, rows):
+        self.version = version
+        by_event = {}
+        thresholds = {}
+        for event_id, ip, threshold in rows:
+            by_event.setdefault(event_id, []).append((ip, threshold))
+            thresholds[(event_id, ip)] = threshold
+        self.event_ids = tuple(by_event)
+        self.by_event = MappingProxyType({event_id: tuple(ips) for event_id, ips in by_event.items()})
+        self.thresholds = MappingProxyType(thresholds)
+        self.known_events = frozenset(by_event)
+        # event_id__iexact without the database
+        upper = {}
+        for event_id in self.event_ids:
+            upper.setdefault(event_id.upper(), []).append(event_id)
+        self._upper = MappingProxyType({key: tuple(ids) for key, ids in upper.items()})
+
+    @classmethod
+    def load(cls, version):
+        rows = Coverage.objects.order_by("event_id", "id").values_list("event_id", "ip", "threshold")
+        return cls(version, rows)
+
+    def matching(self, events):
+        """
+        event_ids matching any of events case-insensitively, in database order.
+        """
+        matched = {event_id for event in events for event_id in self._upper.get(event.upper(), ())}
+        return [event_id for event_id in self.event_ids if event_id in matched]
+
+
+class MappingIndex:
+    """
+    CoverageMapping entries by IP (in id order) and by coverage_id. IPs are
+    kept in database order.
+    """
+
+    def __init__(self, version, rows):
+        self.version = version
+        entries = {}
+        events = {}
+        for pk, ip, coverage_id, coverage_mapping, event_id in rows:
+            if pk not in entries:
+                entries[pk] = (ip, coverage_id, coverage_mapping)
+                events[pk] = []
+            if event_id is not None:  # mapping without events
+                events[pk].append(event_id)
+        by_ip = {}
+        by_coverage_id = {}
+        for pk, (ip, coverage_id, coverage_mapping) in entries.items():
+            entry = MappingEntry(pk, ip, coverage_id, coverage_mapping, tuple(events[pk]))
+            by_ip.setdefault(ip, []).append(entry)
+            by_coverage_id.setdefault(coverage_id, []).append(entry)
+        self.ips = tuple(by_ip)
+        self.by_ip = MappingProxyType({ip: tuple(mappings) for ip, mappings in by_ip.items()})
+        self.by_coverage_id = MappingProxyType({key: tuple(mappings) for key, mappings in by_coverage_id.items()})
+        self.entries = tuple(sorted((entry for mappings in self.by_ip.values() for entry in mappings),
+                                    key=lambda entry: entry.id))
+
+    @classmethod
+    def load(cls, version):
+        rows = (
+            CoverageMapping.objects.order_by("ip", "id", "events__position")
+            .values_list("id", "ip", "coverage_id", "coverage_mapping", "events__event_id")
+        )
+        return cls(version, rows)
+
+
+class Snapshot:
+    """
+    The current index of a change counter scope, reloaded when the counter
+    has moved since it was built.
+    """
+
+    def __init__(self, scope, index_class):
+        self.scope = scope
+        self.index_class = index_class
+        self.index = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        # Read before the data, so a write in between only makes the next request reload
+        version = counters(self.scope)[self.scope]
+        index = self.index
+        if index is not None and index.version == version:
+            return index
+        with self.lock:
+            # Another thread may have loaded it while this one waited
+            index = self.index
+            if index is None or index.version != version:
+                index = self.index_class.load(version)
+                self.index = index
+        return index
+
+
+_coverage = Snapshot("coverage", CoverageIndex)
+_mappings = Snapshot("mapping", MappingIndex)
+
+
+def coverage_index():
+    return _coverage.get()
+
+
+def mapping_index():
+    return _mappings.get()
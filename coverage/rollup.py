@@ -0,0 +1,75 @@
+from django.db import connection, transaction
+
+from core.fanout import fan_out
+from project import watermarks
+from project.models import dynamic_models
+from .models import EventHitRollup
+
+ROLLUP_CONSUMER = "event_hit_rollup"
+
+
+def _fold_sql(tool, ids):
+    """
+    INSERT ... SELECT that groups the tool rows matching ids and adds
+    their counts onto the existing rollup rows.
+    """
+    qn = connection.ops.quote_name
+    model, eid_field, ip_field = tool.model, tool.eid_field, tool.ip_field
+    eid = qn(model._meta.get_field(eid_field).column)
+    ip = qn(model._meta.get_field(ip_field).column)
+    rollup = qn(EventHitRollup._meta.db_table)
+
+    return f"""
+        INSERT INTO {rollup} (tool, event_id, ip, project_name, stepping, hits)
+        SELECT %(tool)s, {eid}, {ip}, COALESCE(project_name, ''), COALESCE(stepping, ''), COUNT(*)
+        FROM {qn(model._meta.db_table)}
+        WHERE {ids}
+          AND {eid} IS NOT NULL AND {eid} <> ''
+          AND {ip} IS NOT NULL AND {ip} <> ''
+        GROUP BY {eid}, {ip}, COALESCE(project_name, ''), COALESCE(stepping, '')
+        ON CONFLICT (tool, event_id, ip, project_name, stepping)
+        DO UPDATE SET hits = {rollup}.hits + EXCLUDED.hits
+    """
+
+
+def _refresh_tool(tool, wait):
+    if not tool.ip_field:
+        return 0
+    return watermarks.fold(ROLLUP_CONSUMER, tool, _fold_sql, wait)
+
+
+def refresh_tools(tools=None, wait=True, timeout=None):
+    """
+    Folds every tool concurrently (see core.fanout).
+    Returns ({tool: ids advanced}, [tools that ran past timeout and were left as they were]).
+    """
+    return fan_out({
+        tool.name: (lambda tool=tool: _refresh_tool(tool, wait))
+        for tool in dynamic_models.tools()
+        if not tools or tool.name in tools
+    }, timeout=timeout)
+
+
+def refresh_event_rollup(tools=None, wait=True):
+    """
+    Folds tool rows above each tool's watermark into EventHitRollup.
+    Returns {tool: number of ids the watermark advanced}.
+    """
+    folded, _ = refresh_tools(tools, wait)
+    return folded
+
+
+def rebuild_event_rollup(tools=None):
+    """
+    Drops the rollup rows of the given tools and recounts them from scratch.
+    Runs in one transaction so readers keep seeing the old counts until it commits.
+    """
+    folded = {}
+    with transaction.atomic():
+        for tool in dynamic_models.tools():
+            if tools and tool.name not in tools:
+                continue
+            watermarks.reset(ROLLUP_CONSUMER, tool)
+            EventHitRollup.objects.filter(tool=tool.name).delete()
+            folded[tool.name] = _refresh_tool(tool, wait=True)
+    return folded
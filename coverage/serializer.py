@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Coverage, CoverageMapping
+from .reference import MappingEntry, coverage_index
 
 class CoverageSerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,14 +15,17 @@ class CoverageMappingSerializer(serializers.ModelSerializer):
         fields = ["coverage_id", "coverage_mapping", "ip", "matched_events"]
 
     def get_matched_events(self, obj):
-       
-        events = [e.strip() for e in obj.coverage_mapping.split(",") if e.strip()]
+        # Snapshot entries (see coverage.reference) come with their events split
+        events = obj.event_ids if isinstance(obj, MappingEntry) else CoverageMapping.split_mapping(obj.coverage_mapping)
+        known_events = self.context.get("known_events")
+        if known_events is None:
+            # Once per serialization, the context is shared by every mapping of a list
+            known_events = self.context["known_events"] = coverage_index().known_events
 
         matched = []
         for event in events:
-            exists = Coverage.objects.filter(event_id=event).exists()
             matched.append({
                 "event": event,
-                "is_matched": exists
+                "is_matched": event in known_events
             })
         return matched
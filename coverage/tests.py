@@ -1,3 +1,533 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from asgiref.sync import sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from project.models import TelemetryWatermark, dynamic_models
+from project.tests import LateCommitTestCase, ToolTableTestCase
+from . import async_views, jobs
+from .jobs import requeue_stale
+from .models import Coverage, CoverageMapping, CoverageMappingEvent, EventHitRollup, UploadJob
+from .rollup import ROLLUP_CONSUMER, refresh_event_rollup
+
+
+class CoverageMappingListTests(TestCase):
+    def add_mappings(self, count, ip="ip0"):
+        for i in range(count):
+            CoverageMapping.objects.create(
+                ip=ip,
+                coverage_id=f"VPD-{ip}-{CoverageMapping.objects.count()}",
+                coverage_mapping=f"EV{i}, EV{i + 1},MISSING{i}",
+            )
+
+    def test_matched_events(self):
+        Coverage.objects.create(event_id="EV0", event_name="ev0", event_type="t", ip="ip0")
+        self.add_mappings(1)
+
+        response = self.client.get(reverse("coverage-mapping-list"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]["matched_events"], [
+            {"event": "EV0", "is_matched": True},
+            {"event": "EV1", "is_matched": False},
+            {"event": "MISSING0", "is_matched": False},
+        ])
+
+    def test_query_count_does_not_grow_with_mappings(self):
+        for i in range(30):
+            Coverage.objects.create(event_id=f"EV{i}", event_name=f"ev{i}", event_type="t", ip="ip0")
+
+        # data version + reloading the mapping snapshot, however many mappings there are
+        self.add_mappings(1)
+        self.client.get(reverse("coverage-mapping-list"))  # loads the Coverage snapshot too
+        self.add_mappings(25)
+        self.add_mappings(25, ip="ip1")
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("coverage-mapping-list"))
+        self.assertEqual(len(response.json()), 51)
+
+        # Nothing changed: only the data version
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("coverage-mapping-list"), {"ip": "ip1"})
+        self.assertEqual(len(response.json()), 25)
+
+
+class CoverageListTests(ToolTableTestCase):
+    def setUp(self):
+        for i in range(5):
+            Coverage.objects.create(event_id=f"EV{i}", event_name=f"ev{i}", event_type="t", ip="ip0")
+
+    def test_unpaginated_by_default(self):
+        response = self.client.get("/coverage/")
+        self.assertEqual(len(response.json()), 5)
+        self.assertEqual(response.json()[0]["event_count"], 0)
+
+    def test_keyset_pages(self):
+        body = self.client.get("/coverage/", {"page_size": 2}).json()
+        ids = [row["event_id"] for row in body["results"]]
+        while body["next"]:
+            body = self.client.get(body["next"]).json()
+            ids.extend(row["event_id"] for row in body["results"])
+        self.assertEqual(ids, [f"EV{i}" for i in range(5)])
+
+    def test_stream(self):
+        response = self.client.get("/coverage/", {"stream": "1"})
+        rows = json.loads(b"".join(response.streaming_content))
+        self.assertEqual([row["event_id"] for row in rows], [f"EV{i}" for i in range(5)])
+        self.assertTrue(all(row["event_count"] == 0 for row in rows))
+
+
+class UploadJobTestCase(TestCase):
+    def setUp(self):
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        settings = override_settings(UPLOAD_SPOOL_DIR=spool.name, UPLOAD_JOB_RUNNER="inline")
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.spool = spool.name
+
+    def job(self, response):
+        """
+        The job of an upload response, as the status endpoint has it.
+        """
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response["Location"], response.json()["status_url"])
+        return self.client.get(response["Location"]).json()
+
+
+class CoverageBulkUploadTests(UploadJobTestCase):
+    def upload(self, content, encoding="utf-8"):
+        file = SimpleUploadedFile("coverage.csv", content.encode(encoding), content_type="text/csv")
+        return self.client.post(reverse("coverage-bulk-upload"), {"file": file})
+
+    def test_inserts_new_rows_and_reports_bad_ones(self):
+        Coverage.objects.create(event_id="EV0", event_name="old", event_type="t", ip="ip0", threshold=1)
+
+        response = self.upload(
+            "event_id,event_name,event_type,ip,threshold\n"
+            "EV0,new,t,ip0,5\n"
+            "EV1,ev1,t,ip0,3\n"
+            ",no id,t,ip0,3\n"
+            "EV2,ev2,t,ip0,lots\n"
+            "EV3,\u00e9v\u00e9nement,t,ip0,\n"
+            "EV1,dup,t,ip0,9\n",
+            encoding="latin-1",
+        )
+
+        job = self.job(response)
+        self.assertEqual(job["status"], "succeeded")
+        self.assertEqual(job["progress"]["rows"], 6)
+        self.assertEqual(job["progress"]["percent"], 100.0)
+        self.assertEqual(job["error_rows"], 1)
+        body = job["result"]
+        self.assertEqual(len(body["inserted_ids"]), 2)
+        self.assertEqual(body["skipped_rows"], 1)
+        self.assertEqual(body["total_rows"], 6)
+        self.assertEqual(body["errors"], [{"row": 5, "error": "threshold 'lots' is not an integer"}])
+        # existing and repeated (event_id, ip) pairs keep their first values
+        self.assertEqual(Coverage.objects.get(event_id="EV0").event_name, "old")
+        self.assertEqual(Coverage.objects.get(event_id="EV1").threshold, 3)
+        self.assertEqual(Coverage.objects.get(event_id="EV3").event_name, "\u00e9v\u00e9nement")
+        # The spooled file is gone once the job is done
+        self.assertEqual(os.listdir(self.spool), [])
+
+    def test_sync_writes_only_the_difference(self):
+        for event_id, threshold in (("EV0", 1), ("EV1", 2), ("EV2", 3), ("EV4", 4)):
+            Coverage.objects.create(event_id=event_id, event_name=event_id, event_type="t", ip="ip0", threshold=threshold)
+        content = (
+            "event_id,event_name,event_type,ip,threshold\n"
+            "EV0,EV0,t,ip0,10\n"
+            "EV1,EV1,t,ip0,2\n"
+            "EV3,EV3,t,ip0,5\n"
+            "EV4,EV4,t,ip0,lots\n"
+            "EV3,EV3,t,ip0,6\n"
+        )
+        file = SimpleUploadedFile("coverage.csv", content.encode())
+        preview = self.job(self.client.post(reverse("coverage-bulk-upload"), {
+            "file": file, "mode": "sync", "delete": "true", "dry_run": "true",
+        }))["result"]
+        self.assertEqual(
+            (preview["inserted"], preview["updated"], preview["deleted"], preview["unchanged"], preview["duplicate_rows"]),
+            (1, 1, 1, 1, 1),
+        )
+        self.assertEqual(preview["preview"]["updates"][0]["to"]["threshold"], 10)
+        self.assertEqual(preview["preview"]["deletes"][0]["event_id"], "EV2")
+        self.assertEqual(Coverage.objects.get(event_id="EV0").threshold, 1)
+
+        file = SimpleUploadedFile("coverage.csv", content.encode())
+        with CaptureQueriesContext(connection) as queries:
+            result = self.job(self.client.post(reverse("coverage-bulk-upload"), {
+                "file": file, "mode": "sync", "delete": "true",
+            }))["result"]
+        self.assertNotIn("preview", result)
+        writes = [q["sql"].split()[0] for q in queries if q["sql"].split()[0] in ("INSERT", "UPDATE", "DELETE")
+                  and '"coverage_coverage"' in q["sql"]]
+        self.assertEqual(sorted(writes), ["DELETE", "INSERT", "UPDATE"])
+        self.assertEqual(
+            dict(Coverage.objects.values_list("event_id", "threshold")),
+            # EV4's row was rejected, not left out: it stays as it was
+            {"EV0": 10, "EV1": 2, "EV3": 6, "EV4": 4},
+        )
+
+    @override_settings(UPLOAD_JOB_RUNNER="queue")
+    def test_queued_until_a_worker_runs_it(self):
+        response = self.upload("event_id,event_name,event_type,ip,threshold\nEV1,ev1,t,ip0,3\n")
+        self.assertEqual(self.job(response)["status"], "queued")
+        self.assertFalse(Coverage.objects.exists())
+
+        call_command("run_upload_jobs", "--once", stdout=io.StringIO())
+
+        job = self.job(response)
+        self.assertEqual(job["status"], "succeeded")
+        self.assertEqual(job["result"]["total_rows"], 1)
+        self.assertTrue(Coverage.objects.filter(event_id="EV1").exists())
+
+    def test_stale_jobs_are_queued_again(self):
+        job = UploadJob.objects.create(kind=UploadJob.COVERAGE, path="gone", status=UploadJob.RUNNING,
+                                       attempts=1, heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, UploadJob.QUEUED)
+
+    def test_a_requeued_run_leaves_the_job_to_its_next_attempt(self):
+        path = os.path.join(self.spool, "coverage-requeued")
+        with open(path, "w") as file:
+            file.write("event_id,event_name,event_type,ip,threshold\nEV1,ev1,t,ip0,3\n")
+        job = UploadJob.objects.create(kind=UploadJob.COVERAGE, path=path, status=UploadJob.QUEUED)
+        job = jobs.claim(job.pk)
+
+        def requeued_and_claimed_again(*args, **kwargs):
+            UploadJob.objects.filter(pk=job.pk).update(status=UploadJob.QUEUED)
+            jobs.claim(job.pk)
+            return {"inserted": 1}
+
+        with mock.patch("coverage.jobs.ingest_coverage_csv", side_effect=requeued_and_claimed_again):
+            jobs.run(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.result), (UploadJob.RUNNING, 2, None))
+        # The next attempt still needs the file
+        self.assertTrue(os.path.exists(path))
+
+    @override_settings(UPLOAD_JOB_STALE_AFTER=4)
+    def test_heartbeats_without_progress(self):
+        job = UploadJob(pk=1, attempts=1)
+        with mock.patch("coverage.jobs._owned") as owned, mock.patch("coverage.jobs.connection"):
+            with jobs.Heartbeat(job):
+                time.sleep(1.5)
+        owned.assert_called_with(job)
+        self.assertIn("heartbeat_at", owned.return_value.update.call_args.kwargs)
+
+    @override_settings(UPLOAD_JOB_RUNNER="thread")
+    def test_polling_a_stale_job_drains_the_thread_runner(self):
+        path = os.path.join(self.spool, "coverage-orphaned")
+        with open(path, "w") as file:
+            file.write("event_id,event_name,event_type,ip,threshold\nEV1,ev1,t,ip0,3\n")
+        job = UploadJob.objects.create(kind=UploadJob.COVERAGE, path=path, status=UploadJob.RUNNING,
+                                       attempts=1, heartbeat_at=timezone.now() - timedelta(hours=1))
+        executor = mock.Mock()
+        with mock.patch("coverage.jobs._get_executor", return_value=executor):
+            self.client.get(reverse("upload-job", args=[job.pk]))
+            self.client.get(reverse("upload-job", args=[job.pk]))
+        # One drain waiting to start is enough
+        executor.submit.assert_called_once_with(jobs._drain_in_thread)
+
+        with mock.patch("coverage.jobs.connection"):  # the test's connection stays open
+            jobs._drain_in_thread()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (UploadJob.SUCCEEDED, 2))
+        self.assertTrue(Coverage.objects.filter(event_id="EV1").exists())
+
+
+class CoverageMappingBulkUploadTests(UploadJobTestCase):
+    def workbook(self, rows, sheet="IP0"):
+        workbook = openpyxl.Workbook()
+        worksheet = workbook.active
+        worksheet.title = sheet
+        worksheet.append(["Notes", " VPD_ID ", "Owner", "Coverage Event Mapping"])
+        for coverage_id, mapping in rows:
+            worksheet.append(["", coverage_id, "me", mapping])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        return SimpleUploadedFile("vpd.xlsx", buffer.getvalue())
+
+    def upload(self, rows, **data):
+        data = {"file": self.workbook(rows), "sheet_name": "IP0", "ip": "ip0", **data}
+        return self.client.post(reverse("coverage-mapping-bulk-upload"), data)
+
+    def test_counts_created_updated_unchanged(self):
+        CoverageMapping.objects.create(ip="ip0", coverage_id="VPD-1", coverage_mapping="EV1,EV2")
+        CoverageMapping.objects.create(ip="ip0", coverage_id="VPD-2", coverage_mapping="EV2")
+
+        response = self.upload([
+            ("VPD-1", "EV1,EV2"),
+            ("VPD-2", "EV3"),
+            (3, "EV4, EV5"),
+            (None, "EV9"),
+            ("VPD-2", "EV2, EV3"),
+        ])
+
+        self.assertEqual(self.job(response)["result"], {
+            "created": 1, "updated": 1, "unchanged": 1,
+            "total_rows": 5, "invalid_rows": 1, "duplicate_rows": 1,
+        })
+        mapping = CoverageMapping.objects.get(ip="ip0", coverage_id="VPD-2")
+        self.assertEqual(mapping.coverage_mapping, "EV2, EV3")
+        self.assertEqual(
+            list(CoverageMappingEvent.objects.filter(mapping=mapping).order_by("position").values_list("event_id", flat=True)),
+            ["EV2", "EV3"],
+        )
+        self.assertTrue(CoverageMapping.objects.filter(ip="ip0", coverage_id="3").exists())
+
+    def test_ids_only_on_request(self):
+        response = self.upload([("VPD-1", "EV1")], return_ids="true")
+        created = CoverageMapping.objects.get(coverage_id="VPD-1")
+        self.assertEqual(self.job(response)["result"]["created_ids"], [created.pk])
+        self.assertEqual(self.job(response)["result"]["updated_ids"], [])
+
+    def test_missing_columns(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.title = "IP0"
+        workbook.active.append(["VPD_ID"])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        response = self.client.post(reverse("coverage-mapping-bulk-upload"), {
+            "file": SimpleUploadedFile("vpd.xlsx", buffer.getvalue()), "sheet_name": "IP0", "ip": "ip0",
+        })
+        job = self.job(response)
+        self.assertEqual(job["status"], "failed")
+        self.assertIn("Excel must contain columns", job["error"])
+
+    def multi_sheet_workbook(self, sheets):
+        workbook = openpyxl.Workbook()
+        workbook.remove(workbook.active)
+        for title, rows in sheets.items():
+            worksheet = workbook.create_sheet(title)
+            worksheet.append(["VPD_ID", "Coverage Event Mapping"] if rows is not None else ["Notes"])
+            for row in rows or []:
+                worksheet.append(row)
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        return SimpleUploadedFile("vpd.xlsx", buffer.getvalue())
+
+    # Parsed in two worker processes however many CPUs the test machine has
+    @override_settings(MAPPING_IMPORT_PROCESSES=2)
+    @mock.patch("coverage.workbook.os.sched_getaffinity", return_value={0, 1}, create=True)
+    def test_sheets_named_after_their_ip(self, _):
+        CoverageMapping.objects.create(ip="ip1", coverage_id="VPD-1", coverage_mapping="EV1")
+        file = self.multi_sheet_workbook({
+            "ip0": [("VPD-1", "EV1, EV2"), ("VPD-2", "EV3")],
+            "Notes": None,
+            " ip1 ": [("VPD-1", "EV4"), (None, "EV5")],
+        })
+
+        response = self.client.post(reverse("coverage-mapping-bulk-upload"), {"file": file, "all_sheets": "true"})
+
+        job = self.job(response)
+        self.assertEqual(job["status"], "succeeded")
+        self.assertEqual(job["progress"]["processed"], 3)
+        result = job["result"]
+        self.assertEqual(result["sheets"]["ip0"]["created"], 2)
+        self.assertEqual(result["sheets"][" ip1 "], {
+            "ip": "ip1", "created": 0, "updated": 1, "unchanged": 0,
+            "total_rows": 2, "invalid_rows": 1, "duplicate_rows": 0,
+        })
+        self.assertEqual(list(result["skipped_sheets"]), ["Notes"])
+        self.assertEqual((result["created"], result["updated"], result["total_rows"]), (2, 1, 4))
+        self.assertEqual(CoverageMapping.objects.get(ip="ip1", coverage_id="VPD-1").coverage_mapping, "EV4")
+        self.assertEqual(
+            list(CoverageMappingEvent.objects.filter(mapping__ip="ip0").order_by("event_id").values_list("event_id", flat=True)),
+            ["EV1", "EV2", "EV3"],
+        )
+
+    @override_settings(MAPPING_IMPORT_PROCESSES=1)
+    def test_explicit_sheets_are_written_together_or_not_at_all(self):
+        file = self.multi_sheet_workbook({"A": [("VPD-1", "EV1")], "Notes": None})
+
+        response = self.client.post(reverse("coverage-mapping-bulk-upload"), {
+            "file": file, "sheets": json.dumps({"A": "ip0", "Notes": "ip1"}),
+        })
+
+        job = self.job(response)
+        self.assertEqual(job["status"], "failed")
+        self.assertIn("Notes: Excel must contain columns", job["error"])
+        self.assertFalse(CoverageMapping.objects.exists())
+
+        response = self.client.post(reverse("coverage-mapping-bulk-upload"), {
+            "file": self.multi_sheet_workbook({"A": [("VPD-1", "EV1")]}), "sheets": "[\"A\"]",
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+# Compares what the views build, not what the response cache kept
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class AsyncReadViewTests(ToolTableTestCase):
+    def setUp(self):
+        for event_id, ip, threshold in [("EV1", "ip0", 2), ("EV2", "ip0", 1), ("EV1", "ip1", 4)]:
+            Coverage.objects.create(event_id=event_id, event_name=event_id, event_type="t", ip=ip, threshold=threshold)
+        CoverageMapping.objects.create(ip="ip0", coverage_id="VPD-1", coverage_mapping="EV1, EV2")
+        CoverageMapping.objects.create(ip="ip0", coverage_id="VPD-2", coverage_mapping="")
+        model = dynamic_models["nanoscope"]
+        model.objects.bulk_create([
+            model(project_name="P", stepping="A0", testid=f"T{i}", eventid="EV1", ip="ip0") for i in range(3)
+        ])
+
+    async def test_same_payloads(self):
+        cases = [
+            (async_views.UniqueIPView, "unique-ip", {}),
+            (async_views.CoverageIndicatorView, "coverage-indicator", {"ip": "ip0"}),
+            (async_views.CoverageIndicatorView, "coverage-indicator", {"ip": "ip0", "project": "P", "stepping": "B0"}),
+            (async_views.CoverageIndicatorView, "coverage-indicator", {}),
+            (async_views.EventCoverageView, "event-coverage", {}),
+            (async_views.CoverageDashboardView, "coverage-dashboard", {}),
+            (async_views.CoverageDashboardView, "coverage-dashboard", {"ips": "ip0,ip9", "events": "ev1"}),
+            (async_views.CoverageIndicatorView, "coverage-indicator", {"ip": "ip0", "since": "2025-01-01"}),
+            (async_views.CoverageTrendView, "coverage-trends", {}),
+            (async_views.CoverageTrendView, "coverage-trends", {"bucket": "year"}),
+        ]
+        for view, name, params in cases:
+            with self.subTest(name=name, params=params):
+                expected = await sync_to_async(self.client.get)(reverse(name), params)
+                response = await view.as_view()(AsyncRequestFactory().get(reverse(name), params))
+                self.assertEqual(response.status_code, expected.status_code)
+                body, expected = json.loads(response.content), expected.json()
+                if name == "event-coverage":  # the DRF view lists events in DISTINCT order
+                    expected.sort(key=lambda event: event["event_id"])
+                self.assertEqual(body, expected)
+
+
+class CoverageDashboardTests(AsyncReadViewTests):
+    def test_matches_the_single_endpoints(self):
+        body = self.client.get(reverse("coverage-dashboard")).json()
+        self.assertEqual(body["ip"], self.client.get(reverse("unique-ip")).json()["ip"])
+        for ip in body["ip"]:
+            self.assertEqual(body["indicators"][ip], self.client.get(reverse("coverage-indicator"), {"ip": ip}).json())
+        events = sorted(self.client.get(reverse("event-coverage")).json(), key=lambda event: event["event_id"])
+        self.assertEqual(body["events"], events)
+
+    def test_requested_ips_and_events(self):
+        response = self.client.get(reverse("coverage-dashboard"), {"ips": "ip0", "events": "ev1"})
+        body = response.json()
+        self.assertEqual(list(body["indicators"]), ["ip0"])
+        self.assertEqual([event["event_id"] for event in body["events"]], ["EV1"])
+        self.assertEqual(body["events"][0]["total_hit"], 3)
+
+        body = self.client.get(reverse("coverage-dashboard"), {"ips": "", "events": ""}).json()
+        self.assertEqual((body["indicators"], body["events"]), ({}, []))
+
+    def test_hit_counts_computed_once(self):
+        CoverageMapping.objects.create(ip="ip1", coverage_id="VPD-3", coverage_mapping="EV1")
+        self.client.get(reverse("coverage-dashboard"))  # folds the new telemetry into the rollup
+        with CaptureQueriesContext(connection) as one_ip:
+            self.client.get(reverse("coverage-dashboard"), {"ips": "ip0"})
+        with CaptureQueriesContext(connection) as all_ips:
+            self.client.get(reverse("coverage-dashboard"))
+        self.assertEqual(len(all_ips), len(one_ip))
+
+    def test_reference_data_read_from_the_snapshot(self):
+        self.client.get(reverse("coverage-dashboard"))
+        for name in ("coverage-dashboard", "coverage-indicator", "event-coverage", "unique-ip"):
+            with self.subTest(name=name), CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse(name), {"ip": "ip0"})
+            tables = ("coverage_coverage", "coverage_coveragemapping")
+            self.assertFalse([q["sql"] for q in queries if any(table in q["sql"] for table in tables)])
+
+    def test_snapshot_replaced_on_change(self):
+        indicators = self.client.get(reverse("coverage-dashboard")).json()["indicators"]
+        self.assertEqual(indicators["ip0"][0]["events"][0]["threshold"], 2)
+        coverage = Coverage.objects.get(event_id="EV1", ip="ip0")
+        coverage.threshold = 7
+        coverage.save()
+        CoverageMapping.objects.create(ip="ip2", coverage_id="VPD-4", coverage_mapping="EV1")
+
+        body = self.client.get(reverse("coverage-dashboard")).json()
+        self.assertEqual(body["indicators"]["ip0"][0]["events"][0]["threshold"], 7)
+        self.assertEqual(body["ip"], ["ip0", "ip2"])
+
+    async def test_async_not_modified(self):
+        request = AsyncRequestFactory().get(reverse("unique-ip"))
+        etag = (await async_views.UniqueIPView.as_view()(request))["ETag"]
+        request = AsyncRequestFactory().get(reverse("unique-ip"), headers={"If-None-Match": etag})
+        self.assertEqual((await async_views.UniqueIPView.as_view()(request)).status_code, 304)
+
+
+class RollupLateCommitTests(LateCommitTestCase):
+    def hits(self):
+        return sum(EventHitRollup.objects.values_list("hits", flat=True))
+
+    def test_rows_committed_after_higher_ids_are_counted(self):
+        model = dynamic_models["nanoscope"]
+        row = {"project_name": "P", "stepping": "A0", "eventid": "EV1", "ip": "ip0"}
+        with self.late_row(model, testid="T1", **row):
+            model.objects.create(testid="T2", **row)
+            refresh_event_rollup()
+            self.assertEqual(self.hits(), 1)
+        refresh_event_rollup()
+        self.assertEqual(self.hits(), 2)
+        # Nothing is open any more, the id is not looked for again
+        self.assertEqual(TelemetryWatermark.objects.get(consumer=ROLLUP_CONSUMER, tool="nanoscope").pending, [])
+
+
+class TimeRangeTests(ToolTableTestCase):
+    def setUp(self):
+        self.addCleanup(dynamic_models.reload)
+        Coverage.objects.create(event_id="EV1", event_name="EV1", event_type="t", ip="ip0", threshold=2)
+        Coverage.objects.create(event_id="EV2", event_name="EV2", event_type="t", ip="ip0", threshold=1)
+        CoverageMapping.objects.create(ip="ip0", coverage_id="VPD-1", coverage_mapping="EV1, EV2")
+        self.model = dynamic_models["nanoscope"]
+        for event_id, stamp in [("EV1", "2025-01-01T10:00:00"), ("EV1", "2025-01-01T23:00:00"),
+                                ("EV2", "2025-01-02T01:00:00"), ("EV1", "2025-01-08T00:00:00"), ("EV1", "")]:
+            self.add_row(event_id, stamp)
+        call_command("backfill_tool_timestamps", stdout=io.StringIO())
+
+    def add_row(self, event_id, stamp):
+        self.model.objects.create(project_name="P", stepping="A0", testid="T1", eventid=event_id, ip="ip0",
+                                  time_stmp=stamp)
+
+    def hits(self, **params):
+        events = self.client.get(reverse("coverage-indicator"), {"ip": "ip0", **params}).json()[0]["events"]
+        return {event["event_id"]: event["hit"] for event in events}
+
+    def test_indicator_and_event_hits(self):
+        self.assertEqual(self.hits(), {"EV1": 4, "EV2": 1})
+        self.assertEqual(self.hits(since="2025-01-02"), {"EV1": 1, "EV2": 1})
+        self.assertEqual(self.hits(since="2025-01-01T12:00:00", until="2025-01-08"), {"EV1": 1, "EV2": 1})
+        self.assertEqual(self.hits(until="2025-01-01T13:00:00+02:00"), {"EV1": 1, "EV2": 0})
+
+        events = self.client.get(reverse("event-coverage"), {"until": "2025-01-02"}).json()
+        self.assertEqual({event["event_id"]: event["total_hit"] for event in events}, {"EV1": 2, "EV2": 0})
+
+        for params in [{"since": "soon"}, {"since": "2025-01-02", "until": "2025-01-01"}]:
+            self.assertEqual(self.client.get(reverse("coverage-indicator"), {"ip": "ip0", **params}).status_code, 400)
+            self.assertEqual(self.client.get(reverse("event-coverage"), params).status_code, 400)
+
+    def test_trends(self):
+        def trends(**params):
+            return {
+                event["event_id"]: [(bucket["start"][:10], bucket["hit"]) for bucket in event["buckets"]]
+                for event in self.client.get(reverse("coverage-trends"), params).json()
+            }
+
+        self.assertEqual(trends(), {
+            "EV1": [("2025-01-01", 2), ("2025-01-08", 1)],
+            "EV2": [("2025-01-02", 1)],
+        })
+        self.assertEqual(trends(bucket="week", events="EV1"), {"EV1": [("2024-12-30", 2), ("2025-01-06", 1)]})
+        self.assertEqual(trends(since="2025-01-02"), {"EV1": [("2025-01-08", 1)], "EV2": [("2025-01-02", 1)]})
+
+        # new telemetry shows up in the next response, not a stale cached one
+        self.add_row("EV2", "2025-01-02T05:00:00")
+        self.assertEqual(trends(events="EV2"), {"EV2": [("2025-01-02", 2)]})
+        self.assertEqual(self.client.get(reverse("coverage-trends"), {"bucket": "year"}).status_code, 400)
@@ -1,8 +1,13 @@
+from django.conf import settings
 from django.urls import path ,include
 from rest_framework.routers import DefaultRouter
-from .views import CoverageViewSet , CoverageMappingList, CoverageMappingBulkUpload ,CoverageIndicatorView,UniqueIPView ,EventCoverageView
+from . import async_views, views
+from .views import CoverageViewSet , CoverageMappingList, CoverageMappingBulkUpload, UploadJobView
 from .downloadupload import CoverageTemplateDownload ,CoverageBulkUpload 
 
+# Read views: async ones under ASGI (ASYNC_READ_VIEWS), DRF ones otherwise
+read_views = async_views if settings.ASYNC_READ_VIEWS else views
+
 
 router = DefaultRouter()
 router.register(r'', CoverageViewSet) # by default first time this will come 
@@ -12,11 +17,14 @@ router.register(r'', CoverageViewSet) # by default first time this will come
 urlpatterns = [
     path("template/", CoverageTemplateDownload.as_view(), name="coverage-template"),
     path("bulk-upload/", CoverageBulkUpload.as_view(), name="coverage-bulk-upload"),
+    path("jobs/<int:pk>/", UploadJobView.as_view(), name="upload-job"),
     path('coverage-mapping/', CoverageMappingList.as_view(), name='coverage-mapping-list'),
     path('coverage-mapping/bulk-upload/', CoverageMappingBulkUpload.as_view(), name='coverage-mapping-bulk-upload'),
-    path("unique-ip/", UniqueIPView.as_view(), name="unique-ip"),
-    path("indicator/", CoverageIndicatorView.as_view(), name="coverage-indicator"),
-    path("coverage-event/", EventCoverageView.as_view(), name="event-coverage"),
+    path("unique-ip/", read_views.UniqueIPView.as_view(), name="unique-ip"),
+    path("indicator/", read_views.CoverageIndicatorView.as_view(), name="coverage-indicator"),
+    path("coverage-event/", read_views.EventCoverageView.as_view(), name="event-coverage"),
+    path("dashboard/", read_views.CoverageDashboardView.as_view(), name="coverage-dashboard"),
+    path("trends/", read_views.CoverageTrendView.as_view(), name="coverage-trends"),
     path('' ,include(router.urls)),
     
 ]
\ No newline at end of file
@@ -1,70 +1,92 @@
+import json
+
 from django.shortcuts import render
 from rest_framework import viewsets ,status
 from rest_framework.decorators import action
 from  rest_framework.permissions import AllowAny
 from .serializer import CoverageSerializer,CoverageMappingSerializer
-from .models import Coverage , CoverageMapping
+from .models import Coverage, UploadJob
 from rest_framework.response import Response
-import pandas as pd
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser
+from django.shortcuts import get_object_or_404
 
 
-from project.models import dynamic_models
+from core.pagination import OptInCursorPagination
+from core.streaming import StreamingJSONResponse, wants_stream
+from core.versioning import HIT_COUNTS, SCANNED_HITS, data_etag
+from project.timestamps import TIMESTAMP_SCOPE, time_range
+from .aggregation import TREND_BUCKETS, event_hit_counts, hit_trends
+from .jobs import enqueue, is_stale, job_status, kick
+from .reference import coverage_index, mapping_index
 
 # Create your views here.
 
+def flag_partial(response, event_counts):
+    """
+    Names the tools whose hit counts timed out (see core.fanout) in a header,
+    the body keeps its shape.
+    """
+    if event_counts.partial_tools:
+        response["X-Partial-Results"] = ",".join(event_counts.partial_tools)
+    return response
+
+
 class CoverageViewSet(viewsets.ModelViewSet):
     queryset = Coverage.objects.all()
     serializer_class = CoverageSerializer
-    
+    pagination_class = OptInCursorPagination
 
+    @data_etag("coverage", tools=HIT_COUNTS)
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
+
+        # Compute counts for each (event_id, ip) from all dynamic tool tables
+        event_counts = event_hit_counts(
+            project=request.query_params.get("project"),
+            stepping=request.query_params.get("stepping"),
+        )
+
+        def enrich(row):
+            key = (row['event_id'], row['ip'])  # use both event_id and ip
+            row['event_count'] = event_counts.get(key, 0)
+            return row
+
+        # ?stream=1 writes rows straight from a server-side cursor
+        if wants_stream(request):
+            serializer = self.get_serializer()
+            rows = queryset.order_by("id").iterator(chunk_size=2000)
+            return flag_partial(
+                StreamingJSONResponse(enrich(serializer.to_representation(obj)) for obj in rows), event_counts
+            )
+
+        # ?page_size= / ?cursor= pages by id
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return flag_partial(self.get_paginated_response([enrich(row) for row in serializer.data]), event_counts)
+
         serializer = self.get_serializer(queryset, many=True)
         data = serializer.data
 
-        # Compute counts for each event_id from all dynamic tool tables
-        event_counts = {}
-        for model_name, model in dynamic_models.items():
-            # Try to detect the correct field names
-            model_fields = [f.name for f in model._meta.fields]
-            eid_field = "eventid" if "eventid" in model_fields else "event_id"
-            ip_field = "ip" if "ip" in model_fields else None
-
-            if not ip_field:
-                print(f"Model {model_name} has no 'ip' field, skipping")
-                continue
-
-            # Iterate all rows
-            for obj in model.objects.values(eid_field, ip_field):
-                eid = obj.get(eid_field)
-                ip = obj.get(ip_field)
-                if eid and ip:
-                    key = (eid, ip)
-                    event_counts[key] = event_counts.get(key, 0) + 1
-
-        # Print the counts for verification
-        for (eid, ip), count in event_counts.items():
-            print(f"Event: {eid}, IP: {ip}, Count: {count}")
-
         # Attach count to each coverage record
         enriched_data = []
         for row in data:
-            key = (row['event_id'], row['ip'])  # use both event_id and ip
-            row['event_count'] = event_counts.get(key, 0)
-            enriched_data.append(row)
+            enriched_data.append(enrich(row))
+
+        return flag_partial(Response(enriched_data), event_counts)
+
+    @data_etag("coverage")
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
-        return Response(enriched_data)
-    
-    
 class CoverageMappingList(APIView):
+    @data_etag("mapping", "coverage")
     def get(self, request):
         ip = request.query_params.get("ip")
-        if ip:
-            mappings = CoverageMapping.objects.filter(ip=ip)
-        else:
-            mappings = CoverageMapping.objects.all()
+        index = mapping_index()
+        mappings = index.by_ip.get(ip, ()) if ip else index.entries
         serializer = CoverageMappingSerializer(mappings, many=True)
         return Response(serializer.data)
 
@@ -75,98 +97,168 @@ class CoverageMappingBulkUpload(APIView):
         file = request.FILES.get("file")
         sheet_name = request.data.get("sheet_name")
         ip = request.data.get("ip")
+        # Several sheets at once: sheets={"sheet": "ip", ...}, or all_sheets for sheets named after their IP
+        sheets = request.data.get("sheets")
+        all_sheets = str(request.data.get("all_sheets", "")).lower() in ("1", "true", "yes")
+
+        if not file or not (sheet_name and ip or sheets or all_sheets):
+            return Response({"error": "File, and sheet_name and IP (or sheets, or all_sheets) are required."},
+                            status=400)
+
+        if sheets:
+            try:
+                sheets = json.loads(sheets)
+            except ValueError:
+                sheets = None
+            if not isinstance(sheets, dict) or not all(isinstance(v, str) and v.strip() for v in sheets.values()):
+                return Response({"error": "sheets has to be a JSON object of sheet name to IP."}, status=400)
+
+        # Large id lists are only sent back on request
+        return_ids = str(request.data.get("return_ids", "")).lower() in ("1", "true", "yes")
+
+        # The sheets are read and written by a background job, see coverage.jobs
+        if sheets or all_sheets:
+            options = {"sheets": {name: ip.strip() for name, ip in sheets.items()} if sheets else None}
+        else:
+            options = {"sheet_name": sheet_name, "ip": ip}
+        job = enqueue(UploadJob.MAPPING, file, return_ids=return_ids, **options)
+        return accepted(job, request)
 
-        if not file or not sheet_name or not ip:
-            return Response({"error": "File, sheet_name, and IP are required."}, status=400)
 
-        
+def accepted(job, request):
+    body = job_status(job, request)
+    return Response(body, status=status.HTTP_202_ACCEPTED, headers={"Location": body["status_url"]})
+
+
+class UploadJobView(APIView):
+    """
+    Progress of a bulk upload job, for the uploading page to poll.
+    """
+
+    def get(self, request, pk):
+        job = get_object_or_404(UploadJob, pk=pk)
+        if job.status == UploadJob.QUEUED or is_stale(job):
+            # Nothing may be left to run it in this process (see coverage.jobs.kick)
+            kick()
+        return Response(job_status(job, request))
 
-        try:
-            df = pd.read_excel(file, sheet_name=sheet_name)
-            required_cols = ["VPD_ID", "Coverage Event Mapping"]
-
-            # Make columns case-insensitive and ignore spaces
-            df.columns = [col.strip() for col in df.columns]
-
-            if not all(col in df.columns for col in required_cols):
-                return Response(
-                    {"error": f"Excel must contain columns: {required_cols}. Found: {list(df.columns)}"},
-                    status=400
-                )
-
-            created = []
-            updated = []
-
-            for _, row in df.iterrows():
-                obj, created_flag = CoverageMapping.objects.update_or_create(
-                    coverage_id=row["VPD_ID"],
-                    ip=ip,  # automatically assign the selected IP
-                    defaults={"coverage_mapping": row["Coverage Event Mapping"]}
-                )
-                if created_flag:
-                    created.append(obj.id)
-                else:
-                    updated.append(obj.id)
-
-            return Response(
-                {"created_ids": created, "updated_ids": updated, "total_rows": len(df)},
-                status=201
-            )
-        except Exception as e:
-            import traceback
-            print("⚠️ Excel upload failed:", traceback.format_exc())
-            return Response({"error": str(e)}, status=400)
-        
 
 class UniqueIPView(APIView):
+    @data_etag("mapping")
     def get(self, request):
-        ip = list(CoverageMapping.objects.values_list("ip", flat=True).distinct())
-        return Response({"ip": ip})
-    
+        return Response({"ip": list(mapping_index().ips)})
+
+
+def indicator_rows(ips=None):
+    """
+    (ip, mapping id, coverage_id, event_id, threshold) of the mapping events
+    of the given IPs (all of them without), from the reference snapshots;
+    event_id is None for a mapping without events.
+    """
+    mappings, thresholds = mapping_index(), coverage_index().thresholds
+    for ip in (mappings.ips if ips is None else dict.fromkeys(ips)):
+        for entry in mappings.by_ip.get(ip, ()):
+            if not entry.event_ids:
+                yield ip, entry.id, entry.coverage_id, None, None
+            for event_id in entry.event_ids:
+                yield ip, entry.id, entry.coverage_id, event_id, thresholds.get((event_id, ip))
+
+
+class IndicatorData:
+    """
+    Groups indicator_rows() into {ip: [{"coverage_id", "events": [...]}]}, one row at a time.
+    """
+
+    def __init__(self, event_counts):
+        self.event_counts = event_counts
+        self.by_ip = {}
+        self.by_mapping = {}
+
+    def add(self, row):
+        ip, mapping_id, coverage_id, event_id, event_threshold = row
+        if mapping_id not in self.by_mapping:
+            self.by_mapping[mapping_id] = {"coverage_id": coverage_id, "events": []}
+            self.by_ip.setdefault(ip, []).append(self.by_mapping[mapping_id])
+        if event_id is None:  # mapping without events
+            return
+        self.by_mapping[mapping_id]["events"].append({
+            "event_id": event_id,
+            "hit": self.event_counts.get((event_id, ip), 0),  # dynamic calculation
+            "threshold": event_threshold or 0
+        })
+
+    def data(self, ip):
+        return self.by_ip.get(ip, [])
+
+
+def event_pie_rows(events=None):
+    """
+    (event_id, ip, threshold) of the Coverage rows of the given events
+    (matched case-insensitively, all events without), ordered by event.
+    """
+    coverage = coverage_index()
+    for event_id in (coverage.event_ids if events is None else coverage.matching(events)):
+        for ip, threshold in coverage.by_event[event_id]:
+            yield event_id, ip, threshold
+
+
+class EventPieData:
+    """
+    Groups event_pie_rows() into the pie chart data per event_id, one row at a time.
+    """
+
+    def __init__(self, event_counts):
+        self.event_counts = event_counts
+        self.data = []
+        self.current = None
+
+    def add(self, row):
+        event_id, ip, threshold = row
+        if self.current is None or self.current["event_id"] != event_id:
+            self.current = {"event_id": event_id, "total_hit": 0, "total_threshold": 0, "ips": []}
+            self.data.append(self.current)
+        hit = self.event_counts.get((event_id, ip), 0)
+        self.current["total_hit"] += hit
+        self.current["total_threshold"] += threshold
+        self.current["ips"].append({"ip": ip, "hit": hit, "threshold": threshold})
+
+
+def requested_values(params, name):
+    """
+    Values of a repeatable, comma separated query parameter; None when it is
+    not given at all, [] when it is given empty.
+    """
+    if name not in params:
+        return None
+    return [value.strip() for param in params.getlist(name) for value in param.split(",") if value.strip()]
+
+
 class CoverageIndicatorView(APIView):
+    @data_etag("mapping", "coverage", tools=HIT_COUNTS, cache=True)
     def get(self, request):
         selected_ip = request.query_params.get("ip")
         if not selected_ip:
             return Response({"error": "Missing IP parameter"}, status=400)
+        try:
+            since, until = time_range(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
 
         # Step 1: Compute dynamic hit counts from all dynamic models
-        event_counts = {}
-        for model_name, model in dynamic_models.items():
-            # Only consider rows matching the selected IP if model has IP field
-            qs = model.objects.all()
-            if hasattr(model, "ip"):
-                qs = qs.filter(ip=selected_ip)
-            for eid in qs.values_list("eventid", flat=True):
-                if eid:
-                    event_counts[eid] = event_counts.get(eid, 0) + 1
-
-        # Step 2: Fetch CoverageMapping for selected IP
-        mappings = CoverageMapping.objects.filter(ip=selected_ip)
-        data = []
-
-        for mapping in mappings:
-            coverage_id = mapping.coverage_id
-            # Assume mapping.coverage_mapping is comma-separated event_ids
-            events_list = [e.strip() for e in mapping.coverage_mapping.split(",") if e.strip()]
-            event_data = []
-
-            for event_id in events_list:
-                # Fetch Coverage row for event_id and selected_ip
-                coverage_event = Coverage.objects.filter(event_id=event_id, ip=selected_ip).first()
-                threshold = coverage_event.threshold if coverage_event else 0
-                hit = event_counts.get(event_id, 0)  # dynamic calculation
-                event_data.append({
-                    "event_id": event_id,
-                    "hit": hit,
-                    "threshold": threshold
-                })
-
-            data.append({
-                "coverage_id": coverage_id,
-                "events": event_data
-            })
-
-        return Response(data)
+        event_counts = event_hit_counts(
+            ip=selected_ip,
+            project=request.query_params.get("project"),
+            stepping=request.query_params.get("stepping"),
+            since=since,
+            until=until,
+        )
+
+        # Step 2: mapping events with their thresholds, grouped per mapping
+        indicator = IndicatorData(event_counts)
+        for row in indicator_rows([selected_ip]):
+            indicator.add(row)
+
+        return flag_partial(Response(indicator.data(selected_ip)), event_counts)
     
 
 
@@ -174,65 +266,114 @@ class EventCoverageView(APIView):
     """
     Returns pie chart data per event_id
     """
+    @data_etag("coverage", tools=HIT_COUNTS, cache=True)
+    def get(self, request):
+        try:
+            since, until = time_range(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Compute hit counts from dynamic models
+        event_counts = event_hit_counts(
+            project=request.query_params.get("project"),
+            stepping=request.query_params.get("stepping"),
+            since=since,
+            until=until,
+        )
+
+        pie = EventPieData(event_counts)
+        for row in event_pie_rows():
+            pie.add(row)
+
+        return flag_partial(Response(pie.data, status=status.HTTP_200_OK), event_counts)
+
+
+class CoverageDashboardView(APIView):
+    """
+    Everything the Indicators page needs in one request: the IP list, the
+    indicator data of the IPs in ?ips= and the pie data of the events in
+    ?events= (both comma separated or repeated; all of them when left out,
+    none when empty). Hit counts are computed once and shared by both parts.
+    """
+    @data_etag("mapping", "coverage", tools=HIT_COUNTS, cache=True)
     def get(self, request):
+        ips = requested_values(request.query_params, "ips")
+        events = requested_values(request.query_params, "events")
         try:
-            all_events = Coverage.objects.values_list("event_id", flat=True).distinct()
-            response_data = []
-
-            # Compute hit counts from dynamic models
-            event_counts = {}
-            for model_name, model in dynamic_models.items():
-                model_fields = [f.name for f in model._meta.fields]
-                eid_field = "eventid" if "eventid" in model_fields else "event_id"
-                ip_field = "ip" if "ip" in model_fields else None
-
-                if not ip_field:
-                    continue
-
-                for obj in model.objects.values(eid_field, ip_field):
-                    eid = obj.get(eid_field)
-                    ip = obj.get(ip_field)
-                    if eid and ip:
-                        key = (eid, ip)
-                        event_counts[key] = event_counts.get(key, 0) + 1
-
-            # Build response per event_id
-            for event_id in all_events:
-                coverages = Coverage.objects.filter(event_id=event_id)
-                if not coverages.exists():
-                    continue
-
-                ips_data = []
-                total_hit = 0
-                total_threshold = 0
-
-                for cov in coverages:
-                    ip = cov.ip
-                    threshold = getattr(cov, "threshold", 1)
-                    hit = event_counts.get((event_id, ip), 0)  # use dynamic model counts
-
-                    total_hit += hit
-                    total_threshold += threshold
-
-                    ips_data.append({
-                        "ip": ip,
-                        "hit": hit,
-                        "threshold": threshold
-                    })
-
-                response_data.append({
-                    "event_id": event_id,
-                    "total_hit": total_hit,
-                    "total_threshold": total_threshold,
-                    "ips": ips_data
-                })
-
-            return Response(response_data, status=status.HTTP_200_OK)
-        except Exception as e:
-            import traceback
-            print(traceback.format_exc())
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            since, until = time_range(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        event_counts = event_hit_counts(
+            project=request.query_params.get("project"),
+            stepping=request.query_params.get("stepping"),
+            since=since,
+            until=until,
+        )
+
+        all_ips = list(mapping_index().ips)
+
+        indicator = IndicatorData(event_counts)
+        if ips != []:
+            for row in indicator_rows(ips):
+                indicator.add(row)
+
+        pie = EventPieData(event_counts)
+        if events != []:
+            for row in event_pie_rows(events):
+                pie.add(row)
 
+        return flag_partial(Response({
+            "ip": all_ips,
+            "indicators": {ip: indicator.data(ip) for ip in (all_ips if ips is None else ips)},
+            "events": pie.data,
+        }), event_counts)
 
 
+def trend_data(trends):
+    """
+    hit_trends() as [{"event_id", "total_hit", "buckets": [{"start", "hit"}]}],
+    events and buckets in order.
+    """
+    return [{
+        "event_id": event_id,
+        "total_hit": sum(buckets.values()),
+        "buckets": [{"start": start.isoformat(), "hit": hits} for start, hits in sorted(buckets.items())],
+    } for event_id, buckets in sorted(trends.items())]
+
 
+def trend_params(params):
+    """
+    The hit_trends() arguments of a trend request. Raises ValueError on a
+    bad ?bucket= or time range.
+    """
+    bucket = params.get("bucket") or "day"
+    if bucket not in TREND_BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(TREND_BUCKETS)}")
+    since, until = time_range(params)
+    return {
+        "bucket": bucket,
+        "events": requested_values(params, "events"),
+        "ip": params.get("ip"),
+        "project": params.get("project"),
+        "stepping": params.get("stepping"),
+        "since": since,
+        "until": until,
+    }
+
+
+class CoverageTrendView(APIView):
+    """
+    Hits per event over time for trend charts: ?bucket=hour|day|week|month
+    (day by default), narrowed by ?events= (comma separated or repeated),
+    ?ip=, ?project=, ?stepping= and ?since= / ?until= (ISO 8601, UTC when
+    no offset is given). Buckets without hits are left out.
+    """
+    @data_etag(TIMESTAMP_SCOPE, tools=SCANNED_HITS, cache=True)
+    def get(self, request):
+        try:
+            params = trend_params(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        trends = hit_trends(**params)
+        return flag_partial(Response(trend_data(trends)), trends)
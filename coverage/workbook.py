@@ -0,0 +1,152 @@
+"""
+Reading VPD workbooks. Nothing here touches Django: read_mapping_sheets
+parses sheets in spawned worker processes that only import this module.
+"""
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from xml.etree import ElementTree
+
+import openpyxl
+import pandas as pd
+
+MAPPING_ID_COLUMN = "VPD_ID"
+MAPPING_EVENTS_COLUMN = "Coverage Event Mapping"
+# rows between progress calls while a sheet is read
+PROGRESS_ROWS = 1000
+SPREADSHEET_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+
+
+class MissingColumns(ValueError):
+    pass
+
+
+def open_workbook(file):
+    # read_only only parses the XML of the sheets actually read
+    return openpyxl.load_workbook(file, read_only=True, data_only=True)
+
+
+def read_sheet(sheet, progress=None):
+    """
+    Streams the VPD_ID and Coverage Event Mapping columns of a worksheet
+    into a DataFrame with coverage_id / coverage_mapping columns.
+    progress(rows, processed=rows read, total=rows of the sheet) is called
+    every PROGRESS_ROWS rows.
+    """
+    header = next(sheet.iter_rows(max_row=1, values_only=True), ())
+    # Ignore surrounding spaces in the header cells
+    columns = [str(c).strip() if c is not None else "" for c in header]
+    required_cols = [MAPPING_ID_COLUMN, MAPPING_EVENTS_COLUMN]
+    if not all(col in columns for col in required_cols):
+        raise MissingColumns(f"Excel must contain columns: {required_cols}. Found: {columns}")
+
+    id_idx = columns.index(MAPPING_ID_COLUMN)
+    events_idx = columns.index(MAPPING_EVENTS_COLUMN)
+    first = min(id_idx, events_idx)
+    # From the sheet's dimension record, None when the writer left it out
+    total = sheet.max_row - 1 if sheet.max_row else None
+
+    # Only the cells between the two columns are parsed
+    coverage_ids = []
+    coverage_mappings = []
+    for read, row in enumerate(sheet.iter_rows(min_row=2, min_col=first + 1,
+                                               max_col=max(id_idx, events_idx) + 1, values_only=True), 1):
+        if progress and read % PROGRESS_ROWS == 0:
+            progress(len(coverage_ids), processed=read, total=total)
+        coverage_id = row[id_idx - first] if len(row) > id_idx - first else None
+        coverage_mapping = row[events_idx - first] if len(row) > events_idx - first else None
+        if coverage_id is None and coverage_mapping is None:
+            continue  # blank line
+        coverage_ids.append(coverage_id)
+        coverage_mappings.append(coverage_mapping)
+
+    return pd.DataFrame({"coverage_id": coverage_ids, "coverage_mapping": coverage_mappings}, dtype=object)
+
+
+def read_mapping_sheet(file, sheet_name, progress=None):
+    """
+    read_sheet() of one worksheet of the workbook in file.
+    """
+    workbook = open_workbook(file)
+    try:
+        if sheet_name not in workbook.sheetnames:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+        return read_sheet(workbook[sheet_name], progress)
+    finally:
+        workbook.close()
+
+
+def sheet_names(path):
+    """
+    Sheet names of the workbook at path, in order. Read from xl/workbook.xml
+    directly: opening the workbook parses all of its shared strings first.
+    """
+    try:
+        with zipfile.ZipFile(path) as archive:
+            root = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        return [sheet.get("name") for sheet in root.iter(f"{{{SPREADSHEET_NS}}}sheet")]
+    except (KeyError, zipfile.BadZipFile, ElementTree.ParseError):
+        pass
+    # Not laid out the usual way (or not a workbook): let openpyxl find out
+    with open(path, "rb") as file:
+        workbook = open_workbook(file)
+        try:
+            return workbook.sheetnames
+        finally:
+            workbook.close()
+
+
+# The workbook of a pool process, opened once by its initializer
+_worker_workbook = None
+
+
+def _open_in_worker(path):
+    global _worker_workbook
+    # The file stays open for the life of the process
+    _worker_workbook = open_workbook(open(path, "rb"))
+
+
+def _read_in_worker(sheet_name):
+    try:
+        return read_sheet(_worker_workbook[sheet_name])
+    except MissingColumns as e:
+        return e
+
+
+def read_mapping_sheets(path, names, processes=1, done=None):
+    """
+    Reads the named worksheets of the workbook at path, in up to processes
+    worker processes, each opening the workbook once. Returns {name: DataFrame,
+    or the MissingColumns of a sheet that isn't a mapping sheet}; done(name,
+    result) is called as sheets finish. Other errors are raised.
+    """
+    results = {}
+    # Every process opens the workbook itself, more of them than CPUs only adds that cost
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    processes = min(processes, len(names), cpus)
+    if processes <= 1:
+        with open(path, "rb") as file:
+            workbook = open_workbook(file)
+            try:
+                for name in names:
+                    try:
+                        results[name] = read_sheet(workbook[name])
+                    except MissingColumns as e:
+                        results[name] = e
+                    if done:
+                        done(name, results[name])
+            finally:
+                workbook.close()
+        return results
+
+    # spawn, not fork: the caller has threads (and database connections) a fork would copy
+    with ProcessPoolExecutor(max_workers=processes, mp_context=get_context("spawn"),
+                             initializer=_open_in_worker, initargs=(path,)) as pool:
+        futures = {pool.submit(_read_in_worker, name): name for name in names}
+        for future in as_completed(futures):
+            name = futures[future]
+            results[name] = future.result()
+            if done:
+                done(name, results[name])
+    return results
@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ToolTable
+
+
+@admin.register(ToolTable)
+class ToolTableAdmin(admin.ModelAdmin):
+    list_display = ("name", "table", "enabled")
+    list_filter = ("enabled",)
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
+
+
+def reload_tool_registry(sender, **kwargs):
+    from .models import dynamic_models
+    dynamic_models.reload()
 
 
 class ProjectConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'project'
+
+    def ready(self):
+        # Registering or disabling a tool table takes effect on the next request
+        tool_table = self.get_model("ToolTable")
+        post_save.connect(reload_tool_registry, sender=tool_table, dispatch_uid="tool_table_saved")
+        post_delete.connect(reload_tool_registry, sender=tool_table, dispatch_uid="tool_table_deleted")
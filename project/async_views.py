@@ -0,0 +1,131 @@
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.views import View
+from rest_framework.exceptions import NotFound
+
+from core.pagination import encode_cursor, keyset_page_size
+from core.streaming import StreamingJSONResponse, json_response, wants_stream
+from core.versioning import CATALOG, TESTCASE_EVENTS, data_etag
+from .models import dynamic_models
+from .timestamps import in_time_range, time_range
+from .views import (
+    COVERAGE_DATA_CHUNK_SIZE, COVERAGE_DATA_COLUMNS, CoverageAssembler, catalog_rows, coverage_columns,
+    coverage_events, coverage_stream, flag_timed_out, page_rows, summary_row, testcase_events_timed_out, testid_page,
+)
+
+# Async counterparts of the read views in views.py, served instead of them
+# with ASYNC_READ_VIEWS (the ASGI deployment). Same URLs, same payloads;
+# a request waiting on Postgres no longer holds a worker thread.
+
+
+class ToolsList(View):
+    @data_etag()
+    async def get(self, request):
+        return json_response([tool.name for tool in await dynamic_models.atools()])
+
+
+class ProjectsList(View):
+    @data_etag(tools=CATALOG)
+    async def get(self, request):
+        tool = request.GET.get("tool")
+        if await dynamic_models.aget(tool) is None:
+            return json_response([])
+        rows, timed_out = await sync_to_async(catalog_rows)([tool])
+        projects = rows.order_by("project_name").values_list("project_name", flat=True).distinct()
+        return flag_timed_out(json_response([project async for project in projects]), timed_out)
+
+
+class SteppingsList(View):
+    @data_etag(tools=CATALOG)
+    async def get(self, request):
+        tool = request.GET.get("tool")
+        project = request.GET.get("project")
+        if await dynamic_models.aget(tool) is None or not project:
+            return json_response([])
+        rows, timed_out = await sync_to_async(catalog_rows)([tool])
+        steppings = rows.filter(project_name=project).order_by("stepping").values_list("stepping", flat=True)
+        return flag_timed_out(json_response([stepping async for stepping in steppings]), timed_out)
+
+
+class ProjectSummary(View):
+    @data_etag(tools=CATALOG)
+    async def get(self, request):
+        tool = request.GET.get("tool")
+        if tool and await dynamic_models.aget(tool) is None:
+            return json_response([])
+        rows, timed_out = await sync_to_async(catalog_rows)([tool] if tool else None)
+        project = request.GET.get("project")
+        if project:
+            rows = rows.filter(project_name=project)
+        stepping = request.GET.get("stepping")
+        if stepping:
+            rows = rows.filter(stepping=stepping)
+        rows = rows.order_by("tool", "project_name", "stepping")
+        return flag_timed_out(json_response([summary_row(entry) async for entry in rows]), timed_out)
+
+
+async def assemble(rows, timestamp=None):
+    # named=True: the plain tuple iterable runs its query when aiterator()
+    # creates it, on the event loop (SynchronousOnlyOperation); the named one
+    # is a generator, so the query and every chunk go through sync_to_async
+    assembler = CoverageAssembler(timestamp)
+    rows = rows.values_list(*COVERAGE_DATA_COLUMNS, named=True)
+    async for row in rows.aiterator(chunk_size=COVERAGE_DATA_CHUNK_SIZE):
+        assembler.add(row)
+    return assembler.result()
+
+
+class CoverageData(View):
+    """
+    See views.CoverageData.
+    """
+
+    @data_etag("coverage", tools=TESTCASE_EVENTS, cache=True)
+    async def get(self, request):
+        tool = request.GET.get("tool")
+        project = request.GET.get("project")
+        stepping = request.GET.get("stepping")
+        if await dynamic_models.aget(tool) is None or not all([project, stepping]):
+            return json_response({"events": [], "testcases": []})
+        try:
+            since, until = time_range(request.GET)
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=400)
+
+        info = await sync_to_async(dynamic_models.info)(tool)
+        rows = in_time_range(info.model.objects.filter(project_name=project, stepping=stepping), since, until)
+        events = sync_to_async(partial(coverage_events, info, project, stepping, since, until))
+        timed_out = await sync_to_async(testcase_events_timed_out)(tool)
+
+        if wants_stream(request):
+            return flag_timed_out(StreamingJSONResponse(
+                coverage_stream(rows, await self.first_timestamp(rows), await events()), asynchronous=True
+            ), timed_out)
+        page_size = keyset_page_size(request)
+        if page_size:
+            try:
+                return flag_timed_out(await self.page(request, rows, page_size, events), timed_out)
+            except NotFound as exc:
+                return json_response({"detail": str(exc.detail)}, status=exc.status_code)
+
+        testcases = await assemble(coverage_columns(rows).order_by("id"))
+        return flag_timed_out(json_response({"events": await events(), "testcases": testcases}), timed_out)
+
+    @staticmethod
+    async def first_timestamp(rows):
+        timestamp = await coverage_columns(rows).order_by("id").values_list("time_stmp", flat=True).afirst()
+        return str(timestamp) if timestamp is not None else None
+
+    async def page(self, request, rows, page_size, events):
+        testids = testid_page(rows, request.GET.get("cursor"))[:page_size + 1]
+        page_ids = [testid async for testid in testids]
+        has_more = len(page_ids) > page_size
+        page_ids = page_ids[:page_size]
+
+        testcases = await assemble(page_rows(rows, page_ids), await self.first_timestamp(rows))
+        return json_response({
+            "events": await events(testids=page_ids),
+            "testcases": testcases,
+            "next": encode_cursor(page_ids[-1]) if has_more else None,
+        })
@@ -0,0 +1,155 @@
+from django.db import connection, transaction
+
+from core.fanout import fan_out
+from . import watermarks
+from .models import CatalogTestcase, ProjectCatalog, TestcaseEvent, dynamic_models
+
+CATALOG_CONSUMER = "project_catalog"
+TESTCASE_EVENTS_CONSUMER = "testcase_events"
+
+
+def _fold_sql(tool, ids):
+    """
+    Counts the tool rows matching ids per project and stepping and adds
+    them onto the catalog. Testcases are counted the first time their testid
+    shows up, the first / last timestamps come from the lowest / highest id.
+    """
+    qn = connection.ops.quote_name
+    table = qn(tool.model._meta.db_table)
+    catalog = qn(ProjectCatalog._meta.db_table)
+    testcases = qn(CatalogTestcase._meta.db_table)
+    timestamp = "time_stmp" if tool.has_column("time_stmp") else "NULL"
+
+    return f"""
+        WITH new_testcases AS (
+            INSERT INTO {testcases} (tool, project_name, stepping, testid)
+            SELECT DISTINCT %(tool)s, COALESCE(project_name, ''), COALESCE(stepping, ''), testid
+            FROM {table}
+            WHERE {ids} AND testid IS NOT NULL AND testid <> ''
+            ON CONFLICT (tool, project_name, stepping, testid) DO NOTHING
+            RETURNING project_name, stepping
+        ), testcase_counts AS (
+            SELECT project_name, stepping, COUNT(*) AS testcase_count
+            FROM new_testcases
+            GROUP BY project_name, stepping
+        ), row_counts AS (
+            SELECT COALESCE(project_name, '') AS project_name, COALESCE(stepping, '') AS stepping,
+                   COUNT(*) AS row_count, MIN(id) AS first_id, MAX(id) AS last_id
+            FROM {table}
+            WHERE {ids}
+            GROUP BY COALESCE(project_name, ''), COALESCE(stepping, '')
+        )
+        INSERT INTO {catalog}
+            (tool, project_name, stepping, row_count, testcase_count, first_timestamp, last_timestamp, updated_at)
+        SELECT %(tool)s, r.project_name, r.stepping, r.row_count, COALESCE(t.testcase_count, 0),
+               (SELECT {timestamp} FROM {table} WHERE id = r.first_id),
+               (SELECT {timestamp} FROM {table} WHERE id = r.last_id),
+               NOW()
+        FROM row_counts r
+        LEFT JOIN testcase_counts t ON t.project_name = r.project_name AND t.stepping = r.stepping
+        ON CONFLICT (tool, project_name, stepping) DO UPDATE SET
+            row_count = {catalog}.row_count + EXCLUDED.row_count,
+            testcase_count = {catalog}.testcase_count + EXCLUDED.testcase_count,
+            first_timestamp = COALESCE({catalog}.first_timestamp, EXCLUDED.first_timestamp),
+            last_timestamp = COALESCE(EXCLUDED.last_timestamp, {catalog}.last_timestamp),
+            updated_at = EXCLUDED.updated_at
+    """
+
+
+def event_split_sql(table, where):
+    """
+    SELECT of (project_name, stepping, testid, event_id, hits) over the rows
+    of table matching where: events_covered split on commas, one row per
+    testcase and event with the number of rows naming it.
+    """
+    return f"""
+        SELECT COALESCE(project_name, '') AS project_name, COALESCE(stepping, '') AS stepping, testid,
+               btrim(event) AS event_id, COUNT(*) AS hits
+        FROM {table} CROSS JOIN LATERAL unnest(string_to_array(events_covered, ',')) AS event
+        WHERE {where} AND testid IS NOT NULL AND testid <> '' AND btrim(event) <> ''
+        GROUP BY 1, 2, 3, 4
+    """
+
+
+def _events_fold_sql(tool, ids):
+    """
+    Adds the events named by the tool rows matching ids onto TestcaseEvent.
+    """
+    qn = connection.ops.quote_name
+    testcase_events = qn(TestcaseEvent._meta.db_table)
+    split = event_split_sql(qn(tool.model._meta.db_table), ids)
+    return f"""
+        INSERT INTO {testcase_events} (tool, project_name, stepping, testid, event_id, hits)
+        SELECT %(tool)s, project_name, stepping, testid, event_id, hits FROM ({split}) AS split
+        ON CONFLICT (tool, project_name, stepping, testid, event_id)
+        DO UPDATE SET hits = {testcase_events}.hits + EXCLUDED.hits
+    """
+
+
+def _refresh_tool(tool, wait):
+    return watermarks.fold(CATALOG_CONSUMER, tool, _fold_sql, wait)
+
+
+def has_events(tool):
+    return tool.has_column("events_covered")
+
+
+def _refresh_tool_events(tool, wait):
+    if not has_events(tool):
+        return 0
+    return watermarks.fold(TESTCASE_EVENTS_CONSUMER, tool, _events_fold_sql, wait)
+
+
+def _refresh(refresh_tool, tools, wait, timeout):
+    return fan_out({
+        tool.name: (lambda tool=tool: refresh_tool(tool, wait))
+        for tool in dynamic_models.tools()
+        if not tools or tool.name in tools
+    }, timeout=timeout)
+
+
+def refresh_catalog(tools=None, wait=True, timeout=None):
+    """
+    Folds the new rows of every tool (or the given ones) into ProjectCatalog, concurrently.
+    Returns ({tool: ids advanced}, [tools that ran past timeout and were left as they were]).
+    """
+    return _refresh(_refresh_tool, tools, wait, timeout)
+
+
+def refresh_testcase_events(tools=None, wait=True, timeout=None):
+    """
+    Same as refresh_catalog, for TestcaseEvent.
+    """
+    return _refresh(_refresh_tool_events, tools, wait, timeout)
+
+
+def _rebuild(consumer, models, refresh_tool, tools):
+    folded = {}
+    with transaction.atomic():
+        for tool in dynamic_models.tools():
+            if tools and tool.name not in tools:
+                continue
+            watermarks.reset(consumer, tool)
+            for model in models:
+                model.objects.filter(tool=tool.name).delete()
+            folded[tool.name] = refresh_tool(tool, wait=True)
+    if connection.vendor == "postgresql":
+        # A rebuild replaces the whole table; without fresh statistics the
+        # planner reads a page of testids as a scan of the whole stepping
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {', '.join(connection.ops.quote_name(m._meta.db_table) for m in models)}")
+    return folded
+
+
+def rebuild_catalog(tools=None):
+    """
+    Drops the catalog rows of the given tools and recounts them from scratch, in one transaction.
+    """
+    return _rebuild(CATALOG_CONSUMER, [ProjectCatalog, CatalogTestcase], _refresh_tool, tools)
+
+
+def rebuild_testcase_events(tools=None):
+    """
+    Same as rebuild_catalog, for TestcaseEvent.
+    """
+    return _rebuild(TESTCASE_EVENTS_CONSUMER, [TestcaseEvent], _refresh_tool_events, tools)
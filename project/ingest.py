@@ -0,0 +1,224 @@
+import csv
+import io
+import json
+import logging
+import time
+
+from django.db import DatabaseError, connection, models, transaction
+
+from core.versioning import bump, rows_scope
+from .models import TIMESTAMP_COLUMN
+
+# rows per COPY; one batch is all that is held in memory at a time
+TELEMETRY_BATCH_SIZE = 5000
+MAX_BATCH_SIZE = 50000
+# row errors echoed per batch acknowledgement
+MAX_REPORTED_ERRORS = 20
+
+FORMATS = ("ndjson", "csv")
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetryRowError(ValueError):
+    pass
+
+
+class ToolColumns:
+    """
+    Writable columns of a tool model and how to validate a record against them.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        # The parsed timestamp is derived from time_stmp by the table's trigger
+        self.fields = [
+            f for f in model._meta.concrete_fields
+            if not isinstance(f, models.AutoField) and f.column != TIMESTAMP_COLUMN
+        ]
+        self.names = [f.name for f in self.fields]
+        self.known = set(self.names)
+
+    def clean(self, record):
+        """
+        Returns the record as a tuple in column order.
+        Missing non-null fields become "", unknown fields are rejected.
+        """
+        if not isinstance(record, dict):
+            raise TelemetryRowError("record must be an object")
+        unknown = set(record) - self.known
+        if unknown:
+            raise TelemetryRowError(f"unknown field(s): {', '.join(sorted(map(str, unknown)))}")
+
+        values = []
+        for field in self.fields:
+            value = record.get(field.name)
+            if value is None:
+                if not field.null and field.name in record:
+                    raise TelemetryRowError(f"{field.name} may not be null")
+                values.append(None if field.null else "")
+                continue
+            if isinstance(value, (dict, list)):
+                raise TelemetryRowError(f"{field.name} must be a scalar")
+            value = str(value)
+            if field.max_length and len(value) > field.max_length:
+                raise TelemetryRowError(f"{field.name} is longer than {field.max_length} characters")
+            values.append(value)
+        return tuple(values)
+
+
+def iter_ndjson(lines):
+    """
+    Yields (line number, record or exception) for newline-delimited JSON.
+    """
+    for line_num, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        if not line.strip():
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError as e:
+            yield line_num, TelemetryRowError(f"invalid JSON: {e}")
+
+
+def iter_csv(lines):
+    """
+    Yields (line number, record) for CSV with a header row of field names.
+    """
+    text = (line.decode("utf-8", errors="replace") if isinstance(line, bytes) else line for line in lines)
+    reader = csv.DictReader(text)
+    for record in reader:
+        if None in record:
+            yield reader.line_num, TelemetryRowError("more values than header columns")
+            continue
+        yield reader.line_num, record
+
+
+def _copy_text(value):
+    # COPY text format: \N is NULL, backslash / tab / newlines escaped
+    if value is None:
+        return "\\N"
+    return (
+        value.replace("\\", "\\\\").replace("\t", "\\t")
+        .replace("\n", "\\n").replace("\r", "\\r")
+    )
+
+
+def copy_rows(model, columns, rows):
+    """
+    Loads cleaned rows into the tool table, with COPY on PostgreSQL, and
+    moves the table's rows counter on once they are committed.
+    """
+    if not rows:
+        return
+    # After the commit: a bump inside the transaction would hold the counter
+    # row until then and make concurrent batches wait for each other
+    transaction.on_commit(lambda: bump(rows_scope(model._meta.db_table)))
+    if connection.vendor != "postgresql":
+        model.objects.bulk_create([model(**dict(zip(columns.names, row))) for row in rows])
+        return
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_text(v) for v in row))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    qn = connection.ops.quote_name
+    column_list = ", ".join(qn(f.column) for f in columns.fields)
+    # copy_expert is the driver's own, without Django's exception wrapping
+    with connection.cursor() as cursor, connection.wrap_database_errors:
+        cursor.copy_expert(
+            f"COPY {qn(model._meta.db_table)} ({column_list}) FROM STDIN WITH (FORMAT text)",
+            buffer,
+        )
+
+
+def ingest_records(model, records, batch_size=TELEMETRY_BATCH_SIZE):
+    """
+    Validates and loads (line number, record) pairs in batches of batch_size.
+
+    This is a generator: it yields one acknowledgement per committed batch and
+    only pulls the next records once the previous batch is written, so a slow
+    database slows down reading the input instead of buffering it.
+
+    A batch the database refuses (constraint, type, timeout) is rolled back
+    and acknowledged with its error; nothing after it is read or written.
+    """
+    columns = ToolColumns(model)
+    batch = []
+    errors = []
+    rejected = 0
+    batch_num = 0
+
+    def flush():
+        nonlocal batch, errors, rejected, batch_num
+        batch_started = time.monotonic()
+        batch_num += 1
+        ack = {"batch": batch_num, "accepted": len(batch), "rejected": rejected, "errors": errors}
+        try:
+            with transaction.atomic():
+                copy_rows(model, columns, batch)
+        except DatabaseError as e:
+            logger.warning("Telemetry batch %s into %s failed: %s", batch_num, model._meta.db_table, e)
+            ack.update(accepted=0, failed=len(batch), error=(str(e).strip().splitlines() or [type(e).__name__])[0])
+        ack["elapsed_ms"] = round((time.monotonic() - batch_started) * 1000, 1)
+        batch, errors, rejected = [], [], 0
+        return ack
+
+    for line_num, record in records:
+        try:
+            if isinstance(record, Exception):
+                raise record
+            batch.append(columns.clean(record))
+        except TelemetryRowError as e:
+            rejected += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"line": line_num, "error": str(e)})
+            continue
+        if len(batch) >= batch_size:
+            ack = flush()
+            yield ack
+            if "error" in ack:
+                return
+
+    if batch or rejected:
+        yield flush()
+
+
+def ingest_stream(model, lines, fmt="ndjson", batch_size=TELEMETRY_BATCH_SIZE):
+    """
+    Runs ingest_records over raw input lines and yields the batch
+    acknowledgements followed by one summary ({"done": true, ...}) of the
+    committed batches, with the error of the batch that stopped it, if any.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    batch_size = max(1, min(int(batch_size), MAX_BATCH_SIZE))
+    records = iter_ndjson(lines) if fmt == "ndjson" else iter_csv(lines)
+
+    accepted = rejected = batches = 0
+    error = None
+    started = time.monotonic()
+    for ack in ingest_records(model, records, batch_size=batch_size):
+        accepted += ack["accepted"]
+        rejected += ack["rejected"]
+        if "error" in ack:
+            error = ack["error"]
+        else:
+            batches += 1
+        yield ack
+
+    elapsed = time.monotonic() - started
+    summary = {
+        "done": True,
+        "table": model._meta.db_table,
+        "batches": batches,
+        "accepted": accepted,
+        "rejected": rejected,
+        "rows_per_sec": round(accepted / elapsed) if elapsed else accepted,
+    }
+    if error is not None:
+        summary["error"] = error
+    yield summary
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from project.models import dynamic_models
+from project.timestamps import TIMESTAMP_BACKFILL_BATCH_SIZE, backfill, create_index, install
+
+
+class Command(BaseCommand):
+    help = (
+        "Add the parsed timestamp column (recorded_at) to the tool tables, fill it for the rows "
+        "already there and index it with BRIN. Safe to run again, it resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tool", action="append", dest="tools",
+                            help="Only this tool table. Can be repeated. Defaults to every registered tool.")
+        parser.add_argument("--batch-size", type=int, default=TIMESTAMP_BACKFILL_BATCH_SIZE,
+                            help="Ids per committed backfill batch.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Timestamp backfill is only supported on PostgreSQL.")
+
+        tools = options["tools"] or list(dynamic_models)
+        unknown = [t for t in tools if t not in dynamic_models]
+        if unknown:
+            raise CommandError(f"Unknown tool(s): {', '.join(unknown)}")
+
+        for name in tools:
+            tool = dynamic_models.info(name)
+            if tool.table not in connection.introspection.table_names():
+                self.stderr.write(f"{name}: table {tool.table} does not exist, skipping")
+                continue
+            if not install(tool):
+                self.stderr.write(f"{name}: no time_stmp column, skipping")
+                continue
+            # The table has a new column, the model has to pick it up
+            dynamic_models.reload()
+            tool = dynamic_models.info(name)
+
+            def progress(done, high):
+                self.stdout.write(f"\r{name}: {done:,}/{high:,} ids", ending="")
+                self.stdout.flush()
+
+            covered = backfill(tool, batch_size=options["batch_size"], progress=progress)
+            create_index(tool)
+            if covered:
+                # The backfill rewrote every row: clear the old versions and
+                # give the planner statistics on the new column. VACUUM can't
+                # run in a transaction (call_command from one), ANALYZE can
+                vacuum = "ANALYZE" if connection.in_atomic_block else "VACUUM (ANALYZE)"
+                with connection.cursor() as cursor:
+                    cursor.execute(f"{vacuum} {connection.ops.quote_name(tool.table)}")
+            self.stdout.write(f"\r{name}: backfilled {covered:,} ids, indexed")
@@ -0,0 +1,327 @@
+import hashlib
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from project.models import TIMESTAMP_COLUMN, ToolTable, dynamic_models
+from project.timestamps import create_index, install
+
+# BRIN index on the parsed timestamp (see project.timestamps)
+TIMESTAMP_INDEX = "recorded_at_brin"
+# (index suffix, columns) created on every tool table that has the columns
+TOOL_INDEXES = [
+    # ProjectsList / SteppingsList DISTINCTs and CoverageData in id order
+    ("proj_step_id", ["project_name", "stepping", "id"]),
+    # CoverageData keyset pages and streams by testid
+    ("proj_step_test", ["project_name", "stepping", "testid", "id"]),
+    # per-IP hit counts on the scan path
+    ("ip_event", ["ip", "eventid"]),
+]
+
+
+def index_name(table, suffix):
+    name = f"{table}_{suffix}_idx"
+    if len(name) > 63:  # PostgreSQL identifier limit
+        digest = hashlib.md5(name.encode()).hexdigest()[:8]
+        name = f"{table[:63 - len(suffix) - 14]}_{suffix}_{digest}_idx"
+    return name
+
+
+def hot_queries(tool):
+    """
+    The tool-table queries the read APIs run, with sample filter values
+    taken from the table itself.
+    """
+    from coverage.aggregation import tool_hit_queryset
+    from project.views import COVERAGE_DATA_COLUMNS, coverage_columns
+
+    model = tool.model
+    sample = model.objects.order_by("-id").values("project_name", "stepping", "ip").first() or {
+        "project_name": "", "stepping": "", "ip": "",
+    }
+    rows = model.objects.filter(project_name=sample["project_name"], stepping=sample["stepping"])
+    queries = {
+        "projects": model.objects.values_list("project_name", flat=True).distinct(),
+        "steppings": model.objects.filter(project_name=sample["project_name"])
+                     .values_list("stepping", flat=True).distinct(),
+        "coverage_data": coverage_columns(rows).order_by("id").values_list(*COVERAGE_DATA_COLUMNS),
+        "coverage_data_testids": rows.order_by("testid").values_list("testid", flat=True).distinct(),
+        "coverage_data_stream": coverage_columns(rows).order_by("testid", "id").values_list(*COVERAGE_DATA_COLUMNS),
+    }
+    hits = tool_hit_queryset(tool, ip=sample["ip"])
+    if hits is not None:
+        queries["event_hits_for_ip"] = hits
+    return queries
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the indexes the read APIs need on the unmanaged tool tables, "
+        "optionally partition them by project_name, and show EXPLAIN plans before and after."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tool", action="append", dest="tools",
+                            help="Only this tool table. Can be repeated. Defaults to every registered tool.")
+        parser.add_argument("--partition", action="store_true",
+                            help="Convert the table to LIST partitioning by project_name first.")
+        parser.add_argument("--drop-old", action="store_true",
+                            help="With --partition, drop the original table instead of keeping it as "
+                                 "<table>_unpartitioned.")
+        parser.add_argument("--explain", action="store_true",
+                            help="Print the plan of every hot query before and after.")
+        parser.add_argument("--analyze", action="store_true",
+                            help="Use EXPLAIN ANALYZE (runs the queries).")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only print the statements that would run.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Tool table indexing is only supported on PostgreSQL.")
+
+        tools = options["tools"] or list(dynamic_models)
+        unknown = [t for t in tools if t not in dynamic_models]
+        if unknown:
+            raise CommandError(f"Unknown tool(s): {', '.join(unknown)}")
+
+        self.options = options
+        for tool in tools:
+            model = dynamic_models[tool]
+            table = model._meta.db_table
+            if table not in connection.introspection.table_names():
+                self.stderr.write(f"{tool}: table {table} does not exist, skipping")
+                continue
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{tool} ({table})"))
+            before = self.explain(dynamic_models.info(tool)) if options["explain"] else None
+            if options["partition"]:
+                self.partition(dynamic_models.info(tool))
+            self.create_indexes(model)
+            if options["explain"]:
+                self.run_sql("ANALYZE " + connection.ops.quote_name(table))
+                after = self.explain(dynamic_models.info(tool))
+                for name in before:
+                    self.stdout.write(self.style.HTTP_INFO(f"-- {name}: before"))
+                    self.stdout.write(before[name])
+                    self.stdout.write(self.style.HTTP_INFO(f"-- {name}: after"))
+                    self.stdout.write(after[name])
+
+    def run_sql(self, sql, params=None):
+        if self.options["dry_run"]:
+            self.stdout.write(sql + ";" + (f"  -- {params}" if params else ""))
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def explain(self, tool):
+        options = {"analyze": True, "buffers": True} if self.options["analyze"] else {}
+        return {name: qs.explain(**options) for name, qs in hot_queries(tool).items()}
+
+    def is_partitioned(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", [connection.ops.quote_name(table)])
+            return cursor.fetchone()[0] == "p"
+
+    def create_indexes(self, model):
+        qn = connection.ops.quote_name
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            columns = {c.name for c in connection.introspection.get_table_description(cursor, table)}
+            existing = connection.introspection.get_constraints(cursor, table)
+            # An interrupted CREATE INDEX CONCURRENTLY leaves an INVALID index:
+            # never used by the planner, but still listed and kept up to date
+            cursor.execute(
+                "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE i.indrelid = %s::regclass AND NOT i.indisvalid",
+                [qn(table)],
+            )
+            invalid = {row[0] for row in cursor.fetchall()}
+        existing_columns = [
+            c["columns"] for name, c in existing.items() if (c["index"] or c["primary_key"]) and name not in invalid
+        ]
+
+        # CONCURRENTLY keeps writers going but is not available on partitioned parents
+        concurrently = "" if self.is_partitioned(table) else " CONCURRENTLY"
+        for suffix, index_columns in TOOL_INDEXES:
+            if not set(index_columns) <= columns:
+                self.stdout.write(f"  {suffix}: missing column(s), skipped")
+                continue
+            name = index_name(table, suffix)
+            for stale in sorted(invalid):
+                if stale == name or existing.get(stale, {}).get("columns") == index_columns:
+                    self.run_sql(f"DROP INDEX{concurrently} IF EXISTS {qn(stale)}")
+                    self.stdout.write(f"  {suffix}: dropped invalid {stale}")
+            if index_columns in existing_columns:
+                self.stdout.write(f"  {suffix}: already indexed")
+                continue
+            self.run_sql(
+                f"CREATE INDEX{concurrently} IF NOT EXISTS {qn(name)} "
+                f"ON {qn(table)} ({', '.join(qn(c) for c in index_columns)})"
+            )
+            self.stdout.write(f"  {suffix}: created {name}")
+
+    def partition_blockers(self, tool, old):
+        """
+        Why the table can't be swapped for a partitioned copy as it is:
+        views and foreign keys that would stay with the original table, and
+        indexes beyond the ones this command creates, which the copy would
+        not have. None of them are recreated.
+        """
+        qn = connection.ops.quote_name
+        table = tool.table
+        blockers = []
+        if old in connection.introspection.table_names():
+            blockers.append(f"{old} exists already")
+        if tool.model.objects.filter(project_name__isnull=True).exists():
+            blockers.append("rows with a NULL project_name (the partition key is part of the primary key)")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT DISTINCT r.ev_class::regclass::text FROM pg_depend d "
+                "JOIN pg_rewrite r ON r.oid = d.objid AND d.classid = 'pg_rewrite'::regclass "
+                "WHERE d.refobjid = %s::regclass AND r.ev_class <> d.refobjid ORDER BY 1",
+                [qn(table)],
+            )
+            blockers += [f"view {view} depends on it" for view, in cursor.fetchall()]
+            cursor.execute(
+                "SELECT conname, conrelid::regclass::text FROM pg_constraint "
+                "WHERE contype = 'f' AND (conrelid = %s::regclass OR confrelid = %s::regclass) ORDER BY 1",
+                [qn(table), qn(table)],
+            )
+            blockers += [f"foreign key {name} on {on}" for name, on in cursor.fetchall()]
+            constraints = connection.introspection.get_constraints(cursor, table)
+
+        known = {index_name(table, suffix) for suffix, _ in TOOL_INDEXES} | {index_name(table, TIMESTAMP_INDEX)}
+        known_columns = [columns for _, columns in TOOL_INDEXES] + [[TIMESTAMP_COLUMN]]
+        for name, constraint in sorted(constraints.items()):
+            if constraint["primary_key"] or not (constraint["index"] or constraint["unique"]):
+                continue
+            if name not in known and constraint["columns"] not in known_columns:
+                blockers.append(f"index {name} ({', '.join(constraint['columns'])})")
+        return blockers
+
+    def carried_over(self, table):
+        """
+        (sql, params) statements giving a new table under the name of table
+        the owner, grants and comments table has now.
+        """
+        qn = connection.ops.quote_name
+        statements = []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_get_userbyid(relowner), current_user, obj_description(oid, 'pg_class') "
+                "FROM pg_class WHERE oid = %s::regclass",
+                [qn(table)],
+            )
+            owner, user, comment = cursor.fetchone()
+            if owner != user:
+                statements.append((f"ALTER TABLE {qn(table)} OWNER TO {qn(owner)}", None))
+            cursor.execute(
+                "SELECT a.privilege_type, CASE WHEN a.grantee = 0 THEN 'PUBLIC' "
+                "ELSE quote_ident(pg_get_userbyid(a.grantee)) END, a.is_grantable "
+                "FROM pg_class c, aclexplode(c.relacl) AS a "
+                "WHERE c.oid = %s::regclass AND a.grantee <> c.relowner ORDER BY 2, 1",
+                [qn(table)],
+            )
+            for privilege, grantee, grantable in cursor.fetchall():
+                statements.append((
+                    f"GRANT {privilege} ON {qn(table)} TO {grantee}" + (" WITH GRANT OPTION" if grantable else ""),
+                    None,
+                ))
+            if comment is not None:
+                statements.append((f"COMMENT ON TABLE {qn(table)} IS %s", [comment]))
+            cursor.execute(
+                "SELECT attname, col_description(attrelid, attnum) FROM pg_attribute "
+                "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped "
+                "AND col_description(attrelid, attnum) IS NOT NULL ORDER BY attnum",
+                [qn(table)],
+            )
+            for column, comment in cursor.fetchall():
+                statements.append((f"COMMENT ON COLUMN {qn(table)}.{qn(column)} IS %s", [comment]))
+        return statements
+
+    def partition(self, tool):
+        """
+        Swaps the table for a LIST-partitioned copy with one partition per
+        project_name plus a DEFAULT partition, in one transaction. The copy
+        gets the owner, grants and comments of the original, the parsed
+        timestamp keeps its trigger and BRIN index. The original is kept as
+        <table>_unpartitioned unless --drop-old.
+        """
+        qn = connection.ops.quote_name
+        model, table = tool.model, tool.table
+        if self.is_partitioned(table):
+            self.stdout.write("  already partitioned")
+            return
+
+        old = f"{table}_unpartitioned"
+        blockers = self.partition_blockers(tool, old)
+        if blockers:
+            raise CommandError(f"Not partitioning {table}: " + "; ".join(blockers))
+        projects = list(model.objects.values_list("project_name", flat=True).distinct().order_by("project_name"))
+        carried_over = self.carried_over(table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT is_identity FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'id'",
+                [table],
+            )
+            identity = cursor.fetchone()[0] == "YES"
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [qn(table)])
+            sequence = cursor.fetchone()[0]
+
+        with transaction.atomic():
+            self.run_sql(f"LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE")
+            self.run_sql(f"ALTER TABLE {qn(table)} RENAME TO {qn(old)}")
+            self.run_sql(
+                f"CREATE TABLE {qn(table)} (LIKE {qn(old)} INCLUDING DEFAULTS INCLUDING IDENTITY "
+                f"INCLUDING CONSTRAINTS) PARTITION BY LIST (project_name)"
+            )
+            # The partition key has to be part of the primary key
+            self.run_sql(f"ALTER TABLE {qn(table)} ADD PRIMARY KEY (id, project_name)")
+            for project in projects:
+                name = f"{table}_p_{hashlib.md5(project.encode()).hexdigest()[:8]}"
+                self.run_sql(
+                    f"CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES IN (%s)", [project]
+                )
+            self.run_sql(f"CREATE TABLE {qn(table + '_default')} PARTITION OF {qn(table)} DEFAULT")
+            self.run_sql(f"INSERT INTO {qn(table)} SELECT * FROM {qn(old)}")
+            for sql, params in carried_over:
+                self.run_sql(sql, params)
+
+            if identity:
+                # The new identity sequence starts at 1, move it past the copied ids
+                self.run_sql(
+                    f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {qn(table)}), false)",
+                    [qn(table)],
+                )
+            elif sequence:
+                # serial: keep using the old sequence, but let the new table own it
+                self.run_sql(f"ALTER SEQUENCE {sequence} OWNED BY {qn(table)}.id")
+            if self.options["drop_old"]:
+                self.run_sql(f"DROP TABLE {qn(old)}")
+            else:
+                # Index names are per schema: the new table's would clash with (and
+                # be skipped for) the old table's, which keeps them across the rename
+                for suffix in [suffix for suffix, _ in TOOL_INDEXES] + [TIMESTAMP_INDEX]:
+                    self.run_sql(f"ALTER INDEX IF EXISTS {qn(index_name(table, suffix))} "
+                                 f"RENAME TO {qn(index_name(old, suffix))}")
+                # Kept out of the tool list, discovery would pick it up otherwise
+                if self.options["dry_run"]:
+                    self.stdout.write(f"-- {old} registered as a disabled ToolTable")
+                else:
+                    ToolTable.objects.update_or_create(name=old, defaults={"table": "", "enabled": False})
+
+            if tool.has_column(TIMESTAMP_COLUMN):
+                # LIKE copies neither triggers nor indexes; without the trigger
+                # new rows would have no parsed timestamp
+                if self.options["dry_run"]:
+                    self.stdout.write(f"-- {TIMESTAMP_COLUMN} trigger and BRIN index set up again (project.timestamps)")
+                else:
+                    install(tool)
+                    create_index(tool)
+
+        if not self.options["dry_run"]:
+            dynamic_models.reload()
+        self.stdout.write(f"  partitioned into {len(projects)} project partition(s) + default"
+                          + ("" if self.options["drop_old"] else f", the original is kept as {old}"))
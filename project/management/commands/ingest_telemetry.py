@@ -0,0 +1,33 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from project.ingest import FORMATS, TELEMETRY_BATCH_SIZE, ingest_stream
+from project.models import dynamic_models
+
+
+class Command(BaseCommand):
+    help = "Load NDJSON or CSV telemetry into a tool table using COPY in bounded batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("tool", help="Tool table to load into.")
+        parser.add_argument("path", help="Input file, or - for stdin.")
+        parser.add_argument("--format", choices=FORMATS,
+                            help="Input format. Defaults to csv for *.csv files, ndjson otherwise.")
+        parser.add_argument("--batch-size", type=int, default=TELEMETRY_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        tool = options["tool"]
+        if tool not in dynamic_models:
+            raise CommandError(f"Unknown tool {tool!r}. Available: {', '.join(dynamic_models)}")
+
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.endswith(".csv") else "ndjson")
+        stream = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+        try:
+            for ack in ingest_stream(dynamic_models[tool], stream, fmt=fmt, batch_size=options["batch_size"]):
+                self.stdout.write(json.dumps(ack))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from project.catalog import rebuild_catalog, rebuild_testcase_events, refresh_catalog, refresh_testcase_events
+from project.models import dynamic_models
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold new telemetry rows into the project / stepping catalog and the testcase event index "
+        "(or rebuild both from scratch)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tool", action="append", dest="tools",
+                            help="Only refresh this tool table. Can be repeated.")
+        parser.add_argument("--rebuild", action="store_true",
+                            help="Drop the catalog and index rows and recount from id 0.")
+
+    def handle(self, *args, **options):
+        tools = options["tools"]
+        unknown = [t for t in tools or [] if t not in dynamic_models]
+        if unknown:
+            raise CommandError(f"Unknown tool(s): {', '.join(unknown)}")
+
+        for name, refresh, rebuild in [("catalog", refresh_catalog, rebuild_catalog),
+                                       ("testcase events", refresh_testcase_events, rebuild_testcase_events)]:
+            if options["rebuild"]:
+                folded = rebuild(tools)
+            else:
+                folded, _ = refresh(tools)
+            for tool, id_range in folded.items():
+                self.stdout.write(f"{tool} {name}: watermark advanced by {id_range} ids")
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0002_alter_nanoscope_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetryWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consumer', models.CharField(max_length=100)),
+                ('tool', models.CharField(max_length=100)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('consumer', 'tool'), name='unique_consumer_tool')],
+            },
+        ),
+    ]
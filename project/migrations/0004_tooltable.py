@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0003_telemetrywatermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ToolTable',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('table', models.CharField(blank=True, help_text='Defaults to the tool name', max_length=100)),
+                ('enabled', models.BooleanField(default=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0004_tooltable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogTestcase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tool', models.CharField(max_length=100)),
+                ('project_name', models.CharField(max_length=100)),
+                ('stepping', models.CharField(max_length=100)),
+                ('testid', models.CharField(max_length=100)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tool', 'project_name', 'stepping', 'testid'), name='unique_catalog_testcase')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProjectCatalog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tool', models.CharField(max_length=100)),
+                ('project_name', models.CharField(max_length=100)),
+                ('stepping', models.CharField(max_length=100)),
+                ('row_count', models.BigIntegerField(default=0)),
+                ('testcase_count', models.BigIntegerField(default=0)),
+                ('first_timestamp', models.CharField(blank=True, max_length=100, null=True)),
+                ('last_timestamp', models.CharField(blank=True, max_length=100, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tool', 'project_name', 'stepping'), name='unique_project_catalog')],
+            },
+        ),
+    ]
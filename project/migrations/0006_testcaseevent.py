@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0005_projectcatalog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestcaseEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tool', models.CharField(max_length=100)),
+                ('project_name', models.CharField(max_length=100)),
+                ('stepping', models.CharField(max_length=100)),
+                ('testid', models.CharField(max_length=100)),
+                ('event_id', models.CharField(max_length=500)),
+                ('hits', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tool', 'project_name', 'stepping', 'testid', 'event_id'), name='unique_testcase_event')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0006_testcaseevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='telemetrywatermark',
+            name='pending',
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -1,5 +1,10 @@
 from django.db import models
-from django.apps import apps
+
+from .registry import ToolRegistry
+
+# Parsed time_stmp, filled by a trigger (see project.timestamps)
+TIMESTAMP_COLUMN = "recorded_at"
+
 
 class ToolBase(models.Model):
     id = models.AutoField(primary_key=True)
@@ -39,14 +44,113 @@ class ToolBase(models.Model):
 
     ip = models.CharField(max_length=200)
 
+    recorded_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         abstract = True
 
 
-# Tools list
+class TelemetryWatermark(models.Model):
+    """
+    Highest tool row id already folded into a derived table.
+    Tool tables are append-only so everything above last_id is new, apart
+    from the ids of pending: [low, high, xmax, recorded] ranges below
+    last_id that were missing when it moved (ids are handed out in sequence
+    order, not commit order). They are scanned again until every transaction
+    older than xmax has finished and TELEMETRY_WATERMARK_GRACE_S has passed
+    since recorded (epoch seconds). xmax is null once no open transaction is
+    known to hold the ids.
+    """
+    consumer = models.CharField(max_length=100)
+    tool = models.CharField(max_length=100)
+    last_id = models.BigIntegerField(default=0)
+    pending = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['consumer', 'tool'], name="unique_consumer_tool")
+        ]
+
+
+class ToolTable(models.Model):
+    """
+    Tool tables registered without a code change. Disabled rows hide a table
+    that would otherwise be discovered from the database catalog.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    table = models.CharField(max_length=100, blank=True, help_text="Defaults to the tool name")
+    enabled = models.BooleanField(default=True)
+
+    def __str__(self):
+        return self.name
+
+
+class ProjectCatalog(models.Model):
+    """
+    One row per tool, project and stepping with what the tool table holds for
+    it. Kept up to date by project.catalog.refresh_catalog, so the dropdowns
+    never scan a tool table.
+    """
+    tool = models.CharField(max_length=100)
+    project_name = models.CharField(max_length=100)
+    stepping = models.CharField(max_length=100)
+    row_count = models.BigIntegerField(default=0)
+    testcase_count = models.BigIntegerField(default=0)
+    # time_stmp of the first / last row by id
+    first_timestamp = models.CharField(max_length=100, null=True, blank=True)
+    last_timestamp = models.CharField(max_length=100, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tool', 'project_name', 'stepping'], name="unique_project_catalog")
+        ]
+
+
+class CatalogTestcase(models.Model):
+    """
+    Testcases already counted in ProjectCatalog.testcase_count, so a testcase
+    whose rows arrive over several folds is counted once.
+    """
+    tool = models.CharField(max_length=100)
+    project_name = models.CharField(max_length=100)
+    stepping = models.CharField(max_length=100)
+    testid = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tool', 'project_name', 'stepping', 'testid'], name="unique_catalog_testcase"
+            )
+        ]
+
+
+class TestcaseEvent(models.Model):
+    """
+    How many rows of a testcase name each event in events_covered, kept up
+    to date by project.catalog.refresh_testcase_events. CoverageData groups
+    it per event instead of splitting events_covered row by row.
+    """
+    tool = models.CharField(max_length=100)
+    project_name = models.CharField(max_length=100)
+    stepping = models.CharField(max_length=100)
+    testid = models.CharField(max_length=100)
+    event_id = models.CharField(max_length=500)
+    hits = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tool', 'project_name', 'stepping', 'testid', 'event_id'], name="unique_testcase_event"
+            )
+        ]
+
+
+# Tools list (always registered, more are discovered at runtime by project.registry)
 available_tool = ['nanoscope']
 
-dynamic_models = {}
+seed_models = {}
 
 for table_name in available_tool:
     attrs = {
@@ -57,7 +161,7 @@ for table_name in available_tool:
         })
     }
     model = type(table_name, (ToolBase,), attrs)
-    dynamic_models[table_name] = model
+    seed_models[table_name] = model
 
-    # # Register the model in the app registry
-    # apps.register_model('project', model)
+# tool name -> model, behaves like the dict it used to be
+dynamic_models = ToolRegistry(ToolBase, seed_models)
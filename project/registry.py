@@ -0,0 +1,199 @@
+import logging
+import threading
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+from django.apps.registry import Apps
+from django.conf import settings
+from django.db import DatabaseError, connection, models
+
+logger = logging.getLogger(__name__)
+
+# A table needs these columns to be picked up as a tool table from the catalog
+REQUIRED_COLUMNS = {"id", "project_name", "stepping", "testid"}
+
+
+@dataclass(frozen=True)
+class ToolInfo:
+    """
+    A registered tool table and the column metadata the read paths need,
+    resolved once when the tool is (re)loaded.
+    """
+    name: str
+    table: str
+    model: type
+    columns: frozenset
+    eid_field: str
+    ip_field: str | None
+
+    def has_column(self, column):
+        return column in self.columns
+
+
+def catalog_tables():
+    """
+    {table: set of columns} for the ordinary and partitioned tables of the
+    current schema. Partitions are left out, their parent stands for them.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT c.relname, array_agg(a.attname::text)
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+                WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+                GROUP BY c.relname
+            """)
+            return {table: set(columns) for table, columns in cursor.fetchall()}
+
+    with connection.cursor() as cursor:
+        return {
+            table: {c.name for c in connection.introspection.get_table_description(cursor, table)}
+            for table in connection.introspection.table_names(cursor)
+        }
+
+
+def build_tool_model(base, table, columns):
+    """
+    Unmanaged model over a tool table with the base fields the table actually has.
+    Each model gets its own app registry so tools can be rebuilt at runtime
+    without clashing with earlier versions or showing up in migrations.
+    """
+    attrs = {
+        '__module__': base.__module__,
+        'Meta': type('Meta', (), {
+            'db_table': table,
+            'managed': False,
+            'app_label': base._meta.app_label,
+            'apps': Apps(),
+        }),
+    }
+    for field in base._meta.fields:
+        if field.column in columns:
+            attrs[field.name] = field.clone()
+    return type(table, (models.Model,), attrs)
+
+
+class ToolRegistry(Mapping):
+    """
+    tool name -> model for every known tool table.
+
+    Tools come from the seed list (available_tool), enabled ToolTable rows and,
+    with TELEMETRY_DISCOVER_TOOL_TABLES, every table in the database catalog
+    that looks like a tool table. The catalog is read lazily on first use and
+    again after TELEMETRY_TOOL_REGISTRY_TTL seconds or an explicit reload(),
+    so requests in between only read a dict.
+    """
+
+    def __init__(self, base, seed_models):
+        self.base = base
+        self.seed_models = dict(seed_models)
+        self._tools = {
+            name: self._info(name, model, {f.column for f in model._meta.fields})
+            for name, model in self.seed_models.items()
+        }
+        self._built = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _info(self, name, model, columns):
+        field_names = {f.name for f in model._meta.fields}
+        return ToolInfo(
+            name=name,
+            table=model._meta.db_table,
+            model=model,
+            columns=frozenset(columns),
+            eid_field="eventid" if "eventid" in field_names else "event_id",
+            ip_field="ip" if "ip" in field_names else None,
+        )
+
+    def _model_for(self, name, table, columns):
+        seed = self.seed_models.get(name)
+        base_columns = {f.column for f in self.base._meta.fields}
+        if seed is not None and seed._meta.db_table == table and base_columns <= columns:
+            return seed
+        key = (table, frozenset(columns & base_columns))
+        if key not in self._built:
+            self._built[key] = build_tool_model(self.base, table, columns)
+        return self._built[key]
+
+    def reload(self):
+        """
+        Re-reads the catalog and ToolTable, then swaps the tool map in one assignment.
+        """
+        from .models import ToolTable
+
+        with self._lock:
+            try:
+                catalog = catalog_tables()
+                configured = {t.name: t for t in ToolTable.objects.all()}
+            except DatabaseError:
+                logger.exception("Could not load tool tables, keeping the current registry")
+                self._loaded_at = time.monotonic()
+                return
+
+            wanted = {name: model._meta.db_table for name, model in self.seed_models.items()}
+            disabled = set()
+            for name, tool in configured.items():
+                if tool.enabled:
+                    wanted[name] = tool.table or name
+                else:
+                    wanted.pop(name, None)
+                    disabled.add(tool.table or name)
+
+            if getattr(settings, "TELEMETRY_DISCOVER_TOOL_TABLES", True):
+                claimed = set(wanted.values()) | disabled
+                claimed.update(connection.introspection.django_table_names(include_views=False))
+                for table, columns in catalog.items():
+                    if table not in claimed and REQUIRED_COLUMNS <= columns and (
+                        "eventid" in columns or "event_id" in columns
+                    ):
+                        wanted[table] = table
+
+            tools = {}
+            for name, table in sorted(wanted.items()):
+                if table in catalog:
+                    model = self._model_for(name, table, catalog[table])
+                    tools[name] = self._info(name, model, catalog[table])
+                elif name in self.seed_models:
+                    # Seed tools stay listed even before their table exists
+                    tools[name] = self._tools.get(name) or self._info(
+                        name, self.seed_models[name], {f.column for f in self.seed_models[name]._meta.fields}
+                    )
+            self._tools = tools
+            self._loaded_at = time.monotonic()
+
+    def _current(self):
+        ttl = getattr(settings, "TELEMETRY_TOOL_REGISTRY_TTL", 300)
+        if self._loaded_at is None or (ttl and time.monotonic() - self._loaded_at > ttl):
+            self.reload()
+        return self._tools
+
+    def info(self, name):
+        return self._current()[name]
+
+    def tools(self):
+        return list(self._current().values())
+
+    # Async views can't touch the database directly, a reload may be due
+    async def atools(self):
+        return await sync_to_async(self.tools)()
+
+    async def aget(self, name, default=None):
+        info = (await sync_to_async(self._current)()).get(name)
+        return info.model if info is not None else default
+
+    def __getitem__(self, name):
+        return self._current()[name].model
+
+    def __iter__(self):
+        return iter(self._current())
+
+    def __len__(self):
+        return len(self._current())
+
+    def __contains__(self, name):
+        return name in self._current()
@@ -1,3 +1,573 @@
-from django.test import TestCase
+import io
+import json
+import threading
+import tracemalloc
+from contextlib import contextmanager
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.versioning import response_cache
+from coverage.models import Coverage
+from . import async_views
+from .catalog import CATALOG_CONSUMER, refresh_catalog, refresh_testcase_events
+from .ingest import ingest_records
+from .management.commands.index_tool_tables import index_name
+from .models import CatalogTestcase, ProjectCatalog, TelemetryWatermark, TestcaseEvent, ToolTable, dynamic_models
+
+
+class ToolTableTestCase(TestCase):
+    """
+    Tool models are unmanaged, so the test database has no tables for them.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        existing = connection.introspection.table_names()
+        with connection.schema_editor() as schema_editor:
+            for model in dynamic_models.values():
+                if model._meta.db_table not in existing:
+                    schema_editor.create_model(model)
+        # The tables (and their ids) start over with every class, responses
+        # cached by an earlier class would match their versions
+        response_cache().clear()
+
+
+# Folds run inline, fan-out threads would keep connections to the test database
+@override_settings(TOOL_FANOUT_MAX_WORKERS=1)
+class LateCommitTestCase(TransactionTestCase):
+    """
+    Tool rows committed from a second connection after rows with higher ids,
+    as concurrent ingests do. The tool tables are created per test and
+    committed, so the other connection sees them.
+    """
+
+    def setUp(self):
+        existing = connection.introspection.table_names()
+        created = [model for model in dynamic_models.values() if model._meta.db_table not in existing]
+        with connection.schema_editor() as schema_editor:
+            for model in created:
+                schema_editor.create_model(model)
+        self.addCleanup(self.drop_tables, created)
+
+    def drop_tables(self, models):
+        with connection.schema_editor() as schema_editor:
+            for model in models:
+                schema_editor.delete_model(model)
+
+    @contextmanager
+    def late_row(self, model, **fields):
+        """
+        Inserts a row in a transaction of another connection that stays open
+        for the block and commits when it ends.
+        """
+        inserted, commit = threading.Event(), threading.Event()
+
+        def write():
+            try:
+                with transaction.atomic():
+                    list(ingest_records(model, [(1, fields)]))
+                    inserted.set()
+                    commit.wait(timeout=10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        inserted.wait(timeout=10)
+        try:
+            yield
+        finally:
+            commit.set()
+            thread.join()
+
+
+class ToolRegistryTests(ToolTableTestCase):
+    def setUp(self):
+        # DDL is rolled back with the test transaction, the registry is not
+        self.addCleanup(dynamic_models.reload)
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE lintscope (id serial PRIMARY KEY, project_name varchar(100), "
+                           "stepping varchar(100), testid varchar(100), eventid varchar(100))")
+            cursor.execute("INSERT INTO lintscope (project_name, stepping, testid, eventid) "
+                           "VALUES ('P1', 'A0', 'T1', 'EV1')")
+
+    def test_discovers_new_table(self):
+        dynamic_models.reload()
+        self.assertIn("lintscope", self.client.get(reverse("tools-list")).json())
+        self.assertEqual(self.client.get(reverse("projects-list"), {"tool": "lintscope"}).json(), ["P1"])
+
+        info = dynamic_models.info("lintscope")
+        self.assertEqual(info.eid_field, "eventid")
+        self.assertIsNone(info.ip_field)
+        self.assertFalse(info.has_column("body"))
+
+    def test_disabled_table_is_hidden(self):
+        ToolTable.objects.create(name="lintscope", enabled=False)
+        self.assertNotIn("lintscope", self.client.get(reverse("tools-list")).json())
+
+    def test_registered_under_another_name(self):
+        ToolTable.objects.create(name="lint", table="lintscope")
+        tools = self.client.get(reverse("tools-list")).json()
+        self.assertIn("lint", tools)
+        self.assertNotIn("lintscope", tools)
+        self.assertEqual(dynamic_models["lint"].objects.count(), 1)
+
+    def test_coverage_data_without_testcase_columns(self):
+        dynamic_models.reload()
+        params = {"tool": "lintscope", "project": "P1", "stepping": "A0"}
+
+        full = self.client.get(reverse("coverage-data"), params)
+        self.assertEqual(full.status_code, 200)
+        testcase = full.json()["testcases"][0]
+        self.assertEqual(testcase["id"], "T1")
+        self.assertIsNone(testcase["name"])
+
+        page = self.client.get(reverse("coverage-data"), {**params, "page_size": 1}).json()
+        self.assertEqual([tc["id"] for tc in page["testcases"]], ["T1"])
+        stream = self.client.get(reverse("coverage-data"), {**params, "stream": "1"})
+        self.assertEqual(json.loads(b"".join(stream.streaming_content))["testcases"][0]["id"], "T1")
+
+
+class TelemetryIngestTests(ToolTableTestCase):
+    def post(self, body, content_type="application/x-ndjson", **params):
+        url = reverse("telemetry-ingest") + "?" + "&".join(f"{k}={v}" for k, v in {"tool": "nanoscope", **params}.items())
+        response = self.client.post(url, body, content_type=content_type)
+        return response, [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_ndjson_batches(self):
+        records = [{"testid": f"T{i}", "eventid": "EV1", "ip": "ip0", "step_description": "tab\there"} for i in range(5)]
+        lines = [json.dumps(r) for r in records]
+        lines.insert(2, '{"nope": 1}')
+        lines.insert(4, "not json")
+
+        response, acks = self.post("\n".join(lines), batch_size=2)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([a["accepted"] for a in acks[:-1]], [2, 2, 1])
+        self.assertEqual(acks[1]["errors"][0], {"line": 3, "error": "unknown field(s): nope"})
+        self.assertEqual(acks[-1]["accepted"], 5)
+        self.assertEqual(acks[-1]["rejected"], 2)
+
+        model = dynamic_models["nanoscope"]
+        self.assertEqual(model.objects.count(), 5)
+        row = model.objects.get(testid="T0")
+        self.assertEqual(row.step_description, "tab\there")
+        self.assertIsNone(row.platform)
+        self.assertEqual(row.body, "")
+
+    def test_failed_batch_is_acknowledged(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ALTER TABLE nanoscope ADD CONSTRAINT no_bad_testid CHECK (testid <> 'BAD')")
+        testids = ["T0", "T1", "BAD", "T3", "T4", "T5"]
+        lines = [json.dumps({"testid": testid, "eventid": "EV1"}) for testid in testids]
+
+        response, acks = self.post("\n".join(lines), batch_size=2)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(acks), 3)
+        self.assertEqual(acks[0]["accepted"], 2)
+        self.assertEqual((acks[1]["batch"], acks[1]["accepted"], acks[1]["failed"]), (2, 0, 2))
+        self.assertIn("no_bad_testid", acks[1]["error"])
+        self.assertTrue(acks[2]["done"])
+        self.assertEqual((acks[2]["batches"], acks[2]["accepted"]), (1, 2))
+        self.assertEqual(acks[2]["error"], acks[1]["error"])
+        self.assertEqual(sorted(dynamic_models["nanoscope"].objects.values_list("testid", flat=True)), ["T0", "T1"])
+
+    def test_csv(self):
+        response, acks = self.post("testid,eventid,ip\nT1,EV1,ip0\nT2,EV2,ip0\n", content_type="text/csv")
+        self.assertEqual(acks[-1]["accepted"], 2)
+        self.assertEqual(
+            sorted(dynamic_models["nanoscope"].objects.values_list("testid", "eventid")),
+            [("T1", "EV1"), ("T2", "EV2")],
+        )
+
+    def test_unknown_tool(self):
+        response = self.client.post(reverse("telemetry-ingest") + "?tool=nope", "{}", content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 400)
+
+
+class CoverageDataTestCase(ToolTableTestCase):
+    STEPS = 3
+
+    def add_testcases(self, count):
+        model = dynamic_models["nanoscope"]
+        start = model.objects.values_list("testid", flat=True).distinct().count()
+        model.objects.bulk_create([
+            model(
+                project_name="P", stepping="A0", tool_name="nanoscope", testid=f"T{start + i}",
+                testname=f"test {start + i}", test_result="pass", step_id=str(step),
+                step_description=f"step {step}", step_result="FAIL" if step == 1 else "PASS",
+                events_covered="EV1, EV2", time_stmp=f"2025-10-01T00:00:{step:02d}",
+                body="x" * 2000, versions="v" * 500, test_config_cmd="c" * 500,
+            )
+            for i in range(count)
+            for step in range(self.STEPS)
+        ])
+
+    def get(self, **params):
+        return self.client.get(reverse("coverage-data"), {"tool": "nanoscope", "project": "P", "stepping": "A0", **params})
+
+
+class CoverageDataBenchmark(CoverageDataTestCase):
+    """
+    Query count must not depend on the number of testcases, memory should
+    grow with the response and nothing else.
+    """
+
+    def measure(self):
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return response.json(), len(queries), peak
+
+    def test_scaling(self):
+        results = {}
+        total = 0
+        self.get()  # sets up the testcase event watermark
+        for count in (25, 100, 400):
+            self.add_testcases(count - total)
+            total = count
+            body, queries, peak = self.measure()
+            self.assertEqual(len(body["testcases"]), count)
+            # one entry per event, however many rows name it
+            self.assertEqual([(e["name"], e["count"], e["testcases"]) for e in body["events"]],
+                             [("EV1", count * self.STEPS, count), ("EV2", count * self.STEPS, count)])
+            results[count] = (queries, peak)
+
+        # {testcases: (queries, peak bytes)} in the failure messages
+        self.assertEqual(len({queries for queries, _ in results.values()}), 1, results)
+        # 16x the testcases should cost well under 32x the memory
+        self.assertLess(results[400][1], results[25][1] * 32, results)
+
+    def test_shape(self):
+        self.add_testcases(1)
+        body, _, _ = self.measure()
+        testcase = body["testcases"][0]
+        self.assertEqual(testcase["latestResult"]["failedSteps"], 1)
+        self.assertEqual(testcase["latestResult"]["timestamp"], "2025-10-01T00:00:00")
+        self.assertEqual([s["status"] for s in testcase["steps"]], ["pass", "fail", "pass"])
+        self.assertEqual(body["events"][0]["name"], "EV1")
+
+
+class CoverageDataPagingTests(CoverageDataTestCase):
+    def test_keyset_pages(self):
+        self.add_testcases(5)
+        full = self.get().json()
+
+        seen = []
+        events = {}
+        params = {"page_size": 2}
+        while True:
+            body = self.get(**params).json()
+            seen.extend(tc["id"] for tc in body["testcases"])
+            for event in body["events"]:
+                events[event["name"]] = events.get(event["name"], 0) + event["count"]
+            self.assertEqual(body["testcases"][0]["latestResult"]["timestamp"], "2025-10-01T00:00:00")
+            if not body["next"]:
+                break
+            params = {"page_size": 2, "cursor": body["next"]}
+
+        self.assertEqual(seen, sorted(tc["id"] for tc in full["testcases"]))
+        self.assertEqual(events, {event["name"]: event["count"] for event in full["events"]})
+
+    def test_stream(self):
+        self.add_testcases(4)
+        full = self.get().json()
+
+        response = self.get(stream="1")
+        body = json.loads(b"".join(response.streaming_content))
+
+        self.assertEqual(body["events"], full["events"])
+        self.assertEqual(body["testcases"], sorted(full["testcases"], key=lambda tc: tc["id"]))
+
+
+class ProjectCatalogTests(CoverageDataTestCase):
+    def summary(self, **params):
+        return self.client.get(reverse("project-summary"), params).json()
+
+    def test_counts_follow_new_telemetry(self):
+        self.add_testcases(3)
+        model = dynamic_models["nanoscope"]
+        model.objects.create(project_name="P", stepping="B0", testid="T9", time_stmp="2025-10-02T00:00:00")
+        self.assertEqual(self.client.get(reverse("projects-list"), {"tool": "nanoscope"}).json(), ["P"])
+        self.assertEqual(
+            self.client.get(reverse("steppings-list"), {"tool": "nanoscope", "project": "P"}).json(), ["A0", "B0"]
+        )
+        self.assertEqual(self.summary(tool="nanoscope"), [
+            {"tool": "nanoscope", "project": "P", "stepping": "A0", "rows": 9, "testcases": 3,
+             "first_timestamp": "2025-10-01T00:00:00", "last_timestamp": "2025-10-01T00:00:02"},
+            {"tool": "nanoscope", "project": "P", "stepping": "B0", "rows": 1, "testcases": 1,
+             "first_timestamp": "2025-10-02T00:00:00", "last_timestamp": "2025-10-02T00:00:00"},
+        ])
+
+        # a later step of a testcase that was already counted, and a new project
+        model.objects.create(project_name="P", stepping="B0", testid="T9", time_stmp="2025-10-03T00:00:00")
+        model.objects.create(project_name="Q", stepping="A0", testid="T1")
+        summary = self.summary()
+        self.assertEqual([(row["project"], row["stepping"]) for row in summary], [("P", "A0"), ("P", "B0"), ("Q", "A0")])
+        self.assertEqual(summary[1]["rows"], 2)
+        self.assertEqual(summary[1]["testcases"], 1)
+        self.assertEqual(summary[1]["last_timestamp"], "2025-10-03T00:00:00")
+        self.assertEqual(self.summary(project="Q")[0]["testcases"], 1)
+        self.assertEqual([(row["project"], row["stepping"]) for row in self.summary(stepping="A0")],
+                         [("P", "A0"), ("Q", "A0")])
+
+    def test_dropdowns_do_not_scan_the_tool_table(self):
+        self.add_testcases(5)
+        self.client.get(reverse("projects-list"), {"tool": "nanoscope"})
+        table = dynamic_models["nanoscope"]._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("projects-list"), {"tool": "nanoscope"})
+            self.client.get(reverse("steppings-list"), {"tool": "nanoscope", "project": "P"})
+        scans = [q["sql"] for q in queries if f'FROM "{table}"' in q["sql"] and "MAX" not in q["sql"]]
+        self.assertEqual(scans, [])
+
+    def test_rebuild(self):
+        self.add_testcases(2)
+        self.summary()
+        call_command("refresh_project_catalog", "--rebuild", stdout=io.StringIO())
+        self.assertEqual([(row["rows"], row["testcases"]) for row in self.summary()], [(6, 2)])
+
+
+class CatalogLateCommitTests(LateCommitTestCase):
+    def test_rows_committed_after_higher_ids_are_counted(self):
+        model = dynamic_models["nanoscope"]
+        # The first rows of project Q commit last
+        with self.late_row(model, project_name="Q", stepping="A0", testid="T1"):
+            model.objects.create(project_name="P", stepping="A0", testid="T2")
+            refresh_catalog()
+            self.assertEqual(list(ProjectCatalog.objects.values_list("project_name", flat=True)), ["P"])
+        refresh_catalog()
+        catalog = ProjectCatalog.objects.order_by("project_name").values_list("project_name", "row_count", "testcase_count")
+        self.assertEqual(list(catalog), [("P", 1, 1), ("Q", 1, 1)])
+        self.assertEqual(CatalogTestcase.objects.count(), 2)
+
+    def test_ids_taken_before_the_writer_shows_as_open_are_counted(self):
+        model = dynamic_models["nanoscope"]
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            # nextval() gives the writer no transaction id, no snapshot lists it
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id'))", [table])
+            taken = cursor.fetchone()[0]
+        model.objects.create(project_name="P", stepping="A0", testid="T2")
+        refresh_catalog()
+        model.objects.create(id=taken, project_name="Q", stepping="A0", testid="T1")
+        refresh_catalog()
+        catalog = ProjectCatalog.objects.order_by("project_name").values_list("project_name", "row_count")
+        self.assertEqual(list(catalog), [("P", 1), ("Q", 1)])
+
+        # An id that is never written (a rolled back insert) is let go after the grace period
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id'))", [table])
+        model.objects.create(project_name="P", stepping="A0", testid="T3")
+        refresh_catalog()
+        watermark = TelemetryWatermark.objects.get(consumer=CATALOG_CONSUMER, tool="nanoscope")
+        self.assertEqual(len(watermark.pending), 1)
+        with override_settings(TELEMETRY_WATERMARK_GRACE_S=0):
+            refresh_catalog()
+        watermark.refresh_from_db()
+        self.assertEqual(watermark.pending, [])
+
+    def test_testcase_events_committed_after_higher_ids_are_counted(self):
+        model = dynamic_models["nanoscope"]
+        with self.late_row(model, project_name="P", stepping="A0", testid="T1", events_covered="EV1, EV2"):
+            model.objects.create(project_name="P", stepping="A0", testid="T1", events_covered="EV1")
+            refresh_testcase_events()
+            self.assertEqual(dict(TestcaseEvent.objects.values_list("event_id", "hits")), {"EV1": 1})
+        refresh_testcase_events()
+        self.assertEqual(dict(TestcaseEvent.objects.values_list("event_id", "hits")), {"EV1": 2, "EV2": 1})
+
+
+class CoverageEventTests(CoverageDataTestCase):
+    def events(self, **params):
+        return [(e["name"], e["count"], e["testcases"], e["threshold"], e["description"])
+                for e in self.get(**params).json()["events"]]
+
+    def test_counts_and_thresholds(self):
+        Coverage.objects.create(event_id="EV1", event_name="event one", event_type="t", ip="ip0", threshold=2)
+        Coverage.objects.create(event_id="EV1", event_name="event one", event_type="t", ip="ip1", threshold=3)
+        self.add_testcases(2)
+        self.assertEqual(self.events(), [("EV1", 6, 2, 5, "event one"), ("EV2", 6, 2, 0, "")])
+
+        # folded incrementally, a testcase split over two folds counts once
+        model = dynamic_models["nanoscope"]
+        model.objects.create(project_name="P", stepping="A0", testid="T0", events_covered="EV2,, EV3")
+        self.add_testcases(1)
+        self.assertEqual(self.events(), [
+            ("EV1", 9, 3, 5, "event one"), ("EV2", 10, 3, 0, ""), ("EV3", 1, 1, 0, ""),
+        ])
+        self.assertEqual(self.events(page_size=1), [("EV1", 3, 1, 5, "event one"), ("EV2", 4, 1, 0, ""),
+                                                    ("EV3", 1, 1, 0, "")])
+
+    def test_one_query_for_the_events(self):
+        self.add_testcases(3)
+        self.get()
+        with CaptureQueriesContext(connection) as queries:
+            self.get()
+        self.assertEqual(len([q for q in queries if "testcaseevent" in q["sql"]]), 1)
+
+
+class TimestampTests(CoverageDataTestCase):
+    def setUp(self):
+        self.addCleanup(dynamic_models.reload)
+        self.model = dynamic_models["nanoscope"]
+        for stamp in ["2025-01-01T10:00:00", "2025-01-02T09:00:00+02:00", "not a time", "2025-01-08"]:
+            self.model.objects.create(project_name="P", stepping="A0", testid=stamp, time_stmp=stamp,
+                                      events_covered="EV1")
+        call_command("backfill_tool_timestamps", "--batch-size", "3", stdout=io.StringIO())
+
+    def recorded(self):
+        return [str(stamp) for stamp in self.model.objects.order_by("id").values_list("recorded_at", flat=True)]
+
+    def test_backfill_and_trigger(self):
+        self.assertEqual(self.recorded(), [
+            "2025-01-01 10:00:00+00:00", "2025-01-02 07:00:00+00:00", "None", "2025-01-08 00:00:00+00:00",
+        ])
+        # rows written from now on are parsed as they go in
+        self.model.objects.create(project_name="P", stepping="A0", testid="T9", time_stmp="2025-01-09T12:00:00Z")
+        self.assertEqual(self.recorded()[-1], "2025-01-09 12:00:00+00:00")
+
+    def test_naive_stamps_are_utc_in_any_session(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET TIME ZONE 'America/New_York'")
+            try:
+                # Compared in SQL, the driver reads timestamptz back in the session's zone
+                cursor.execute("SELECT telemetry_parse_timestamp(' 2025-01-09T12:00:00 ') = '2025-01-09T12:00Z', "
+                               "telemetry_parse_timestamp('2025-01-09T12:00:00+02:00') = '2025-01-09T10:00Z', "
+                               "telemetry_parse_timestamp('2025-02-30') IS NULL, "
+                               "telemetry_parse_timestamp('') IS NULL")
+                parsed = cursor.fetchone()
+            finally:
+                cursor.execute("SET TIME ZONE 'UTC'")
+        self.assertEqual(parsed, (True, True, True, True))
+
+    def test_partitioning_keeps_the_trigger_and_index(self):
+        call_command("index_tool_tables", "--tool", "nanoscope", "--partition", stdout=io.StringIO())
+        self.model.objects.create(project_name="P", stepping="A0", testid="T9", time_stmp="2025-01-09T12:00:00Z")
+        self.assertEqual(self.recorded()[-1], "2025-01-09 12:00:00+00:00")
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, self.model._meta.db_table)
+        self.assertIn(["recorded_at"], [index["columns"] for index in indexes.values() if index["index"]])
+
+    def test_partitioning_keeps_grants_and_the_original(self):
+        table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f"GRANT SELECT ON {table} TO PUBLIC")
+            cursor.execute(f"COMMENT ON COLUMN {table}.testid IS 'test case'")
+        call_command("index_tool_tables", "--tool", "nanoscope", "--partition", stdout=io.StringIO())
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT has_table_privilege('public', %s, 'SELECT')", [table])
+            self.assertTrue(cursor.fetchone()[0])
+            cursor.execute("SELECT col_description(attrelid, attnum) FROM pg_attribute "
+                           "WHERE attrelid = %s::regclass AND attname = 'testid'", [table])
+            self.assertEqual(cursor.fetchone()[0], "test case")
+        self.assertIn(f"{table}_unpartitioned", connection.introspection.table_names())
+
+    def test_partitioning_refuses_what_it_would_lose(self):
+        table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE VIEW nanoscope_tests AS SELECT testid FROM {table}")
+            cursor.execute(f"CREATE INDEX nanoscope_testname ON {table} (testname)")
+            cursor.execute(f"ALTER TABLE {table} ALTER project_name DROP NOT NULL")
+        self.model.objects.filter(testid="not a time").update(project_name=None)
+
+        with self.assertRaises(CommandError) as raised:
+            call_command("index_tool_tables", "--tool", "nanoscope", "--partition", stdout=io.StringIO())
+        for blocker in ("NULL project_name", "view nanoscope_tests", "index nanoscope_testname"):
+            self.assertIn(blocker, str(raised.exception))
+        self.assertEqual(self.model.objects.count(), 4)
+
+    def test_invalid_index_is_rebuilt(self):
+        qn = connection.ops.quote_name
+        table = self.model._meta.db_table
+        name = index_name(table, "proj_step_test")
+        with connection.cursor() as cursor:
+            # What an interrupted CREATE INDEX CONCURRENTLY leaves behind
+            cursor.execute(f"CREATE INDEX {qn(name)} ON {qn(table)} (project_name, stepping, testid, id)")
+            cursor.execute("UPDATE pg_index SET indisvalid = false WHERE indexrelid = %s::regclass", [qn(name)])
+
+        out = io.StringIO()
+        call_command("index_tool_tables", "--tool", "nanoscope", "--dry-run", stdout=out)
+        statements = out.getvalue()
+        create = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {qn(name)} "
+        self.assertIn(f"DROP INDEX CONCURRENTLY IF EXISTS {qn(name)};", statements)
+        self.assertIn(create, statements)
+        self.assertLess(statements.index("DROP INDEX"), statements.index(create))
+
+    def test_coverage_data_time_range(self):
+        def testids(**params):
+            response = self.client.get(reverse("coverage-data"), {
+                "tool": "nanoscope", "project": "P", "stepping": "A0", **params,
+            })
+            return sorted(tc["id"] for tc in response.json()["testcases"])
+
+        self.assertEqual(len(testids()), 4)
+        self.assertEqual(testids(since="2025-01-02"), ["2025-01-02T09:00:00+02:00", "2025-01-08"])
+        self.assertEqual(testids(since="2025-01-02", until="2025-01-02T07:00:00Z"), [])
+        # events are counted from the rows in range
+        response = self.client.get(reverse("coverage-data"), {
+            "tool": "nanoscope", "project": "P", "stepping": "A0", "since": "2025-01-02",
+        })
+        self.assertEqual([(e["name"], e["count"]) for e in response.json()["events"]], [("EV1", 2)])
+        response = self.client.get(reverse("coverage-data"), {
+            "tool": "nanoscope", "project": "P", "stepping": "A0", "since": "last week",
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncReadViewTests(CoverageDataTestCase):
+    """
+    The async views serve the same payloads as the DRF ones.
+    """
+
+    async def aget(self, view, name, **params):
+        return await view.as_view()(AsyncRequestFactory().get(reverse(name), params))
+
+    async def test_same_payloads(self):
+        await sync_to_async(self.add_testcases)(3)
+        coverage = {"tool": "nanoscope", "project": "P", "stepping": "A0"}
+        cases = [
+            (async_views.ToolsList, "tools-list", {}),
+            (async_views.ProjectsList, "projects-list", {"tool": "nanoscope"}),
+            (async_views.ProjectsList, "projects-list", {"tool": "nope"}),
+            (async_views.SteppingsList, "steppings-list", {"tool": "nanoscope", "project": "P"}),
+            (async_views.ProjectSummary, "project-summary", {}),
+            (async_views.CoverageData, "coverage-data", coverage),
+            (async_views.CoverageData, "coverage-data", {**coverage, "since": "2025-10-01"}),
+            (async_views.CoverageData, "coverage-data", {**coverage, "page_size": 2}),
+            (async_views.CoverageData, "coverage-data", {"tool": "nanoscope"}),
+        ]
+        for view, name, params in cases:
+            with self.subTest(name=name, params=params):
+                expected = await sync_to_async(self.client.get)(reverse(name), params)
+                response = await self.aget(view, name, **params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(response.content), expected.json())
+
+    async def test_stream(self):
+        await sync_to_async(self.add_testcases)(3)
+        expected = await sync_to_async(self.get)(stream="1")
+        response = await self.aget(
+            async_views.CoverageData, "coverage-data", tool="nanoscope", project="P", stepping="A0", stream="1"
+        )
+        self.assertTrue(response.is_async)
+        body = b"".join([chunk async for chunk in response])
+        expected = await sync_to_async(b"".join)(expected.streaming_content)
+        self.assertEqual(json.loads(body), json.loads(expected))
+
+    async def test_bad_cursor(self):
+        response = await self.aget(
+            async_views.CoverageData, "coverage-data",
+            tool="nanoscope", project="P", stepping="A0", page_size=2, cursor="A",
+        )
+        self.assertEqual(response.status_code, 404)
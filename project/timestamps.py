@@ -0,0 +1,174 @@
+from datetime import datetime, time, timezone
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import TIMESTAMP_COLUMN, TelemetryWatermark
+
+TIMESTAMP_CONSUMER = "recorded_at_backfill"
+TIMESTAMP_BACKFILL_BATCH_SIZE = 50_000
+# Change counter bumped when parsed timestamps are filled in after the fact;
+# time filtered responses depend on it (see core.versioning)
+TIMESTAMP_SCOPE = "timestamps"
+
+# time_stmp -> timestamptz, NULL when it doesn't parse. Naive stamps are UTC.
+# The trigger runs it for every row COPY writes, so it stays cheap there:
+# pg_input_is_valid checks the value without the subtransaction of an
+# EXCEPTION block, and sessions already on UTC (Django's) skip the SET
+# timezone of telemetry_parse_timestamp_utc, which costs more than the parse.
+PARSE_FUNCTION = """
+    CREATE OR REPLACE FUNCTION telemetry_parse_timestamp_utc(value text) RETURNS timestamptz AS $$
+        SELECT CASE WHEN pg_input_is_valid(btrim(value), 'timestamptz') THEN btrim(value)::timestamptz END
+    $$ LANGUAGE sql STABLE SET timezone = 'UTC';
+
+    CREATE OR REPLACE FUNCTION telemetry_parse_timestamp(value text) RETURNS timestamptz AS $$
+        SELECT CASE
+            WHEN current_setting('TimeZone') NOT IN ('UTC', 'Etc/UTC') THEN telemetry_parse_timestamp_utc(value)
+            WHEN pg_input_is_valid(btrim(value), 'timestamptz') THEN btrim(value)::timestamptz
+        END
+    $$ LANGUAGE sql STABLE
+"""
+# Before PostgreSQL 16 there is no pg_input_is_valid
+LEGACY_PARSE_FUNCTION = """
+    CREATE OR REPLACE FUNCTION telemetry_parse_timestamp(value text) RETURNS timestamptz AS $$
+    BEGIN
+        RETURN NULLIF(btrim(value), '')::timestamptz;
+    EXCEPTION WHEN others THEN
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql STABLE SET timezone = 'UTC'
+"""
+
+TRIGGER_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION telemetry_set_recorded_at() RETURNS trigger AS $$
+    BEGIN
+        NEW.{TIMESTAMP_COLUMN} := telemetry_parse_timestamp(NEW.time_stmp);
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+
+def install(tool):
+    """
+    Adds the parsed timestamp column to the table of tool, with a trigger
+    that fills it for every row written from now on (COPY and writers
+    outside this app included). Rows already there are left to backfill().
+    Returns False when the table has no time_stmp to parse.
+    """
+    if not tool.has_column("time_stmp"):
+        return False
+    qn = connection.ops.quote_name
+    table = tool.table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {qn(table)} ADD COLUMN IF NOT EXISTS {TIMESTAMP_COLUMN} timestamptz")
+        cursor.execute(PARSE_FUNCTION if connection.pg_version >= 160000 else LEGACY_PARSE_FUNCTION)
+        cursor.execute(TRIGGER_FUNCTION)
+        cursor.execute(
+            f"CREATE OR REPLACE TRIGGER telemetry_set_recorded_at "
+            f"BEFORE INSERT OR UPDATE OF time_stmp ON {qn(table)} "
+            f"FOR EACH ROW EXECUTE FUNCTION telemetry_set_recorded_at()"
+        )
+    return True
+
+
+def create_index(tool):
+    """
+    BRIN index on the parsed timestamp. Tool tables are append-only and
+    written in time order, so block ranges map to time ranges and the index
+    stays a few pages however big the table gets.
+    """
+    from .management.commands.index_tool_tables import TIMESTAMP_INDEX, index_name
+
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {qn(index_name(tool.table, TIMESTAMP_INDEX))} "
+            f"ON {qn(tool.table)} USING brin ({TIMESTAMP_COLUMN}) WITH (autosummarize = on)"
+        )
+
+
+def backfill(tool, batch_size=TIMESTAMP_BACKFILL_BATCH_SIZE, progress=None):
+    """
+    Parses time_stmp into the timestamp column for the rows written before
+    install(), batch by batch in id order. Each batch commits with its
+    watermark, so an interrupted backfill picks up where it stopped.
+    Returns the number of ids covered.
+    """
+    from core.versioning import bump
+
+    TelemetryWatermark.objects.get_or_create(consumer=TIMESTAMP_CONSUMER, tool=tool.name)
+    qn = connection.ops.quote_name
+    high = tool.model.objects.aggregate(high=Max("id"))["high"] or 0
+    covered = 0
+    while True:
+        with transaction.atomic():
+            watermark = (
+                TelemetryWatermark.objects
+                .select_for_update()
+                .get(consumer=TIMESTAMP_CONSUMER, tool=tool.name)
+            )
+            low = watermark.last_id
+            if low >= high:
+                break
+            upper = min(low + batch_size, high)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {qn(tool.table)} SET {TIMESTAMP_COLUMN} = telemetry_parse_timestamp(time_stmp) "
+                    f"WHERE id > %s AND id <= %s AND {TIMESTAMP_COLUMN} IS NULL",
+                    [low, upper],
+                )
+            watermark.last_id = upper
+            watermark.save(update_fields=["last_id", "updated_at"])
+            bump(TIMESTAMP_SCOPE)
+        covered += upper - low
+        if progress:
+            progress(upper, high)
+    return covered
+
+
+def parse_bound(value):
+    """
+    An ISO 8601 date or date-time from a query parameter, as an aware
+    datetime (UTC when it has no offset). None when value is empty.
+    """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"{value!r} is not an ISO 8601 date or date-time")
+        parsed = datetime.combine(day, time.min)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def time_range(params):
+    """
+    (since, until) of ?since= / ?until=, either may be None. since is
+    inclusive, until exclusive. Raises ValueError on a malformed value.
+    """
+    since, until = parse_bound(params.get("since")), parse_bound(params.get("until"))
+    if since and until and since >= until:
+        raise ValueError("since has to be before until")
+    return since, until
+
+
+def in_time_range(qs, since=None, until=None):
+    """
+    Narrows a queryset over a tool table to [since, until). Rows without a
+    parsed timestamp (and tables without the column) are in no range.
+    """
+    if since is None and until is None:
+        return qs
+    if not any(field.column == TIMESTAMP_COLUMN for field in qs.model._meta.concrete_fields):
+        return qs.none()
+    if since is not None:
+        qs = qs.filter(**{f"{TIMESTAMP_COLUMN}__gte": since})
+    if until is not None:
+        qs = qs.filter(**{f"{TIMESTAMP_COLUMN}__lt": until})
+    return qs
+
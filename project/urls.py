@@ -1,9 +1,16 @@
+from django.conf import settings
 from django.urls import path
-from .views import ToolsList, ProjectsList, SteppingsList, CoverageData
+from . import async_views, views
+from .views import TelemetryIngest
+
+# Read views: async ones under ASGI (ASYNC_READ_VIEWS), DRF ones otherwise
+read_views = async_views if settings.ASYNC_READ_VIEWS else views
 
 urlpatterns = [
-    path("tools/", ToolsList.as_view(), name="tools-list"),
-    path("projects/", ProjectsList.as_view(), name="projects-list"),
-    path("steppings/", SteppingsList.as_view(), name="steppings-list"),
-    path("coverage/", CoverageData.as_view(), name="coverage-data"),
+    path("tools/", read_views.ToolsList.as_view(), name="tools-list"),
+    path("projects/", read_views.ProjectsList.as_view(), name="projects-list"),
+    path("steppings/", read_views.SteppingsList.as_view(), name="steppings-list"),
+    path("summary/", read_views.ProjectSummary.as_view(), name="project-summary"),
+    path("coverage/", read_views.CoverageData.as_view(), name="coverage-data"),
+    path("ingest/", TelemetryIngest.as_view(), name="telemetry-ingest"),
 ]
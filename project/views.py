@@ -1,99 +1,422 @@
+import json
+from functools import partial
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import TextField, Value
+from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .models import dynamic_models
+from core.fanout import tool_timeout
+from core.pagination import decode_cursor, encode_cursor, keyset_page_size
+from core.streaming import StreamingJSONResponse, wants_stream
+from core.versioning import CATALOG, TESTCASE_EVENTS, data_etag
+from .catalog import event_split_sql, has_events, refresh_catalog, refresh_testcase_events
+from .ingest import TELEMETRY_BATCH_SIZE, ingest_stream
+from .models import TIMESTAMP_COLUMN, ProjectCatalog, TestcaseEvent, dynamic_models
+from .timestamps import in_time_range, time_range
+
+# Columns CoverageData reads; the large body / versions / test_config_cmd are left out
+COVERAGE_DATA_COLUMNS = [
+    "id", "testid", "testname", "test_result", "tool_name", "platform", "step_id",
+    "step_description", "step_result", "time_stmp",
+]
+COVERAGE_DATA_CHUNK_SIZE = 2000
+
+
+def coverage_columns(rows):
+    """
+    rows with every COVERAGE_DATA_COLUMNS column selectable; the ones the
+    tool table lacks (discovered tables only need a few) come out as NULL.
+    """
+    present = {field.name for field in rows.model._meta.fields}
+    missing = {column: Value(None, output_field=TextField())
+               for column in COVERAGE_DATA_COLUMNS if column not in present}
+    return rows.annotate(**missing) if missing else rows
 
 # 🔹 Return all tools (table names)
 class ToolsList(APIView):
+    @data_etag()
     def get(self, request):
         tools = list(dynamic_models.keys())
         return Response(tools)
 
 
+def catalog_rows(tools=None):
+    """
+    ProjectCatalog rows of the given tools (all without), with their new
+    telemetry folded in first unless PROJECT_CATALOG_REFRESH_ON_READ is off.
+    Returns (queryset, tools whose fold timed out and were read as they were).
+    """
+    timed_out = []
+    if getattr(settings, "PROJECT_CATALOG_REFRESH_ON_READ", True):
+        _, timed_out = refresh_catalog(tools, wait=False, timeout=tool_timeout())
+    rows = ProjectCatalog.objects.all()
+    if tools:
+        rows = rows.filter(tool__in=tools)
+    return rows, timed_out
+
+
+def testcase_events_timed_out(tool):
+    """
+    Folds the new rows of tool into TestcaseEvent unless
+    PROJECT_CATALOG_REFRESH_ON_READ is off. Returns the tools that timed out.
+    """
+    if not getattr(settings, "PROJECT_CATALOG_REFRESH_ON_READ", True):
+        return []
+    _, timed_out = refresh_testcase_events([tool], wait=False, timeout=tool_timeout())
+    return timed_out
+
+
+def flag_timed_out(response, timed_out):
+    # Same header as coverage.views.flag_partial
+    if timed_out:
+        response["X-Partial-Results"] = ",".join(timed_out)
+    return response
+
+
 # 🔹 Return all projects for a selected tool
 class ProjectsList(APIView):
+    @data_etag(tools=CATALOG)
     def get(self, request):
         tool = request.GET.get("tool")
         if not tool or tool not in dynamic_models:
             return Response([])
-        model = dynamic_models[tool]
-        projects = model.objects.values_list("project_name", flat=True).distinct()
-        return Response(list(projects))
+        rows, timed_out = catalog_rows([tool])
+        projects = rows.order_by("project_name").values_list("project_name", flat=True).distinct()
+        return flag_timed_out(Response(list(projects)), timed_out)
 
 
 # 🔹 Return all steppings for a selected tool & project
 class SteppingsList(APIView):
+    @data_etag(tools=CATALOG)
     def get(self, request):
         tool = request.GET.get("tool")
         project = request.GET.get("project")
         if not tool or tool not in dynamic_models or not project:
             return Response([])
-        model = dynamic_models[tool]
-        steppings = model.objects.filter(project_name=project).values_list(
-            "stepping", flat=True
-        ).distinct()
-        return Response(list(steppings))
+        rows, timed_out = catalog_rows([tool])
+        steppings = rows.filter(project_name=project).order_by("stepping").values_list("stepping", flat=True)
+        return flag_timed_out(Response(list(steppings)), timed_out)
+
+
+def summary_row(entry):
+    return {
+        "tool": entry.tool,
+        "project": entry.project_name,
+        "stepping": entry.stepping,
+        "rows": entry.row_count,
+        "testcases": entry.testcase_count,
+        "first_timestamp": entry.first_timestamp,
+        "last_timestamp": entry.last_timestamp,
+    }
+
+
+# 🔹 Rows, testcases and first / last timestamps per tool, project and stepping
+class ProjectSummary(APIView):
+    """
+    ?tool=, ?project= and ?stepping= narrow the list down, without them every tool and project is listed.
+    """
+
+    @data_etag(tools=CATALOG)
+    def get(self, request):
+        tool = request.GET.get("tool")
+        if tool and tool not in dynamic_models:
+            return Response([])
+        rows, timed_out = catalog_rows([tool] if tool else None)
+        project = request.GET.get("project")
+        if project:
+            rows = rows.filter(project_name=project)
+        stepping = request.GET.get("stepping")
+        if stepping:
+            rows = rows.filter(stepping=stepping)
+        rows = rows.order_by("tool", "project_name", "stepping")
+        return flag_timed_out(Response([summary_row(entry) for entry in rows]), timed_out)
+
+
+def _new_testcase(tc_id, testname, test_result, tool_name, platform):
+    return {
+        "id": tc_id,
+        "name": testname,
+        "status": test_result,
+        "Tool": tool_name,
+        "platform": platform,
+        "failedSteps": 0,
+        "overallResult": test_result,
+        "steps": [],
+        "platforms": [],
+    }
+
+
+def _add_step(tc, step_id, step_description, step_result):
+    tc["steps"].append({
+        "id": step_id,
+        "description": step_description,
+        "status": step_result.lower() if step_result is not None else None,
+    })
+
+
+def _finish_testcase(tc, timestamp):
+    # 🔹 Add latest result summary and platforms
+    failed_count = sum(1 for s in tc["steps"] if s["status"] == "fail")
+    tc["platforms"] = [{
+        "platform": tc["platform"],
+        "status": tc["status"],
+        "steps": tc["steps"],
+        "failedSteps": failed_count,
+        "overallResult": tc["overallResult"],
+        "timestamp": timestamp
+    }]
+    tc["latestResult"] = tc["platforms"][0]
+    return tc
+
+
+def coverage_events_sql(tool, since=None, until=None, testids=None):
+    """
+    (sql, params) of the events of a project and stepping, one row per
+    event: (event_id, hits, testcases, threshold, description). Counts come
+    from TestcaseEvent; with a time range they are counted from the tool
+    rows in range, which TestcaseEvent has no time for. Thresholds (summed
+    over the event's IPs) and names come from Coverage.
+    """
+    from coverage.models import Coverage
+
+    qn = connection.ops.quote_name
+    params = {}
+    where = "project_name = %(project)s AND stepping = %(stepping)s"
+    if testids is not None:
+        where += " AND testid = ANY(%(testids)s)"
+    if since is None and until is None:
+        params["tool"] = tool.name
+        source = f"SELECT testid, event_id, hits FROM {qn(TestcaseEvent._meta.db_table)} " \
+                 f"WHERE tool = %(tool)s AND {where}"
+    else:
+        if since is not None:
+            where += f" AND {TIMESTAMP_COLUMN} >= %(since)s"
+            params["since"] = since
+        if until is not None:
+            where += f" AND {TIMESTAMP_COLUMN} < %(until)s"
+            params["until"] = until
+        source = event_split_sql(qn(tool.table), where)
+
+    coverage = qn(Coverage._meta.db_table)
+    sql = f"""
+        SELECT e.event_id, e.hits, e.testcases, COALESCE(c.threshold, 0), COALESCE(c.event_name, '')
+        FROM (
+            SELECT event_id, SUM(hits)::bigint AS hits, COUNT(*) AS testcases
+            FROM ({source}) AS source
+            GROUP BY event_id
+        ) AS e
+        LEFT JOIN LATERAL (
+            SELECT SUM(threshold) AS threshold, MIN(event_name) AS event_name
+            FROM {coverage} WHERE event_id = e.event_id
+        ) AS c ON true
+        ORDER BY e.event_id
+    """
+    return sql, params
+
+
+def coverage_event(row):
+    event_id, hits, testcases, threshold, description = row
+    return {
+        "id": event_id,
+        "name": event_id,
+        "count": hits,
+        "testcases": testcases,
+        "threshold": threshold,
+        "description": description,
+    }
+
+
+def coverage_events(tool, project, stepping, since=None, until=None, testids=None):
+    """
+    The events named by the testcases of a project and stepping (of the
+    testids only, when given), each once with its real counts, in one
+    grouped query. [] for a tool without events_covered, or a time range
+    on a tool without parsed timestamps.
+    """
+    if not has_events(tool) or ((since or until) and not tool.has_column(TIMESTAMP_COLUMN)):
+        return []
+    sql, params = coverage_events_sql(tool, since, until, testids)
+    params.update(project=project, stepping=stepping, testids=list(testids or ()))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [coverage_event(row) for row in cursor.fetchall()]
+
+
+class CoverageAssembler:
+    """
+    Builds the testcases from COVERAGE_DATA_COLUMNS rows fed one at a time.
+    Without a timestamp the one of the first row is used, so feed rows in id order.
+    """
+
+    def __init__(self, timestamp=None):
+        self.timestamp = timestamp
+        self.data = {}
+
+    def add(self, row):
+        (row_id, tc_id, testname, test_result, tool_name, platform, step_id, step_description,
+         step_result, time_stmp) = row
+        if self.timestamp is None:
+            self.timestamp = str(time_stmp) if time_stmp is not None else None
+        if tc_id not in self.data:
+            self.data[tc_id] = _new_testcase(tc_id, testname, test_result, tool_name, platform)
+        _add_step(self.data[tc_id], step_id, step_description, step_result)
+
+    def result(self):
+        return [_finish_testcase(tc, self.timestamp) for tc in self.data.values()]
+
+
+def assemble_coverage(rows, timestamp=None):
+    """
+    Single pass over COVERAGE_DATA_COLUMNS rows -> testcases.
+    """
+    assembler = CoverageAssembler(timestamp)
+    for row in rows:
+        assembler.add(row)
+    return assembler.result()
+
+
+def iter_testcases(rows, timestamp):
+    """
+    Yields finished testcases from COVERAGE_DATA_COLUMNS rows ordered by testid,
+    holding one testcase in memory at a time.
+    """
+    tc = None
+    for (row_id, tc_id, testname, test_result, tool_name, platform, step_id, step_description,
+         step_result, *_) in rows:
+        if tc is None or tc["id"] != tc_id:
+            if tc is not None:
+                yield _finish_testcase(tc, timestamp)
+            tc = _new_testcase(tc_id, testname, test_result, tool_name, platform)
+        _add_step(tc, step_id, step_description, step_result)
+    if tc is not None:
+        yield _finish_testcase(tc, timestamp)
+
+
+def testid_page(rows, cursor):
+    """
+    Distinct testids of rows in keyset order, after cursor when given.
+    """
+    testids = rows.order_by("testid").values_list("testid", flat=True).distinct()
+    if cursor is not None:
+        testids = testids.filter(testid__gt=decode_cursor(cursor))
+    return testids
+
+
+def page_rows(rows, page_ids):
+    return (
+        coverage_columns(rows.filter(testid__in=page_ids))
+        .order_by("testid", "id").values_list(*COVERAGE_DATA_COLUMNS)
+    )
+
+
+def coverage_stream(rows, timestamp, events):
+    """
+    The CoverageData payload as lazily evaluated parts for StreamingJSONResponse.
+    Testcases come out in testid order here; events are one per event id
+    and built up front.
+    """
+    testcase_rows = (
+        coverage_columns(rows).order_by("testid", "id")
+        .values_list(*COVERAGE_DATA_COLUMNS)
+        .iterator(chunk_size=COVERAGE_DATA_CHUNK_SIZE)
+    )
+    return {
+        "events": events,
+        "testcases": iter_testcases(testcase_rows, timestamp),
+    }
 
 
 # 🔹 Return coverage data for selected tool, project, and stepping
 class CoverageData(APIView):
+    """
+    ?page_size= / ?cursor= pages testcases by testid (keyset), ?stream=1 writes
+    the whole response incrementally. Without either the full payload is built.
+    ?since= / ?until= keep the rows recorded in that time range.
+
+    Events are listed once per event id with the rows (count) and testcases
+    naming it and its Coverage threshold; a page lists the events of its
+    testcases.
+    """
+
+    @data_etag("coverage", tools=TESTCASE_EVENTS, cache=True)
     def get(self, request):
         tool = request.GET.get("tool")
         project = request.GET.get("project")
         stepping = request.GET.get("stepping")
         if not all([tool, project, stepping]) or tool not in dynamic_models:
             return Response({"events": [], "testcases": []})
+        try:
+            since, until = time_range(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
 
-        model = dynamic_models[tool]
-        rows = model.objects.filter(project_name=project, stepping=stepping)
+        info = dynamic_models.info(tool)
+        rows = in_time_range(info.model.objects.filter(project_name=project, stepping=stepping), since, until)
+        events = partial(coverage_events, info, project, stepping, since, until)
+        timed_out = testcase_events_timed_out(tool)
 
+        if wants_stream(request):
+            return flag_timed_out(self.stream(rows, events()), timed_out)
+        page_size = keyset_page_size(request)
+        if page_size:
+            return flag_timed_out(self.page(request, rows, page_size, events), timed_out)
+
+        # Only the columns used, streamed in id order with a server-side cursor
         # 🔹 Group by testid for testcases
-        data = {}
-        for row in rows:
-            tc_id = row.testid
-            if tc_id not in data:
-                data[tc_id] = {
-                    "id": tc_id,
-                    "name": row.testname,
-                    "status": row.test_result,
-                    "Tool": row.tool_name,
-                    "platform": row.platform,
-                    "failedSteps": 0,
-                    "overallResult": row.test_result,
-                    "steps": [],
-                    "platforms": [],
-                }
-            # Add step info
-            data[tc_id]["steps"].append({
-                "id": row.step_id,
-                "description": row.step_description,
-                "status": row.step_result.lower(),
-            })
-
-        # 🔹 Add latest result summary and platforms
-        for tc in data.values():
-            first_row = rows.first()
-            failed_count = sum(1 for s in tc["steps"] if s["status"] == "fail")
-            tc["platforms"] = [{
-                "platform": tc["platform"],
-                "status": tc["status"],
-                "steps": tc["steps"],
-                "failedSteps": failed_count,
-                "overallResult": tc["overallResult"],
-                "timestamp": str(first_row.time_stmp) if first_row else None
-            }]
-            tc["latestResult"] = tc["platforms"][0]
-
-        # 🔹 Optional: include events if needed
-        events = []
-        for row in rows:
-            if row.events_covered:
-                for idx, name in enumerate(row.events_covered.split(",")):
-                    events.append({
-                        "id": f"{row.id}-event-{idx}",
-                        "name": name.strip(),
-                        "count": 1,
-                        "threshold": 3,
-                        "description": row.test_purpose or row.event_description or ""
-                    })
-
-        return Response({"events": events, "testcases": list(data.values())})
+        testcases = assemble_coverage(
+            coverage_columns(rows).order_by("id")
+            .values_list(*COVERAGE_DATA_COLUMNS)
+            .iterator(chunk_size=COVERAGE_DATA_CHUNK_SIZE)
+        )
+        return flag_timed_out(Response({"events": events(), "testcases": testcases}), timed_out)
+
+    @staticmethod
+    def first_timestamp(rows):
+        timestamp = coverage_columns(rows).order_by("id").values_list("time_stmp", flat=True).first()
+        return str(timestamp) if timestamp is not None else None
+
+    def page(self, request, rows, page_size, events):
+        page_ids = list(testid_page(rows, request.GET.get("cursor"))[:page_size + 1])
+        has_more = len(page_ids) > page_size
+        page_ids = page_ids[:page_size]
+
+        testcases = assemble_coverage(
+            page_rows(rows, page_ids).iterator(chunk_size=COVERAGE_DATA_CHUNK_SIZE),
+            timestamp=self.first_timestamp(rows),
+        )
+        return Response({
+            "events": events(testids=page_ids),
+            "testcases": testcases,
+            "next": encode_cursor(page_ids[-1]) if has_more else None,
+        })
+
+    def stream(self, rows, events):
+        return StreamingJSONResponse(coverage_stream(rows, self.first_timestamp(rows), events))
+
+
+# 🔹 Load NDJSON (default) or CSV (Content-Type: text/csv) telemetry into a tool table
+class TelemetryIngest(APIView):
+    def post(self, request):
+        tool = request.query_params.get("tool")
+        if not tool or tool not in dynamic_models:
+            return Response({"error": "Unknown tool"}, status=400)
+        try:
+            batch_size = int(request.query_params.get("batch_size", TELEMETRY_BATCH_SIZE))
+        except ValueError:
+            return Response({"error": "batch_size must be an integer"}, status=400)
+        if request.stream is None:
+            return Response({"error": "Empty body"}, status=400)
+
+        fmt = "csv" if request.content_type.split(";")[0].strip() == "text/csv" else "ndjson"
+        lines = iter(request.stream.readline, b"")
+
+        # One acknowledgement line per committed batch, then a summary line.
+        # The body is read as batches are written, never buffered whole.
+        acks = ingest_stream(dynamic_models[tool], lines, fmt=fmt, batch_size=batch_size)
+        return StreamingHttpResponse(
+            (json.dumps(ack) + "\n" for ack in acks),
+            content_type="application/x-ndjson",
+        )
+
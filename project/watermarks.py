@@ -0,0 +1,130 @@
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import TelemetryWatermark
+
+
+def _committed_sql(tool, scan):
+    """
+    SELECT of the runs of consecutive ids (low, high) of the tool rows
+    matching scan, each next to the statement's snapshot: its xmax and the
+    oldest other transaction still open (NULL when there is none). One
+    statement, so both describe the same moment.
+    """
+    qn = connection.ops.quote_name
+    if connection.vendor == "postgresql":
+        snapshot = """
+            SELECT pg_snapshot_xmax(s)::text::bigint AS xmax,
+                   (SELECT MIN(x::text::bigint) FROM pg_snapshot_xip(s) AS x) AS oldest
+            FROM pg_current_snapshot() AS s
+        """
+    else:
+        snapshot = "SELECT NULL AS xmax, NULL AS oldest"
+    return f"""
+        SELECT snapshot.xmax, snapshot.oldest, runs.low, runs.high
+        FROM ({snapshot}) AS snapshot
+        LEFT JOIN (
+            SELECT MIN(id) AS low, MAX(id) AS high
+            FROM (SELECT id, id - ROW_NUMBER() OVER (ORDER BY id) AS run
+                  FROM {qn(tool.model._meta.db_table)} WHERE {scan}) AS ids
+            GROUP BY run
+        ) AS runs ON TRUE
+        ORDER BY runs.low
+    """
+
+
+def ids_sql(ranges):
+    """
+    WHERE fragment matching the ids of the given inclusive (low, high) ranges.
+    """
+    return "(" + " OR ".join(f"id BETWEEN {int(low)} AND {int(high)}" for low, high in ranges) + ")"
+
+
+def _missing(low, high, runs):
+    """
+    The parts of the id range low..high that none of runs cover.
+    """
+    missing = []
+    for run_low, run_high in runs:
+        if run_high < low or run_low > high:
+            continue
+        if run_low > low:
+            missing.append((low, run_low - 1))
+        low = run_high + 1
+    if low <= high:
+        missing.append((low, high))
+    return missing
+
+
+def fold(consumer, tool, fold_sql, wait):
+    """
+    Runs fold_sql(tool, ids) over the committed tool rows the consumer has
+    not folded yet: those above its watermark and those of its pending
+    ranges. ids is a WHERE fragment, the query gets {"tool": tool.name} as
+    parameters. Returns the number of ids the watermark advanced.
+
+    Ids missing under the new watermark are kept pending, so rows committed
+    after rows with higher ids are folded when they show up. A range is let
+    go once every transaction open when it was recorded has ended and
+    TELEMETRY_WATERMARK_GRACE_S has passed: a writer can take an id with
+    nextval() before it has a transaction id the snapshot would show.
+    """
+    TelemetryWatermark.objects.get_or_create(consumer=consumer, tool=tool.name)
+
+    with transaction.atomic():
+        # Row lock serialises refreshers per tool; readers that don't want to
+        # wait skip the fold and read the derived table as it is
+        watermark = (
+            TelemetryWatermark.objects
+            .select_for_update(skip_locked=not wait)
+            .filter(consumer=consumer, tool=tool.name)
+            .first()
+        )
+        if watermark is None:
+            return 0
+
+        scan = ids_sql([(low, high) for low, high, *_ in watermark.pending])
+        scan = f"id > {int(watermark.last_id)}" + (f" OR {scan}" if watermark.pending else "")
+        with connection.cursor() as cursor:
+            cursor.execute(_committed_sql(tool, scan))
+            rows = cursor.fetchall()
+        xmax, oldest = rows[0][:2]
+        runs = [(low, high) for _, _, low, high in rows if low is not None]
+        if not runs and not watermark.pending:
+            return 0
+
+        now = time.time()
+        grace = getattr(settings, "TELEMETRY_WATERMARK_GRACE_S", 60)
+        pending = []
+        for low, high, since, *recorded in watermark.pending:
+            # Ranges recorded before the grace period have no time, it is over for them
+            if not (oldest is not None and since is not None and oldest < since):
+                # Nothing open is known to hold these ids any more (see data_version)
+                since = None
+                if now - (recorded[0] if recorded else 0) >= grace:
+                    continue
+            pending += [[low, high, since] + recorded for low, high in _missing(low, high, runs)]
+        high = max([watermark.last_id] + [run_high for _, run_high in runs])
+        since = xmax if oldest is not None else None
+        pending += [[low, high, since, now] for low, high in _missing(watermark.last_id + 1, high, runs)]
+
+        if runs:
+            with connection.cursor() as cursor:
+                cursor.execute(fold_sql(tool, ids_sql(runs)), {"tool": tool.name})
+
+        folded = high - watermark.last_id
+        watermark.last_id = high
+        watermark.pending = pending
+        watermark.save(update_fields=["last_id", "pending", "updated_at"])
+        return folded
+
+
+def reset(consumer, tool):
+    """
+    Starts the consumer over from id 0, for a rebuild.
+    """
+    TelemetryWatermark.objects.update_or_create(
+        consumer=consumer, tool=tool.name, defaults={"last_id": 0, "pending": []}
+    )